@@ -63,6 +63,7 @@ class LibFUSE(ctypes.CDLL):
         self.fuse_session_add_chan.argtypes = (
             ctypes.c_void_p, ctypes.c_void_p)
         self.fuse_session_loop.argtypes = (ctypes.c_void_p,)
+        self.fuse_session_loop_mt.argtypes = (ctypes.c_void_p,)
         self.fuse_remove_signal_handlers.argtypes = (ctypes.c_void_p,)
         self.fuse_session_remove_chan.argtypes = (ctypes.c_void_p,)
         self.fuse_session_destroy.argtypes = (ctypes.c_void_p,)
@@ -82,11 +83,23 @@ class LibFUSE(ctypes.CDLL):
         self.fuse_reply_write.argtypes = (fuse_req_t, ctypes.c_size_t)
         self.fuse_reply_readlink.argtypes = (
             fuse_req_t, ctypes.c_char_p)
+        self.fuse_reply_xattr.argtypes = (fuse_req_t, ctypes.c_size_t)
 
         self.fuse_add_direntry.argtypes = (
             ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t,
             ctypes.c_char_p, c_stat_p, c_off_t)
 
+        self.fuse_lowlevel_notify_inval_inode.argtypes = (
+            ctypes.c_void_p, fuse_ino_t, c_off_t, c_off_t)
+        self.fuse_lowlevel_notify_inval_entry.argtypes = (
+            ctypes.c_void_p, fuse_ino_t, ctypes.c_char_p, ctypes.c_size_t)
+
+        # only in libfuse 3, see fuse_lowlevel_ops
+        if hasattr(self, 'fuse_add_direntry_plus'):
+            self.fuse_add_direntry_plus.argtypes = (
+                ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t,
+                ctypes.c_char_p, ctypes.c_void_p, c_off_t)
+
 class fuse_args(ctypes.Structure):
     _fields_ = [
         ('argc', ctypes.c_int),
@@ -257,6 +270,42 @@ class fuse_file_info(ctypes.Structure):
         ('fh', ctypes.c_uint64),
         ('lock_owner', ctypes.c_uint64)]
 
+# struct fuse_conn_info of libfuse 2.9, given to init to negotiate with the
+# kernel. capable holds the FUSE_CAP_* flags the kernel supports, and init
+# sets those it wants in want.
+class fuse_conn_info(ctypes.Structure):
+    _fields_ = [
+        ('proto_major', ctypes.c_uint),
+        ('proto_minor', ctypes.c_uint),
+        ('async_read', ctypes.c_uint),
+        ('max_write', ctypes.c_uint),
+        ('max_readahead', ctypes.c_uint),
+        ('capable', ctypes.c_uint),
+        ('want', ctypes.c_uint),
+        ('max_background', ctypes.c_uint),
+        ('congestion_threshold', ctypes.c_uint),
+        ('reserved', ctypes.c_uint * 23),
+    ]
+
+FUSE_CAP_ASYNC_READ = 1 << 0
+FUSE_CAP_POSIX_LOCKS = 1 << 1
+FUSE_CAP_ATOMIC_O_TRUNC = 1 << 3
+FUSE_CAP_EXPORT_SUPPORT = 1 << 4
+FUSE_CAP_BIG_WRITES = 1 << 5
+FUSE_CAP_DONT_MASK = 1 << 6
+FUSE_CAP_SPLICE_WRITE = 1 << 7
+FUSE_CAP_SPLICE_MOVE = 1 << 8
+FUSE_CAP_SPLICE_READ = 1 << 9
+FUSE_CAP_FLOCK_LOCKS = 1 << 10
+FUSE_CAP_IOCTL_DIR = 1 << 11
+FUSE_CAP_AUTO_INVAL_DATA = 1 << 12
+# libfuse 3 flags, which libfuse 2.9 never sets in capable
+FUSE_CAP_READDIRPLUS = 1 << 13
+FUSE_CAP_READDIRPLUS_AUTO = 1 << 14
+FUSE_CAP_ASYNC_DIO = 1 << 15
+FUSE_CAP_WRITEBACK_CACHE = 1 << 16
+FUSE_CAP_NO_OPEN_SUPPORT = 1 << 17
+
 class fuse_ctx(ctypes.Structure):
     _fields_ = [
         ('uid', c_uid_t),
@@ -288,8 +337,8 @@ class fuse_entry_param(ctypes.Structure):
         ('entry_timeout', ctypes.c_double),
     ]
 
-class fuse_lowlevel_ops(ctypes.Structure):
-    _fields_ = [
+# the operations of struct fuse_lowlevel_ops of libfuse 2.9
+_fuse_lowlevel_ops_fields = [
         ('init', ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.c_void_p)),
         ('destroy', ctypes.CFUNCTYPE(None, ctypes.c_void_p)),
 
@@ -415,11 +464,21 @@ class fuse_lowlevel_ops(ctypes.Structure):
         ('fallocate', ctypes.CFUNCTYPE(
             None, fuse_req_t, fuse_ino_t, ctypes.c_int, c_off_t, c_off_t, fuse_file_info_p)),
 
-        # readdirplus only exists in libfuse3
-        #('readdirplus', ctypes.CFUNCTYPE(
-            #None, fuse_req_t, fuse_ino_t, ctypes.c_size_t, c_off_t, fuse_file_info_p)),
     ]
 
+# readdirplus follows them in libfuse 3, which also adds fuse_add_direntry_plus
+# and FUSE_CAP_READDIRPLUS. This binding mounts with the libfuse 2 API, which
+# has none of them, so the struct only has the slot when the library does:
+# libfuse 2 would warn that it is too old for a longer struct, and never
+# offers readdirplus to the kernel (see FuseApi.init).
+if hasattr(_libfuse, 'fuse_add_direntry_plus'):
+    _fuse_lowlevel_ops_fields.append(
+        ('readdirplus', ctypes.CFUNCTYPE(
+            None, fuse_req_t, fuse_ino_t, ctypes.c_size_t, c_off_t, fuse_file_info_p)))
+
+class fuse_lowlevel_ops(ctypes.Structure):
+    _fields_ = _fuse_lowlevel_ops_fields
+
 
 def struct_to_dict(p):
     try:
@@ -467,7 +526,13 @@ def setattr_mask_to_list(mask):
 class FUSELL(object):
     use_ns = False
 
-    def __init__(self, mountpoint, encoding='utf-8'):
+    def __init__(self, mountpoint, encoding='utf-8', multithreaded=False):
+        """Mounts the filesystem and serves requests until it is unmounted
+
+        With multithreaded, requests are served by libfuse's multithreaded
+        loop, so operations are called from several threads at once and
+        wrap_operation must make them safe to run together.
+        """
         if not self.use_ns:
             warnings.warn(
                 'Time as floating point seconds for utimens is deprecated!\n'
@@ -482,9 +547,14 @@ class FUSELL(object):
         fuse_ops = fuse_lowlevel_ops()
 
         for name, prototype in fuse_lowlevel_ops._fields_:
+            # operations without a method, such as readdirplus unless a
+            # subclass implements it (and the library has it), are left to
+            # libfuse
+            if not hasattr(self, name):
+                continue
             method = getattr(self, 'fuse_' + name, None) or getattr(self, name, None)
             if method:
-                setattr(fuse_ops, name, prototype(method))
+                setattr(fuse_ops, name, prototype(self.wrap_operation(name, method)))
 
         args = ['fuse']
         argv = fuse_args(len(args), (ctypes.c_char_p * len(args))(*[arg.encode(self.encoding) for arg in args]), 0)
@@ -493,6 +563,7 @@ class FUSELL(object):
 
         chan = self.libfuse.fuse_mount(mountpoint.encode(encoding), argv)
         assert chan
+        self.chan = chan
 
         session = self.libfuse.fuse_lowlevel_new(
             argv, ctypes.byref(fuse_ops), ctypes.sizeof(fuse_ops), None)
@@ -508,7 +579,10 @@ class FUSELL(object):
 
         self.libfuse.fuse_session_add_chan(session, chan)
 
-        err = self.libfuse.fuse_session_loop(session)
+        if multithreaded:
+            err = self.libfuse.fuse_session_loop_mt(session)
+        else:
+            err = self.libfuse.fuse_session_loop(session)
         assert err == 0
 
         err = self.libfuse.fuse_remove_signal_handlers(session)
@@ -523,6 +597,23 @@ class FUSELL(object):
         self.libfuse.fuse_session_destroy(session)
         self.libfuse.fuse_unmount(mountpoint.encode(encoding), chan)
 
+    def notify_inval_inode(self, ino, off=0, length=0):
+        """Makes the kernel drop its cached attributes of an inode, and its
+        cached pages from off for length bytes (to the end if 0)
+
+        Returns 0 or a negative errno. Must not be called from an operation
+        in the thread handling it, as the kernel may wait for the operation.
+        """
+        return self.libfuse.fuse_lowlevel_notify_inval_inode(self.chan, ino, off, length)
+
+    def notify_inval_entry(self, parent, name):
+        """Makes the kernel drop its cached entry of a name in a directory
+
+        Returns 0 or a negative errno, see notify_inval_inode.
+        """
+        name = name.encode(self.encoding)
+        return self.libfuse.fuse_lowlevel_notify_inval_entry(self.chan, parent, name, len(name))
+
     def reply_err(self, req, err):
         return self.libfuse.fuse_reply_err(req, err)
 
@@ -556,6 +647,9 @@ class FUSELL(object):
     def reply_buf(self, req, buf):
         return self.libfuse.fuse_reply_buf(req, buf, len(buf))
 
+    def reply_xattr(self, req, count):
+        return self.libfuse.fuse_reply_xattr(req, count)
+
     def reply_readdir(self, req, size, off, entries):
         bufsize = 0
         sized_entries = []
@@ -582,10 +676,59 @@ class FUSELL(object):
         else:
             return self.libfuse.fuse_reply_buf(req, None, 0)
 
+    def reply_readdir_entries(self, req, size, entries):
+        """Replies with as many of entries as fit in size bytes
+
+        entries is an iterable of (name, attr, off), where off is the offset
+        readdir will be called with to continue after that entry. Unlike
+        reply_readdir, the entries are those from the requested offset on,
+        and no more of them are taken than fit in the reply.
+        """
+        buf = ctypes.create_string_buffer(size)
+        used = 0
+        for name, attr, off in entries:
+            name = name.encode(self.encoding)
+            entbuf = ctypes.cast(
+                ctypes.addressof(buf) + used, ctypes.c_char_p)
+            st = c_stat(**attr)
+            entsize = self.libfuse.fuse_add_direntry(
+                req, entbuf, size - used, name, ctypes.byref(st), off)
+            if entsize > size - used:
+                break
+            used += entsize
+
+        return self.libfuse.fuse_reply_buf(req, buf, used)
+
+    def reply_readdirplus_entries(self, req, size, entries):
+        """Replies with as many of entries as fit in size bytes
+
+        Like reply_readdir_entries, but entries is an iterable of (name,
+        entry, off) where entry is a dict as passed to reply_entry. Every
+        entry replied with other than "." and ".." counts as a lookup of its
+        inode.
+        """
+        buf = ctypes.create_string_buffer(size)
+        used = 0
+        for name, entry, off in entries:
+            name = name.encode(self.encoding)
+            entbuf = ctypes.cast(
+                ctypes.addressof(buf) + used, ctypes.c_char_p)
+            e = fuse_entry_param(**dict(entry, attr=c_stat(**entry['attr'])))
+            entsize = self.libfuse.fuse_add_direntry_plus(
+                req, entbuf, size - used, name, ctypes.byref(e), off)
+            if entsize > size - used:
+                break
+            used += entsize
+
+        return self.libfuse.fuse_reply_buf(req, buf, used)
+
 
     # If you override the following methods you should reply directly
     # with the self.libfuse.fuse_reply_* methods.
 
+    def fuse_init(self, userdata, conn):
+        self.init(userdata, ctypes.cast(conn, ctypes.POINTER(fuse_conn_info)).contents)
+
     def fuse_lookup(self, req, parent, name):
         self.lookup(req, parent, name.decode(self.encoding))
 
@@ -623,7 +766,7 @@ class FUSELL(object):
         self.open(req, ino, struct_to_dict(fi))
 
     def fuse_read(self, req, ino, size, off, fi):
-        self.read(req, ino, size, off, fi)
+        self.read(req, ino, size, off, struct_to_dict(fi))
 
     def fuse_write(self, req, ino, buf, size, off, fi):
         buf_str = ctypes.string_at(buf, size)
@@ -637,7 +780,7 @@ class FUSELL(object):
         self.release(req, ino, struct_to_dict(fi))
 
     def fuse_fsync(self, req, ino, datasync, fi):
-        self.fsyncdir(req, ino, datasync, struct_to_dict(fi))
+        self.fsync(req, ino, datasync, struct_to_dict(fi))
 
     def fuse_opendir(self, req, ino, fi):
         self.opendir(req, ino, struct_to_dict(fi))
@@ -645,6 +788,9 @@ class FUSELL(object):
     def fuse_readdir(self, req, ino, size, off, fi):
         self.readdir(req, ino, size, off, struct_to_dict(fi))
 
+    def fuse_readdirplus(self, req, ino, size, off, fi):
+        self.readdirplus(req, ino, size, off, struct_to_dict(fi))
+
     def fuse_releasedir(self, req, ino, fi):
         self.releasedir(req, ino, struct_to_dict(fi))
 
@@ -665,6 +811,14 @@ class FUSELL(object):
 
     # Utility methods
 
+    def wrap_operation(self, name, method):
+        """Returns the callable registered with libfuse for an operation
+
+        Override to run code around every operation (for example to take a
+        lock). The default registers method unchanged.
+        """
+        return method
+
     def req_ctx(self, req):
         ctx = self.libfuse.fuse_req_ctx(req)
         return struct_to_dict(ctx)
@@ -676,6 +830,9 @@ class FUSELL(object):
     def init(self, userdata, conn):
         """Initialize filesystem
 
+        conn is the fuse_conn_info of the connection, whose fields may be
+        changed to negotiate with the kernel.
+
         There's no reply to this method
         """
         pass
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+'''
+Times FuseApi.write_file_blocks, followed by writing out the file's indirect
+blocks, for writes which land in the lvl1, lvl2 and lvl3 indirect regions of a
+file. An in-memory backend is used so that only the CPU cost of updating the
+indirect address blocks is measured.
+
+    python3 -m microbenchmarks.indirect_writes [--blocks 256] [--repeat 20]
+
+fusell is still imported by FuseApi, so libfuse must be installed, but
+nothing is mounted.
+'''
+import argparse
+
+from stat import S_IFREG
+from timeit import timeit
+
+from s3logfs.fuse_api import FuseApi
+from s3logfs.fs import Log, INode, BlockAddress, IndirectBlockCache
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._segments = {}
+
+    def get_segment(self, segment_number):
+        return self._segments[segment_number]
+
+    def put_segment(self, segment_number, segment_bytes):
+        self._segments[segment_number] = segment_bytes
+
+    def flush(self):
+        pass
+
+
+class IndirectWriter(FuseApi):
+    '''
+    A FuseApi with only a log, an indirect block cache and the hole detection
+    state of write_data_blocks, which is all write_file_blocks needs.
+    '''
+
+    def __init__(self, block_size, blocks_per_segment):
+        self._log = Log(1, MemoryBackend(), block_size, blocks_per_segment)
+        self._indirect_blocks = IndirectBlockCache(self._log, 1024)
+        self._zero_block = bytes(block_size)
+        self._hole_write_count = 0
+
+    def write_and_flush(self, inode, buf, offset):
+        self.write_file_blocks(inode, buf, offset)
+        self._indirect_blocks.flush(inode)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--blocks', type=int, default=256,
+                        help='The number of blocks in each write. (Default=256)')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='The number of writes to time at each level. (Default=20)')
+    parser.add_argument('--blocksize', type=int, default=4096,
+                        help='The block size of the filesystem. (Default=4096)')
+    args = parser.parse_args()
+
+    writer = IndirectWriter(args.blocksize, 512)
+    inode = INode()
+    inode.mode = S_IFREG | 0o644
+    address_size = BlockAddress.get_address_size()
+    # all zero blocks would be recorded as holes without being written
+    buf = b'\x01' * (args.blocks * args.blocksize)
+
+    for level in (1, 2, 3):
+        # start half a write before the end of the first address block of the
+        # level, so that every write crosses an address block boundary
+        first_block = inode.get_max_indirect_offset(args.blocksize, address_size, level - 1)
+        start_block = first_block + args.blocksize // address_size - args.blocks // 2
+        offset = start_block * args.blocksize
+
+        written = writer._indirect_blocks.stats()['written_blocks']
+        seconds = timeit(lambda: writer.write_and_flush(inode, buf, offset),
+                         number=args.repeat)
+        written = writer._indirect_blocks.stats()['written_blocks'] - written
+
+        print('lvl{}: {:.2f} ms and {:.1f} indirect blocks written per {} block write'.format(
+            level, 1000 * seconds / args.repeat, written / args.repeat, args.blocks))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,10 @@ class AsyncWriter(BackendWrapper):
     in-memory cache of segments that are in the process of being written.
     Otherwise a segment could be requested from the backend before it has been
     written. Once each write completes the segment is removed from this cache.
+
+    A segment may be put more than once (see Log.sync), so a put waits for any
+    earlier write of the same segment to complete. This keeps an older version
+    of a segment from overwriting a newer one.
     '''
     def __init__(self, backend, max_segments_in_cache, max_workers):
         super().__init__(backend)
@@ -34,9 +38,17 @@ class AsyncWriter(BackendWrapper):
 
         return segment_bytes
 
+    def is_cached(self, segment_number):
+        with self._segments_being_written_cv:
+            if segment_number in self._segments_being_written:
+                return True
+        return self._backend.is_cached(segment_number)
+
     def put_segment(self, segment_number, segment_bytes):
         with self._segments_being_written_cv:
-            self._segments_being_written_cv.wait_for(self._queue_not_full)
+            self._segments_being_written_cv.wait_for(
+                lambda: self._queue_not_full() and
+                segment_number not in self._segments_being_written)
             self._segments_being_written[segment_number] = segment_bytes
 
         self._executor.submit(self._put_segment_async,
@@ -55,7 +67,7 @@ class AsyncWriter(BackendWrapper):
 
         with self._segments_being_written_cv:
             del self._segments_being_written[segment_number]
-            self._segments_being_written_cv.notify()
+            self._segments_being_written_cv.notify_all()
 
     def _put_checkpoint_async(self, checkpoint_bytes):
         self._backend.put_checkpoint(checkpoint_bytes)
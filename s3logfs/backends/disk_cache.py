@@ -1,6 +1,7 @@
 from collections import OrderedDict
 from pathlib import Path
 from shutil import rmtree
+from threading import Lock
 from .backend_wrapper import BackendWrapper
 
 class DiskCache(BackendWrapper):
@@ -9,6 +10,10 @@ class DiskCache(BackendWrapper):
 
     Also implements the context manager API so that it can be instantiated in a
     with block to ensure cleanup.
+
+    Segments may be fetched by several threads at once (see Log.read_inodes),
+    so the cache is guarded by a lock, which is not held while a segment is
+    fetched from the backend.
     '''
 
     DIRECTORY_NAME = 's3logfs_cache'
@@ -19,6 +24,7 @@ class DiskCache(BackendWrapper):
         self._cache_directory = Path(parent_directory) / self.DIRECTORY_NAME
         self._cache_directory.mkdir()
         self._cached_segment_numbers = OrderedDict() # Keys are segment numbers, values don't matter.
+        self._lock = Lock()
 
     def __enter__(self):
         return self
@@ -27,16 +33,26 @@ class DiskCache(BackendWrapper):
         rmtree(str(self._cache_directory))
 
     def get_segment(self, segment_number):
-        if segment_number in self._cached_segment_numbers:
-            segment_bytes = self._cache_read(segment_number)
-        else:
-            segment_bytes = self._backend.get_segment(segment_number)
+        with self._lock:
+            if segment_number in self._cached_segment_numbers:
+                return self._cache_read(segment_number)
+
+        segment_bytes = self._backend.get_segment(segment_number)
+
+        with self._lock:
             self._cache_insert(segment_number, segment_bytes)
 
         return segment_bytes
 
+    def is_cached(self, segment_number):
+        with self._lock:
+            if segment_number in self._cached_segment_numbers:
+                return True
+        return self._backend.is_cached(segment_number)
+
     def put_segment(self, segment_number, segment_bytes):
-        self._cache_insert(segment_number, segment_bytes)
+        with self._lock:
+            self._cache_insert(segment_number, segment_bytes)
         self._backend.put_segment(segment_number, segment_bytes)
 
     # Private methods
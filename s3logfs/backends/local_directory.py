@@ -22,6 +22,9 @@ class LocalDirectory:
     def get_segment(self, segment_number):
         return self._get_object(self._segment_key(segment_number))
 
+    def is_cached(self, segment_number):
+        return False
+
     def flush(self):
         pass
 
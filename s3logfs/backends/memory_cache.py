@@ -1,20 +1,43 @@
+from threading import Lock
 from cachetools import LRUCache
 from .backend_wrapper import BackendWrapper
 
 class MemoryCache(BackendWrapper):
+    '''
+    Implements a LRU cache, with data stored in memory.
+
+    Segments may be fetched by several threads at once (see Log.read_inodes),
+    so the cache is guarded by a lock. The lock is not held while a segment
+    is fetched from the backend, so that fetches run in parallel.
+    '''
+
     def __init__(self, backend, max_segments_in_cache):
         super().__init__(backend)
         self._segment_cache = LRUCache(maxsize=max_segments_in_cache)
+        self._lock = Lock()
 
     def get_segment(self, segment_number):
-        if segment_number in self._segment_cache:
-            segment_bytes = self._segment_cache[segment_number]
-        else:
+        with self._lock:
+            segment_bytes = self._segment_cache.get(segment_number)
+
+        if segment_bytes is None:
             segment_bytes = self._backend.get_segment(segment_number)
-            self._segment_cache[segment_number] = segment_bytes
+            with self._lock:
+                self._segment_cache[segment_number] = segment_bytes
 
         return segment_bytes
 
+    def is_cached(self, segment_number):
+        '''
+        Returns whether get_segment() would return the segment without
+        fetching it from the backend at the bottom of the chain.
+        '''
+        with self._lock:
+            if segment_number in self._segment_cache:
+                return True
+        return self._backend.is_cached(segment_number)
+
     def put_segment(self, segment_number, segment_bytes):
-        self._segment_cache[segment_number] = segment_bytes
+        with self._lock:
+            self._segment_cache[segment_number] = segment_bytes
         self._backend.put_segment(segment_number, segment_bytes)
@@ -41,6 +41,12 @@ class S3Bucket:
     def get_segment(self, segment_number):
         return self._get_object(self._segment_key(segment_number))
 
+    def is_cached(self, segment_number):
+        '''
+        Every segment is fetched from S3, see the caches wrapping this class.
+        '''
+        return False
+
     def flush(self):
         '''
         This class writes to S3 synchronously, so there is nothing to flush.
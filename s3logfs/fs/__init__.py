@@ -4,3 +4,17 @@ from .checkpoint import CheckpointRegion
 from .inode import INode
 from .segment import ReadOnlySegment, ReadWriteSegment
 from .log import Log
+from .group_commit import GroupCommit
+from .segment_sealer import SegmentSealer
+from .write_buffer import WriteBuffer
+from .inode_cache import INodeCache
+from .inodeaddress import INodeAddress
+from .inodeblock import INodeBlock
+from .addressarray import AddressArray
+from .indirect_cache import IndirectBlockCache
+from .extent_map import ExtentMap
+from .directory_block import DirectoryBlock
+from .dentry_cache import DentryCache
+from .shared_lock import SharedLock
+from .cache_miss import CacheMiss
+from .tracer import Tracer
@@ -0,0 +1,71 @@
+import sys
+from array import array
+from .blockaddress import BlockAddress
+
+
+class AddressArray:
+    '''
+    A fixed length sequence of BlockAddresses, stored as packed 64 bit
+    integers (see BlockAddress.to_packed) in an array('Q') instead of one
+    Python object per address.
+
+    Indexing returns a new BlockAddress and assigning takes one, so it can be
+    used like a list of addresses. Code which handles many addresses at once
+    should use the packed values, get_bytes() and set_bytes() instead.
+    '''
+
+    def __init__(self, length):
+        self.packed = array('Q', bytes(length * self.packed_size()))
+
+    def __len__(self):
+        return len(self.packed)
+
+    def __getitem__(self, index):
+        return BlockAddress.from_packed(self.packed[index])
+
+    def __setitem__(self, index, address):
+        self.packed[index] = address.to_packed()
+
+    def __iter__(self):
+        return map(BlockAddress.from_packed, self.packed)
+
+    def __eq__(self, other):
+        if isinstance(other, AddressArray):
+            return self.packed == other.packed
+        return NotImplemented
+
+    def used_length(self):
+        '''
+        Returns the length of the prefix which ends with the last address
+        that is not (0,0).
+        '''
+        length = len(self.packed)
+        while length > 0 and self.packed[length - 1] == 0:
+            length -= 1
+        return length
+
+    def get_bytes(self, start, count):
+        '''
+        Returns count addresses from start encoded as bytes.
+        '''
+        return BlockAddress.packed_array_to_bytes(self.packed[start:start + count])
+
+    def set_bytes(self, start, data):
+        '''
+        Decodes the addresses encoded in data into the array from start.
+        '''
+        packed = BlockAddress.packed_array_from_bytes(data)
+
+        # assigning past the end of a slice would grow the array
+        if start + len(packed) > len(self.packed):
+            raise IndexError('AddressArray assignment out of range')
+
+        self.packed[start:start + len(packed)] = packed
+
+    def memory_size(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.__dict__) + \
+            sys.getsizeof(self.packed)
+
+    @staticmethod
+    def packed_size():
+        return array('Q').itemsize
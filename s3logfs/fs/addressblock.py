@@ -3,29 +3,39 @@ from array import array
 
 class AddressBlock:
 
-    # init AddressBlock with byte data, address_size
+    # init AddressBlock with byte data, all of the addresses in the block are
+    # decoded at once into an array of packed addresses
     def __init__(self, address_block):
-        self.data = address_block
         self.address_size = BlockAddress.get_address_size()
+        self.addresses = BlockAddress.packed_array_from_bytes(address_block)
 
     def get_address(self, offset):
-        start = offset * self.address_size
-        end = start + self.address_size
-        addr_data = bytearray()
-        addr_data.extend(self.data[start:end])
-        address = BlockAddress(addr_data)
-        return address
+        return BlockAddress.from_packed(self.addresses[offset])
 
     def set_address(self, address, offset):
-        start = offset * self.address_size
-        end = start + self.address_size
-        self.data = self.data[:start] + address.to_bytes() + self.data[end:]
+        self.addresses[offset] = address.to_packed()
+
+    # returns a list of count addresses starting at offset
+    def get_addresses(self, offset, count):
+        return [BlockAddress.from_packed(packed)
+                for packed in self.addresses[offset:offset + count]]
+
+    # replaces the addresses starting at offset with the given addresses in a
+    # single slice assignment
+    def set_addresses(self, addresses, offset):
+        packed = array('Q', [address.to_packed() for address in addresses])
+
+        # assigning past the end of a slice would grow the block
+        if offset + len(packed) > len(self.addresses):
+            raise IndexError('AddressBlock assignment out of range')
+
+        self.addresses[offset:offset + len(packed)] = packed
 
     def get_max_offset(self):
-        return len(self.data) // self.address_size
+        return len(self.addresses)
 
     def count(self):
-        return len(self.data) // self.address_size
+        return len(self.addresses)
 
     def get_bytes(self):
-        return bytes(self.data)
+        return BlockAddress.packed_array_to_bytes(self.addresses)
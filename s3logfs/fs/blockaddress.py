@@ -1,9 +1,18 @@
 import struct
+import sys
+from array import array
 
 # combined these make a single address
 ADDR_SEGMENT_BYTES = 6
 ADDR_OFFSET_BYTES = 2
 
+# An address stored as bytes is a little endian segmentid followed by a little
+# endian offset, so read as a single little endian unsigned 64 bit integer it
+# is segmentid | offset << 48. This "packed" form lets whole blocks of
+# addresses be decoded into an array('Q') in one call.
+ADDR_OFFSET_SHIFT = ADDR_SEGMENT_BYTES * 8
+ADDR_SEGMENT_MASK = (1 << ADDR_OFFSET_SHIFT) - 1
+
 class BlockAddress:
     STRUCT_SIZE = 8
 
@@ -54,6 +63,33 @@ class BlockAddress:
         # last Y bytes is offset (placed in unsigned short)
         self.offset = struct.unpack("<H", data[ADDR_SEGMENT_BYTES:ADDR_SEGMENT_BYTES+ADDR_OFFSET_BYTES])[0]
 
+    # returns the address as a single integer (see ADDR_OFFSET_SHIFT)
+    def to_packed(self):
+        return self.segmentid | (self.offset << ADDR_OFFSET_SHIFT)
+
+    # returns a BlockAddress from an integer returned by to_packed()
+    @staticmethod
+    def from_packed(packed):
+        return BlockAddress(packed & ADDR_SEGMENT_MASK, packed >> ADDR_OFFSET_SHIFT)
+
+    # decodes a sequence of addresses stored as bytes into an array('Q') of
+    # packed addresses
+    @staticmethod
+    def packed_array_from_bytes(data):
+        packed = array('Q')
+        packed.frombytes(data)
+        if sys.byteorder == 'big':
+            packed.byteswap()
+        return packed
+
+    # encodes an array('Q') of packed addresses as bytes
+    @staticmethod
+    def packed_array_to_bytes(packed):
+        if sys.byteorder == 'big':
+            packed = array('Q', packed)
+            packed.byteswap()
+        return packed.tobytes()
+
     # returns the number of blocks for a address in the log
     def get_address_size():
         return ADDR_SEGMENT_BYTES+ADDR_OFFSET_BYTES
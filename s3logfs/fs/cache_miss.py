@@ -0,0 +1,9 @@
+class CacheMiss(Exception):
+    '''
+    Raised by Log when a read would fetch a segment from the backend while
+    the reading thread is limited to cached segments (see Log.cached_only).
+    '''
+
+    def __init__(self, segment_id):
+        super().__init__(segment_id)
+        self.segment_id = segment_id
@@ -4,8 +4,22 @@ from collections import defaultdict
 import pickle
 
 class CheckpointRegion:
+    '''
+    The root of the filesystem: its geometry, counters and the inode map,
+    which holds the address of every inode in the log.
 
-    def __init__(self, bucket="TEST", start_inode=0, block_size=4096, blocks_per_segment=512, checkpoint_time=0):
+    snapshot() returns a copy which shares the inode map, so that the copy
+    can be serialized while the filesystem carries on changing the original.
+    The inode map must only be changed with set_inode_address() and
+    remove_inode(), which copy it first if it is shared with a snapshot.
+    '''
+
+    # how the blocks of files are mapped to the log, chosen by mkfs
+    BLOCK_LAYOUT = 'blocks'     # direct and indirect block addresses
+    EXTENT_LAYOUT = 'extents'   # runs of blocks, see ExtentMap
+    LAYOUTS = (BLOCK_LAYOUT, EXTENT_LAYOUT)
+
+    def __init__(self, bucket="TEST", start_inode=0, block_size=4096, blocks_per_segment=512, checkpoint_time=0, layout=BLOCK_LAYOUT):
         self.block_size = block_size             # bytes
         self.segment_size = blocks_per_segment   # blocks (default 2MB)
         self.fs_size = 2**28                     # blocks (default 1TB space)
@@ -15,6 +29,39 @@ class CheckpointRegion:
         self.s3_bucket_name = bucket             # s3 bucket name
         self.inode_map = defaultdict()           # inodeid <> BlockAddress
         self._time = checkpoint_time             # seconds
+        self.layout = layout                     # file block layout
+        self._inode_map_shared = False           # inode_map is in a snapshot
+
+    # whether the inode map is shared is not part of the checkpoint
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop('_inode_map_shared', None)
+        return state
+
+    # checkpoints pickled before a field was added are given its default
+    def __setstate__(self, state):
+        state.setdefault('layout', self.BLOCK_LAYOUT)
+        state['_inode_map_shared'] = False
+        self.__dict__.update(state)
+
+    def snapshot(self):
+        '''
+        Returns a copy of the checkpoint region which later changes to this
+        one do not affect. The inode map is only copied by the next change.
+        '''
+        copy = CheckpointRegion.__new__(CheckpointRegion)
+        copy.__dict__.update(self.__dict__)
+        self._inode_map_shared = True
+        copy._inode_map_shared = True
+        return copy
+
+    def set_inode_address(self, inode_number, address):
+        self._own_inode_map()
+        self.inode_map[inode_number] = address
+
+    def remove_inode(self, inode_number):
+        self._own_inode_map()
+        self.inode_map.pop(inode_number, None)
 
     def from_bytes(serialized_checkpoint):
         return pickle.loads(serialized_checkpoint)
@@ -50,3 +97,9 @@ class CheckpointRegion:
             return True
         else:
             return False
+
+    # copies the inode map if it is shared with a snapshot
+    def _own_inode_map(self):
+        if self._inode_map_shared:
+            self.inode_map = self.inode_map.copy()
+            self._inode_map_shared = False
@@ -0,0 +1,82 @@
+from threading import Lock
+from cachetools import LRUCache
+
+
+class DentryCache:
+    '''
+    Caches the result of looking up a name in a directory, keyed by (parent
+    inode number, name), so that repeated lookups of the same path component
+    do not have to read the parent directory.
+
+    Names which do not exist are cached too, as negative entries holding
+    NEGATIVE, so that probing for missing files (for example include paths)
+    is as cheap as finding existing ones. The owner must put() or invalidate()
+    an entry whenever the name is added to or removed from its directory.
+
+    The cache holds at most max_entries entries, and the least recently used
+    are evicted first. Like INodeCache it is guarded by a lock of its own, as
+    lookups which share FuseApi's lock use it at the same time.
+    '''
+
+    # inode numbers start at 1, so 0 never names an inode
+    NEGATIVE = 0
+
+    def __init__(self, max_entries):
+        self._max_entries = max_entries
+        self._entries = LRUCache(maxsize=max_entries)
+        self._hit_count = 0
+        self._negative_hit_count = 0
+        self._miss_count = 0
+        self._eviction_count = 0
+        self._lock = Lock()
+
+    def get(self, parent, name):
+        '''
+        Returns the cached inode number, NEGATIVE if the name is cached as not
+        existing, or None if the name is not cached.
+        '''
+        with self._lock:
+            inode_number = self._entries.get((parent, name))
+
+            if inode_number is None:
+                self._miss_count += 1
+            elif inode_number == self.NEGATIVE:
+                self._negative_hit_count += 1
+            else:
+                self._hit_count += 1
+
+            return inode_number
+
+    def put(self, parent, name, inode_number):
+        '''
+        Caches the inode number of a name, or NEGATIVE if it does not exist.
+        '''
+        if self._max_entries == 0:
+            return
+
+        with self._lock:
+            self._entries.pop((parent, name), None)
+
+            # Count the entries that LRUCache evicts to make room
+            length = len(self._entries)
+            self._entries[(parent, name)] = inode_number
+            self._eviction_count += length + 1 - len(self._entries)
+
+    def invalidate(self, parent, name):
+        with self._lock:
+            self._entries.pop((parent, name), None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hit_count + self._negative_hit_count + self._miss_count
+
+            return dict(
+                entries=len(self._entries),
+                negative_entries=sum(1 for inode_number in self._entries.values()
+                                     if inode_number == self.NEGATIVE),
+                max_entries=self._max_entries,
+                hits=self._hit_count,
+                negative_hits=self._negative_hit_count,
+                misses=self._miss_count,
+                hit_rate=(lookups - self._miss_count) / lookups if lookups else 0.0,
+                evictions=self._eviction_count)
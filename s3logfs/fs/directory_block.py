@@ -0,0 +1,239 @@
+from hashlib import blake2b
+from stat import S_IFMT
+from struct import Struct
+
+
+class DirectoryBlock:
+    '''
+    One bucket of a hashed directory: the entries (name -> inode number and
+    file type) whose names hash to it, stored in a single block. The file
+    type is the d_type of the entry, so that listing a directory does not
+    have to load the inode of every entry.
+
+    A directory of N buckets stores them as its blocks 0 to N-1 and uses
+    linear hashing (see bucket_index()) to find the bucket of a name, so a
+    lookup reads one block and an insert or delete writes one block. When a
+    bucket fills up the directory grows by splitting buckets one at a time
+    in order, which moves about half of the split bucket's entries into the
+    new bucket N.
+
+    Encoded blocks are
+      header   HH  format version, number of entries
+      entries  Q inode number, B file type, B length of the name, then the
+               utf-8 name
+    Blocks of version 1 have no file type, their entries are UNKNOWN_TYPE.
+
+    Listing a directory visits its entries in order of their position (see
+    entry_positions()), the low POSITION_HASH_BITS of the name hash with
+    their bits reversed. Each bucket then holds one range of positions, and
+    a split divides a range in two, so a position stays valid as a readdir
+    offset however entries are added, removed or moved between buckets.
+    '''
+
+    VERSION = 2
+    HEADER_STRUCT = Struct('<HH')
+    ENTRY_STRUCT = Struct('<QBB')
+    V1_ENTRY_STRUCT = Struct('<QB')
+
+    # the d_type of entries whose file type is not known
+    UNKNOWN_TYPE = 0
+
+    # a position is POSITION_HASH_BITS of the name hash followed by
+    # COLLISION_BITS for the index of the name among those with the same bits
+    POSITION_HASH_BITS = 55
+    COLLISION_BITS = 7
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self.entries = {}                      # name -> inode number
+        self.file_types = {}                   # name -> file type
+        self._length = self.HEADER_STRUCT.size
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def from_bytes(klass, data, block_size):
+        block = klass(block_size)
+
+        # an empty block has never been written, and a hole reads as zeros
+        if len(data) == 0:
+            return block
+
+        version, count = klass.HEADER_STRUCT.unpack_from(data)
+        if version == 0 and count == 0:
+            return block
+        elif version not in (1, klass.VERSION):
+            raise ValueError('Unknown directory block version ' + str(version))
+
+        offset = klass.HEADER_STRUCT.size
+        for _ in range(count):
+            if version == 1:
+                inode_number, name_length = klass.V1_ENTRY_STRUCT.unpack_from(data, offset)
+                file_type = klass.UNKNOWN_TYPE
+                offset += klass.V1_ENTRY_STRUCT.size
+            else:
+                inode_number, file_type, name_length = \
+                    klass.ENTRY_STRUCT.unpack_from(data, offset)
+                offset += klass.ENTRY_STRUCT.size
+            name = bytes(data[offset:offset + name_length]).decode('utf-8')
+            offset += name_length
+            block.entries[name] = inode_number
+            block.file_types[name] = file_type
+
+            # the length once re-encoded, which for a version 1 block may
+            # exceed the block size
+            block._length += klass.entry_size(name)
+
+        return block
+
+    def to_bytes(self):
+        data = bytearray(self.HEADER_STRUCT.pack(self.VERSION, len(self.entries)))
+
+        for name, inode_number in self.entries.items():
+            name_bytes = name.encode('utf-8')
+            data.extend(self.ENTRY_STRUCT.pack(
+                inode_number, self.file_types[name], len(name_bytes)))
+            data.extend(name_bytes)
+
+        return bytes(data)
+
+    # returns the number of bytes the encoded block takes
+    def used_bytes(self):
+        return self._length
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def get_file_type(self, name):
+        return self.file_types.get(name)
+
+    def add(self, name, inode_number, file_type=UNKNOWN_TYPE):
+        '''
+        Adds or replaces an entry. Returns False, leaving the block unchanged,
+        if a new entry does not fit in the block.
+        '''
+        if name not in self.entries:
+            length = self.entry_size(name)
+            if self._length + length > self.block_size:
+                return False
+            self._length += length
+
+        self.entries[name] = inode_number
+        self.file_types[name] = file_type
+        return True
+
+    def remove(self, name):
+        '''
+        Removes an entry and returns its inode number. Raises KeyError if
+        there is no such entry.
+        '''
+        inode_number = self.entries.pop(name)
+        del self.file_types[name]
+        self._length -= self.entry_size(name)
+        return inode_number
+
+    def split(self, hash_mask, new_hash_bits):
+        '''
+        Moves the entries whose hash has new_hash_bits under hash_mask into a
+        new block, which is returned.
+        '''
+        new_block = DirectoryBlock(self.block_size)
+
+        for name in [n for n in self.entries if self.hash_name(n) & hash_mask == new_hash_bits]:
+            file_type = self.file_types[name]
+            new_block.add(name, self.remove(name), file_type)
+
+        return new_block
+
+    @classmethod
+    def entry_size(klass, name):
+        return klass.ENTRY_STRUCT.size + len(name.encode('utf-8'))
+
+    @staticmethod
+    def file_type(mode):
+        '''
+        Returns the d_type of an inode with the given st_mode.
+        '''
+        return S_IFMT(mode) >> 12
+
+    @staticmethod
+    def type_mode(file_type):
+        '''
+        Returns the st_mode file type bits of a d_type.
+        '''
+        return file_type << 12
+
+    @staticmethod
+    def hash_name(name):
+        return int.from_bytes(
+            blake2b(name.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    @staticmethod
+    def bucket_index(name_hash, bucket_count):
+        '''
+        Returns the bucket of a hash in a directory of bucket_count buckets.
+        Buckets below the split point (bucket_count - 2**level) have already
+        been split in this round, so they use one more bit of the hash.
+        '''
+        level = bucket_count.bit_length() - 1
+        split = bucket_count - (1 << level)
+        index = name_hash & ((1 << level) - 1)
+
+        if index < split:
+            index = name_hash & ((1 << (level + 1)) - 1)
+
+        return index
+
+    @classmethod
+    def entry_positions(klass, names):
+        '''
+        Returns the positions of names as a sorted list of (position, name).
+        Names whose hashes share their position bits are told apart by their
+        index in name order.
+        '''
+        hash_mask = (1 << klass.POSITION_HASH_BITS) - 1
+        collision_mask = (1 << klass.COLLISION_BITS) - 1
+        keyed = sorted((klass.reverse_bits(klass.hash_name(name) & hash_mask,
+                                           klass.POSITION_HASH_BITS), name)
+                       for name in names)
+
+        positions = []
+        for i, (key, name) in enumerate(keyed):
+            collision = 0
+            if i > 0 and keyed[i - 1][0] == key:
+                collision = min((positions[-1][0] & collision_mask) + 1, collision_mask)
+            positions.append(((key << klass.COLLISION_BITS) | collision, name))
+
+        return positions
+
+    @classmethod
+    def position_bucket(klass, position, bucket_count):
+        '''
+        Returns the bucket whose range of positions holds position.
+        '''
+        name_hash = klass.reverse_bits(position >> klass.COLLISION_BITS,
+                                       klass.POSITION_HASH_BITS)
+        return klass.bucket_index(name_hash, bucket_count)
+
+    @classmethod
+    def bucket_end(klass, index, bucket_count):
+        '''
+        Returns the first position after the range of a bucket, which is in
+        the bucket listed next, or None if the bucket is listed last. The range
+        of a bucket is the positions whose top bits are the bits of the hash
+        the bucket uses, reversed.
+        '''
+        level = bucket_count.bit_length() - 1
+        bits = level
+        if index < bucket_count - (1 << level) or index >= (1 << level):
+            bits += 1
+
+        prefix = klass.reverse_bits(index, bits) + 1
+        if prefix == 1 << bits:
+            return None
+        return prefix << (klass.POSITION_HASH_BITS - bits + klass.COLLISION_BITS)
+
+    @staticmethod
+    def reverse_bits(value, bits):
+        return int(format(value, '0%db' % bits)[::-1], 2) if bits > 0 else 0
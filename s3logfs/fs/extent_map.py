@@ -0,0 +1,361 @@
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from hashlib import blake2b
+from struct import Struct
+from .blockaddress import BlockAddress, ADDR_OFFSET_SHIFT
+from .log import Log
+
+
+class ExtentMap:
+    '''
+    Maps the blocks of a file to the log as a sorted list of extents, each a
+    run of consecutive file blocks stored in consecutive blocks of one
+    segment: (first file block, address of that block, length). This is the
+    block mapping of files in a filesystem created with the extent layout (see
+    CheckpointRegion.layout), in place of direct and indirect addresses.
+
+    The extents are held in three parallel array('Q') (starts, addresses as
+    packed BlockAddresses, and lengths), and lookups bisect starts. Blocks
+    which are not covered by an extent are holes, returned as (0,0).
+
+    A map of up to INLINE_EXTENTS extents is stored inside the inode. Larger
+    maps are split into leaf blocks of the metadata stream by flush(), and the
+    inode stores (first file block, leaf address, extent count) for each
+    leaf. When there are more leaves than the inode has room for, they are
+    themselves stored in index blocks, which the inode refers to in the same
+    way, adding levels until the top one fits. flush() only rewrites the
+    blocks whose contents changed, so a file which is written sequentially
+    only rewrites its last leaf and the index blocks above it.
+    '''
+
+    INLINE_EXTENTS = 16
+
+    # Encoded maps (inline in an inode, or in a leaf or index block) are
+    #   header   II  kind, number of entries
+    #   columns  Q   each column in turn, every one holding an entry per entry
+    # The entries of an EXTENTS map are extents (start, address, length), and
+    # those of a LEAVES map are leaves (first start, address, extent count).
+    # A map of kind LEAVES + n, stored in an inode or an index block, refers
+    # to index blocks of kind LEAVES + n - 1 (first start, address, number of
+    # entries).
+    HEADER_STRUCT = Struct('<II')
+    EXTENTS = 0
+    LEAVES = 1
+    ENTRY_SIZE = 3 * array('Q').itemsize
+
+    def __init__(self):
+        self.starts = array('Q')      # first file block of each extent
+        self.addresses = array('Q')   # packed address of each extent's first block
+        self.lengths = array('Q')     # number of blocks in each extent
+        self._leaves = []             # (first start, packed address, entry count)
+        self._leaves_kind = self.LEAVES
+        self._leaf_digests = {}       # digest of a stored leaf -> its packed address
+        self._loaded = True
+        self._dirty = False
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __eq__(self, other):
+        if isinstance(other, ExtentMap):
+            return (self.starts == other.starts and
+                    self.addresses == other.addresses and
+                    self.lengths == other.lengths)
+        return NotImplemented
+
+    @classmethod
+    def from_bytes(klass, data):
+        '''
+        Decodes a map encoded by to_bytes(). A map stored in leaf blocks must
+        be load()ed before it is used.
+        '''
+        extent_map = klass()
+        kind, columns = klass._decode(data)
+
+        if kind >= klass.LEAVES:
+            extent_map._leaves = list(zip(*columns))
+            extent_map._leaves_kind = kind
+            extent_map._loaded = False
+        else:
+            extent_map.starts, extent_map.addresses, extent_map.lengths = columns
+
+        return extent_map
+
+    def to_bytes(self):
+        '''
+        Encodes the map for storing in an inode. A map with more than
+        INLINE_EXTENTS extents must be flush()ed first.
+        '''
+        if len(self) <= self.INLINE_EXTENTS:
+            return self._encode(self.EXTENTS, self.starts, self.addresses, self.lengths)
+
+        if self._dirty or not self._loaded:
+            raise ValueError('ExtentMap must be flushed before it is encoded')
+
+        columns = [array('Q', column) for column in zip(*self._leaves)]
+        return self._encode(self._leaves_kind, *columns)
+
+    @classmethod
+    def encoded_length(klass, data):
+        '''
+        Returns the length of the map encoded at the start of data.
+        '''
+        kind, count = klass.HEADER_STRUCT.unpack_from(data)
+        return klass.HEADER_STRUCT.size + count * klass.ENTRY_SIZE
+
+    def is_loaded(self):
+        return self._loaded
+
+    def load(self, log):
+        '''
+        Reads the extents of a map stored in leaf blocks from the log.
+        '''
+        if self._loaded:
+            return
+
+        self._load_blocks(log, self._leaves)
+        self._loaded = True
+
+    def flush(self, log):
+        '''
+        Writes the leaves whose extents have changed since the map was last
+        flushed to the metadata stream of the log. Small maps have no leaves,
+        as they are stored in the inode.
+        '''
+        if not self._dirty:
+            return
+
+        self._dirty = False
+        leaves = []
+        leaf_digests = {}
+
+        kind = self.EXTENTS
+
+        if len(self) > self.INLINE_EXTENTS:
+            block_size = log.get_block_size()
+            capacity = self.leaf_capacity(block_size)
+            columns = (self.starts, self.addresses, self.lengths)
+
+            # write a level of blocks at a time, until the inode has room for
+            # the entries of the top level
+            while True:
+                leaves = []
+                for first in range(0, len(columns[0]), capacity):
+                    last = first + capacity
+                    data = self._encode(kind, *(column[first:last] for column in columns))
+                    digest = self._digest(data)
+
+                    packed = self._leaf_digests.get(digest)
+                    if packed is None:
+                        packed = log.write_data_block(data, Log.METADATA_STREAM).to_packed()
+
+                    leaf_digests[digest] = packed
+                    leaves.append((columns[0][first], packed, len(columns[0][first:last])))
+
+                kind += 1
+                if len(leaves) <= self.max_leaves(block_size):
+                    break
+                columns = [array('Q', column) for column in zip(*leaves)]
+
+        self._leaves = leaves
+        self._leaves_kind = max(kind, self.LEAVES)
+        self._leaf_digests = leaf_digests
+
+    def get_addresses(self, block, count):
+        '''
+        Returns the addresses of count blocks of the file from block.
+        '''
+        addresses = []
+        end = block + count
+        index = -1
+
+        while block < end:
+            # the last extent which starts at or before block
+            index = bisect_right(self.starts, block, max(index, 0)) - 1
+
+            if index >= 0 and block < self.starts[index] + self.lengths[index]:
+                length = min(end, self.starts[index] + self.lengths[index]) - block
+                first = self.addresses[index] + ((block - self.starts[index]) << ADDR_OFFSET_SHIFT)
+                addresses.extend(BlockAddress.from_packed(first + (i << ADDR_OFFSET_SHIFT))
+                                 for i in range(length))
+            else:
+                following = index + 1
+                next_start = self.starts[following] if following < len(self) else end
+                length = min(end, next_start) - block
+                addresses.extend(BlockAddress() for _ in range(length))
+
+            block += length
+
+        return addresses
+
+    def set_addresses(self, block, addresses):
+        '''
+        Points len(addresses) blocks of the file from block at the given
+        addresses, replacing any extents which covered them. Consecutive
+        addresses within a segment become a single extent, and (0,0) addresses
+        make holes.
+        '''
+        end = block + len(addresses)
+        self._remove(block, end)
+
+        index = bisect_left(self.starts, block)
+        inserted = 0
+        run_start = None
+
+        for i, address in enumerate(addresses):
+            packed = address.to_packed()
+
+            if run_start is not None and \
+               packed == self.addresses[index] + ((i - run_start) << ADDR_OFFSET_SHIFT):
+                self.lengths[index] += 1
+                continue
+
+            if run_start is not None:
+                index += 1
+                run_start = None
+
+            if packed != 0:
+                self.starts.insert(index, block + i)
+                self.addresses.insert(index, packed)
+                self.lengths.insert(index, 1)
+                inserted += 1
+                run_start = i
+
+        # the new extents may continue the ones on either side of them
+        first = bisect_left(self.starts, block) - 1
+        self._merge(max(first, 0), first + inserted + 1)
+        self._dirty = True
+
+    def memory_size(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.__dict__) + \
+            sys.getsizeof(self.starts) + sys.getsizeof(self.addresses) + \
+            sys.getsizeof(self.lengths) + sys.getsizeof(self._leaves) + \
+            sys.getsizeof(self._leaf_digests)
+
+    @classmethod
+    def leaf_capacity(klass, block_size):
+        '''
+        Returns the number of extents which fit in a leaf block, or entries
+        in an index block.
+        '''
+        return (block_size - klass.HEADER_STRUCT.size) // klass.ENTRY_SIZE
+
+    @classmethod
+    def max_leaves(klass, block_size):
+        '''
+        Returns the number of leaves or index blocks an inode can refer to,
+        leaving room in the block for the rest of the inode.
+        '''
+        return max(1, (block_size // 2) // klass.ENTRY_SIZE)
+
+    # Private methods
+
+    def _load_blocks(self, log, entries):
+        '''
+        Reads the blocks the entries refer to, and the blocks those refer to
+        in turn, appending the extents of the leaves.
+        '''
+        for first, packed, count in entries:
+            data = log.read_block(BlockAddress.from_packed(packed))
+            kind, columns = self._decode(data)
+            # digest the canonical encoding, as the block may be padded
+            self._leaf_digests[self._digest(self._encode(kind, *columns))] = packed
+
+            if kind == self.EXTENTS:
+                self.starts.extend(columns[0])
+                self.addresses.extend(columns[1])
+                self.lengths.extend(columns[2])
+            else:
+                self._load_blocks(log, list(zip(*columns)))
+
+    def _remove(self, start, end):
+        '''
+        Removes the blocks from start to end from the extents, splitting or
+        trimming the extents which are only partly covered.
+        '''
+        index = bisect_right(self.starts, start) - 1
+
+        # an extent which starts before start and reaches into the range
+        if index >= 0 and self.starts[index] + self.lengths[index] > start:
+            extent_end = self.starts[index] + self.lengths[index]
+
+            if extent_end > end:
+                remainder = self.addresses[index] + ((end - self.starts[index]) << ADDR_OFFSET_SHIFT)
+                self.starts.insert(index + 1, end)
+                self.addresses.insert(index + 1, remainder)
+                self.lengths.insert(index + 1, extent_end - end)
+
+            self.lengths[index] = start - self.starts[index]
+
+            if self.lengths[index] == 0:
+                del self.starts[index]
+                del self.addresses[index]
+                del self.lengths[index]
+
+        # the extents which start in the range, the last may reach past it
+        low = bisect_left(self.starts, start)
+        high = bisect_left(self.starts, end)
+
+        if high > low:
+            last = high - 1
+            last_end = self.starts[last] + self.lengths[last]
+
+            if last_end > end:
+                self.addresses[last] += (end - self.starts[last]) << ADDR_OFFSET_SHIFT
+                self.lengths[last] = last_end - end
+                self.starts[last] = end
+                high = last
+
+            del self.starts[low:high]
+            del self.addresses[low:high]
+            del self.lengths[low:high]
+
+    def _merge(self, first, last):
+        '''
+        Joins each extent from first to last with the next one when the two
+        are consecutive both in the file and in the log.
+        '''
+        index = first
+        last = min(last, len(self) - 1)
+
+        while index < last:
+            length = self.lengths[index]
+
+            if self.starts[index] + length == self.starts[index + 1] and \
+               self.addresses[index] + (length << ADDR_OFFSET_SHIFT) == self.addresses[index + 1]:
+                self.lengths[index] += self.lengths[index + 1]
+                del self.starts[index + 1]
+                del self.addresses[index + 1]
+                del self.lengths[index + 1]
+                last -= 1
+            else:
+                index += 1
+
+    @classmethod
+    def _encode(klass, kind, *columns):
+        data = bytearray(klass.HEADER_STRUCT.pack(kind, len(columns[0])))
+
+        for column in columns:
+            data.extend(BlockAddress.packed_array_to_bytes(column))
+
+        return bytes(data)
+
+    @classmethod
+    def _decode(klass, data):
+        kind, count = klass.HEADER_STRUCT.unpack_from(data)
+        offset = klass.HEADER_STRUCT.size
+        column_size = count * array('Q').itemsize
+        columns = []
+
+        for _ in range(3):
+            columns.append(BlockAddress.packed_array_from_bytes(
+                bytes(data[offset:offset + column_size])))
+            offset += column_size
+
+        return kind, columns
+
+    @staticmethod
+    def _digest(data):
+        return blake2b(data, digest_size=16).digest()
+
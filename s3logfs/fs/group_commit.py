@@ -0,0 +1,95 @@
+from threading import Condition, Thread
+from time import sleep
+
+
+class GroupCommit:
+    '''
+    Batches fsync requests so that requests which arrive together share a
+    single Log.sync().
+
+    Each request registers a callback and returns immediately. A background
+    thread waits commit_delay seconds for more requests to arrive, syncs the
+    log once, and then calls every callback in the batch. Requests which arrive
+    while a sync is in progress are handled together by the next one.
+
+    Callbacks are called with None on success, or with the exception raised by
+    the sync.
+    '''
+
+    def __init__(self, log, commit_delay=0):
+        self._log = log
+        self._commit_delay = commit_delay  # In seconds
+        self._waiting_callbacks = []
+        self._waiting_callbacks_cv = Condition()
+        self._stopping = False
+        self._commit_count = 0
+        self._request_count = 0
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def request(self, callback):
+        '''
+        Calls callback once everything written to the log before this call is
+        durable.
+        '''
+        with self._waiting_callbacks_cv:
+            self._waiting_callbacks.append(callback)
+            self._request_count += 1
+            self._waiting_callbacks_cv.notify()
+
+    def stop(self):
+        '''
+        Commits any waiting requests and stops the background thread.
+        '''
+        with self._waiting_callbacks_cv:
+            self._stopping = True
+            self._waiting_callbacks_cv.notify()
+
+        self._thread.join()
+
+    def commit_count(self):
+        return self._commit_count
+
+    def request_count(self):
+        return self._request_count
+
+    # Private methods
+
+    def _run(self):
+        while True:
+            with self._waiting_callbacks_cv:
+                self._waiting_callbacks_cv.wait_for(self._has_work)
+
+                if not self._waiting_callbacks:  # Stopping with nothing to do
+                    return
+
+            if self._commit_delay and not self._stopping:
+                sleep(self._commit_delay)
+
+            with self._waiting_callbacks_cv:
+                callbacks = self._waiting_callbacks
+                self._waiting_callbacks = []
+
+            self._commit(callbacks)
+
+    def _commit(self, callbacks):
+        error = None
+
+        try:
+            self._log.sync()
+        except Exception as e:
+            error = e
+
+        self._commit_count += 1
+
+        for callback in callbacks:
+            callback(error)
+
+    def _has_work(self):
+        return self._stopping or len(self._waiting_callbacks) > 0
@@ -0,0 +1,164 @@
+from collections import OrderedDict
+from .addressblock import AddressBlock
+from .blockaddress import BlockAddress
+from .log import Log
+
+
+class IndirectBlockCache:
+    '''
+    Holds the indirect address blocks of files which are being written, so
+    that a block's pointers can be updated many times in memory and the block
+    is only written to the log when the file is flushed.
+
+    Each indirect block is identified within its inode by (level, path): level
+    is the indirect tree it belongs to (1, 2 or 3, see INode.indirect_lvl1 to
+    indirect_lvl3) and path the indices followed from the tree's root to reach
+    it, so the root of a tree has the path ().
+
+    Loading a block loads every block above it, so the parent of a cached
+    block is always cached too. flush() writes the dirty blocks bottom-up,
+    storing each block's new address in its parent, and finally in the inode.
+
+    Inodes are kept in the order in which they were first cached, so that when
+    more than max_blocks blocks are held the owner can flush and discard the
+    oldest ones (see oldest_inode_number()).
+    '''
+
+    def __init__(self, log, max_blocks):
+        self._log = log
+        self._max_blocks = max_blocks
+        self._blocks = OrderedDict()  # inode number -> {(level, path) -> AddressBlock}
+        self._dirty = {}              # inode number -> set of (level, path)
+        self._block_count = 0
+        self._update_count = 0
+        self._written_count = 0
+
+    def get_addresses(self, inode, offset, count):
+        '''
+        Returns the addresses of count blocks of the inode from offset, which
+        must be past the inode's direct blocks. Blocks which are not cached are
+        read from the log but not added to the cache.
+        '''
+        addresses = []
+        loaded = dict(self._blocks.get(inode.inode_number, {}))
+
+        for leaf, index, length in self._leaves(inode, offset, count):
+            block = self._load(inode, leaf, loaded)
+            addresses.extend(block.get_addresses(index, length))
+
+        return addresses
+
+    def set_addresses(self, inode, offset, addresses):
+        '''
+        Sets the addresses of len(addresses) blocks of the inode from offset,
+        which must be past the inode's direct blocks.
+        '''
+        blocks = self._blocks.setdefault(inode.inode_number, {})
+        dirty = self._dirty.setdefault(inode.inode_number, set())
+        block_count = len(blocks)
+        start = 0
+
+        for leaf, index, length in self._leaves(inode, offset, len(addresses)):
+            block = self._load(inode, leaf, blocks)
+            block.set_addresses(addresses[start:start + length], index)
+            dirty.add(leaf)
+            start += length
+
+        self._block_count += len(blocks) - block_count
+        self._update_count += len(addresses)
+
+    def has_dirty_blocks(self, inode_number):
+        return len(self._dirty.get(inode_number, ())) > 0
+
+    def inode_numbers(self):
+        return list(self._blocks.keys())
+
+    def oldest_inode_number(self):
+        return next(iter(self._blocks))
+
+    def flush(self, inode):
+        '''
+        Writes the inode's dirty blocks to the log and points the inode at the
+        new roots. The blocks stay cached. The caller must write the inode.
+        '''
+        blocks = self._blocks.get(inode.inode_number, {})
+        dirty = self._dirty.pop(inode.inode_number, set())
+
+        # Children before parents, as writing a block dirties its parent
+        for depth in (2, 1, 0):
+            for (level, path) in sorted(key for key in dirty if len(key[1]) == depth):
+                address = self._log.write_data_block(
+                    blocks[(level, path)].get_bytes(), Log.METADATA_STREAM)
+                self._written_count += 1
+
+                if depth == 0:
+                    setattr(inode, 'indirect_lvl' + str(level), address)
+                else:
+                    blocks[(level, path[:-1])].set_address(address, path[-1])
+                    dirty.add((level, path[:-1]))
+
+    def discard(self, inode_number):
+        '''
+        Drops the inode's blocks, including any which have not been flushed.
+        '''
+        blocks = self._blocks.pop(inode_number, {})
+        self._dirty.pop(inode_number, None)
+        self._block_count -= len(blocks)
+
+    def is_full(self):
+        return self._block_count > self._max_blocks
+
+    def stats(self):
+        return dict(
+            blocks=self._block_count,
+            dirty_blocks=sum(len(dirty) for dirty in self._dirty.values()),
+            updates=self._update_count,
+            written_blocks=self._written_count)
+
+    # Private methods
+
+    def _leaves(self, inode, offset, count):
+        '''
+        Yields (leaf key, index within the leaf, number of addresses) for each
+        leaf block holding the addresses of count blocks from offset.
+        '''
+        block_size = self._log.get_block_size()
+        address_size = BlockAddress.get_address_size()
+        addresses_per_block = block_size // address_size
+        end = min(offset + count,
+                  inode.get_max_indirect_offset(block_size, address_size, 3))
+
+        while offset < end:
+            # Lowest level first, e.g. (lvl1 index, lvl2 index)
+            offsets = inode.get_indirect_offsets(offset, block_size)
+            level = len(offsets)
+            path = tuple(reversed(offsets))[:-1]
+            index = offsets[0]
+            length = min(addresses_per_block - index, end - offset)
+
+            yield (level, path), index, length
+            offset += length
+
+    def _load(self, inode, key, blocks):
+        '''
+        Returns the block with the given key from blocks, first loading it and
+        every block above it into blocks if needed.
+        '''
+        if key in blocks:
+            return blocks[key]
+
+        level, path = key
+
+        if len(path) == 0:
+            address = getattr(inode, 'indirect_lvl' + str(level))
+        else:
+            address = self._load(inode, (level, path[:-1]), blocks).get_address(path[-1])
+
+        # if address is 0,0 load a block of zeros, otherwise load from log
+        if address == BlockAddress():
+            block = AddressBlock(bytes(self._log.get_block_size()))
+        else:
+            block = AddressBlock(self._log.read_block(address))
+
+        blocks[key] = block
+        return block
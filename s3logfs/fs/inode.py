@@ -1,4 +1,6 @@
 from .blockaddress import BlockAddress
+from .addressarray import AddressArray
+from .extent_map import ExtentMap
 from .log import Log
 from struct import *
 from array import array
@@ -7,6 +9,7 @@ from stat import *
 from time import time
 from collections import *
 import math
+import sys
 
 import pickle
 
@@ -51,44 +54,144 @@ class INode:
         self.last_modified_at = now       # st_mtime
         self.status_last_changed_at = now # st_ctime
         self.block_offset = 0
-        self.block_addresses = self.NUMBER_OF_DIRECT_BLOCKS * [BlockAddress()]
+        self.block_addresses = AddressArray(self.NUMBER_OF_DIRECT_BLOCKS)
         self.indirect_lvl1 = BlockAddress()
         self.indirect_lvl2 = BlockAddress()
         self.indirect_lvl3 = BlockAddress()
+        # files of a filesystem with the extent layout map their blocks with
+        # this instead of block_addresses and the indirect addresses
+        self.extents = None
+        # small contents (a file's data, a symlink target or directory
+        # entries) are stored in the inode instead of in data blocks
+        self.inline_data = None
+        # number of entries of a hashed directory (see DirectoryBlock), None
+        # for directories stored as a single pickled dict of children
+        self.entry_count = None
         # for directory lookups, will be populated from data after inode is loaded
         self.children = {}
 
+    # Encoded inodes start with a header word holding the encoding version in
+    # its top byte. In the original fixed size encoding (version 0) the first
+    # word is the inode number, whose top byte is always 0.
+    #
+    # Version 1 layout:
+    #   header   Q  version << 56 | flags << 32 | number of direct addresses
+    #   fields   STRUCT_FORMAT
+    #   direct   the used prefix of block_addresses
+    #   indirect lvl1, lvl2 and lvl3 addresses, only if FLAG_INDIRECT is set
+    #   extents  the encoded ExtentMap, only if FLAG_EXTENTS is set
+    #   inline   I length followed by inline_data, only if FLAG_INLINE is set
+    #   entries  Q entry_count, only if FLAG_HASHED_DIRECTORY is set
+    VERSION = 1
+    HEADER_STRUCT = Struct('Q')
+    INLINE_LENGTH_STRUCT = Struct('I')
+    ENTRY_COUNT_STRUCT = Struct('Q')
+    FLAG_INDIRECT = 1
+    FLAG_EXTENTS = 2
+    FLAG_INLINE = 4
+    FLAG_HASHED_DIRECTORY = 8
+
     @classmethod
     def from_bytes(klass, data):
 
+        header = klass.HEADER_STRUCT.unpack_from(data)[0]
+        version = header >> 56
+
+        if version == 0:
+            return klass._from_version_0_bytes(data)
+        elif version != klass.VERSION:
+            raise ValueError('Unknown inode encoding version ' + str(version))
+
+        flags = (header >> 32) & 0xFFFFFF
+        direct_count = header & 0xFFFFFFFF
+
+        offset = klass.HEADER_STRUCT.size
+        inode = klass()
+        inode._unpack_fields(data[offset:offset + klass.STRUCT.size])
+        offset += klass.STRUCT.size
+
+        # unused direct addresses keep the default (0,0) address
+        address_size = BlockAddress.get_address_size()
+        inode.block_addresses.set_bytes(0, data[offset:offset + direct_count * address_size])
+        offset += direct_count * address_size
+
+        if flags & klass.FLAG_INDIRECT:
+            inode.indirect_lvl1 = BlockAddress(data[offset:offset + address_size])
+            offset += address_size
+            inode.indirect_lvl2 = BlockAddress(data[offset:offset + address_size])
+            offset += address_size
+            inode.indirect_lvl3 = BlockAddress(data[offset:offset + address_size])
+            offset += address_size
+
+        if flags & klass.FLAG_EXTENTS:
+            inode.extents = ExtentMap.from_bytes(data[offset:])
+            offset += ExtentMap.encoded_length(data[offset:])
+
+        if flags & klass.FLAG_INLINE:
+            length = klass.INLINE_LENGTH_STRUCT.unpack_from(data, offset)[0]
+            offset += klass.INLINE_LENGTH_STRUCT.size
+            inode.inline_data = bytes(data[offset:offset + length])
+            offset += length
+
+        if flags & klass.FLAG_HASHED_DIRECTORY:
+            inode.entry_count = klass.ENTRY_COUNT_STRUCT.unpack_from(data, offset)[0]
+
+        return inode
+
+    def to_bytes(self):
+
+        # only store direct addresses up to the last one which is in use
+        empty = BlockAddress()
+        direct_count = self.block_addresses.used_length()
+
+        indirects = (self.indirect_lvl1, self.indirect_lvl2, self.indirect_lvl3)
+        flags = 0
+        if any(address != empty for address in indirects):
+            flags |= self.FLAG_INDIRECT
+        if self.extents is not None:
+            flags |= self.FLAG_EXTENTS
+        if self.inline_data is not None:
+            flags |= self.FLAG_INLINE
+        if self.entry_count is not None:
+            flags |= self.FLAG_HASHED_DIRECTORY
+
+        header = (self.VERSION << 56) | (flags << 32) | direct_count
+        data = bytearray(self.HEADER_STRUCT.pack(header))
+        data.extend(self._pack_fields())
+
+        data.extend(self.block_addresses.get_bytes(0, direct_count))
+
+        if flags & self.FLAG_INDIRECT:
+            for address in indirects:
+                data.extend(address.to_bytes())
+
+        if flags & self.FLAG_EXTENTS:
+            data.extend(self.extents.to_bytes())
+
+        if flags & self.FLAG_INLINE:
+            data.extend(self.INLINE_LENGTH_STRUCT.pack(len(self.inline_data)))
+            data.extend(self.inline_data)
+
+        if flags & self.FLAG_HASHED_DIRECTORY:
+            data.extend(self.ENTRY_COUNT_STRUCT.pack(self.entry_count))
+
+        return bytes(data)
+
+    # decodes the original fixed size encoding, which stores every direct
+    # address and all three indirect addresses
+    @classmethod
+    def _from_version_0_bytes(klass, data):
+
         # pull data out of block of bytes
         struct_bytes = data[:klass.STRUCT.size]
         addresses_bytes = data[klass.STRUCT.size:]
-        unpacked_values = klass.STRUCT.unpack(struct_bytes)
 
-        # pattern: QQQIIIIIIIddd
         inode = klass()
-        (
-            inode.inode_number,
-            inode.parent,
-            inode.size,
-            inode.block_size,
-            inode.mode,
-            inode.uid,
-            inode.gid,
-            inode.hard_links,
-            inode.dev,
-            inode.rdev,
-            inode.last_accessed_at,
-            inode.last_modified_at,
-            inode.status_last_changed_at
-        ) = unpacked_values
+        inode._unpack_fields(struct_bytes)
 
         address_size = BlockAddress.get_address_size()
-        for i in range(klass.NUMBER_OF_DIRECT_BLOCKS):
-            offset = i * BlockAddress.get_address_size()
-            address_bytes = addresses_bytes[offset:offset + BlockAddress.get_address_size()]
-            inode.block_addresses[i] = BlockAddress(address_bytes)
+        inode.block_addresses.set_bytes(
+            0, addresses_bytes[:address_size * klass.NUMBER_OF_DIRECT_BLOCKS])
 
         # load indirect addresses
         indirect_offset = klass.STRUCT.size + (address_size * klass.NUMBER_OF_DIRECT_BLOCKS)
@@ -99,10 +202,29 @@ class INode:
 
         return inode
 
-    def to_bytes(self):
+    def _unpack_fields(self, struct_bytes):
+
+        # pattern: QQQIIIIIIIddd
+        (
+            self.inode_number,
+            self.parent,
+            self.size,
+            self.block_size,
+            self.mode,
+            self.uid,
+            self.gid,
+            self.hard_links,
+            self.dev,
+            self.rdev,
+            self.last_accessed_at,
+            self.last_modified_at,
+            self.status_last_changed_at
+        ) = self.STRUCT.unpack(struct_bytes)
+
+    def _pack_fields(self):
 
-        # pattern: QQQIIIIIddd
-        struct_bytes = self.STRUCT.pack(
+        # pattern: QQQIIIIIIIddd
+        return self.STRUCT.pack(
             self.inode_number,
             self.parent,
             self.size,
@@ -118,18 +240,38 @@ class INode:
             self.status_last_changed_at
         )
 
-        data = bytearray(struct_bytes)
+    # returns the approximate number of bytes of memory held by this instance,
+    # used to bound the size of the INodeCache
+    def memory_size(self):
+        size = sys.getsizeof(self) + sys.getsizeof(self.__dict__)
+        size += self.block_addresses.memory_size()
 
-        for i in range(self.NUMBER_OF_DIRECT_BLOCKS):
-            address = self.block_addresses[i]
-            data.extend(address.to_bytes())
+        # the indirect addresses are still BlockAddress objects
+        for address in (self.indirect_lvl1, self.indirect_lvl2, self.indirect_lvl3):
+            size += sys.getsizeof(address) + sys.getsizeof(address.__dict__)
 
-        # save indirect addresses
-        data.extend(self.indirect_lvl1.to_bytes())
-        data.extend(self.indirect_lvl2.to_bytes())
-        data.extend(self.indirect_lvl3.to_bytes())
+        if self.extents is not None:
+            size += self.extents.memory_size()
 
-        return bytes(data)
+        if self.inline_data is not None:
+            size += sys.getsizeof(self.inline_data)
+
+        return size
+
+    # returns the largest number of bytes stored inline (see inline_data), so
+    # that several inodes still fit in each block of the log
+    @staticmethod
+    def max_inline_size(block_size):
+        return block_size // 4
+
+    # stores data inline, dropping any direct addresses the inode had
+    def set_inline_data(self, data):
+        self.inline_data = bytes(data)
+        self.block_addresses = AddressArray(self.NUMBER_OF_DIRECT_BLOCKS)
+
+    # returns True if the directory is stored as hashed DirectoryBlocks
+    def is_hashed_directory(self):
+        return self.entry_count is not None
 
     # returns True if iNode is a directory
     def is_directory(self):
@@ -314,5 +456,10 @@ class INode:
 
     # this will convert the byte data to children entries
     def bytes_to_children(self, bytedata):
+        self.children = self.children_from_bytes(bytedata)
+
+    # returns the children entries encoded in the byte data as a new dict
+    @staticmethod
+    def children_from_bytes(bytedata):
         byte_count = unpack("I",bytedata[0:4])[0]
-        self.children = pickle.loads(bytedata[4:byte_count+4])
+        return pickle.loads(bytedata[4:byte_count+4])
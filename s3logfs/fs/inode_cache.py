@@ -0,0 +1,77 @@
+from threading import Lock
+from cachetools import LRUCache
+
+
+class INodeCache:
+    '''
+    Holds decoded INode objects keyed by inode number, so that repeated loads
+    of the same inode do not have to read and decode its block from the log.
+
+    The cache is bounded by the approximate memory held by the cached inodes
+    (see INode.memory_size()) rather than by their number, and the least
+    recently used inodes are evicted first. Inodes are measured when they are
+    added, so an inode which is modified while cached must be put() again.
+
+    Operations which share FuseApi's lock use the cache at the same time, so
+    it is guarded by a lock of its own.
+    '''
+
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._inodes = LRUCache(maxsize=max_bytes, getsizeof=self._getsizeof)
+        self._hit_count = 0
+        self._miss_count = 0
+        self._eviction_count = 0
+        self._lock = Lock()
+
+    def __contains__(self, inode_number):
+        with self._lock:
+            return inode_number in self._inodes
+
+    def get(self, inode_number):
+        '''
+        Returns the cached inode, or None if it is not cached.
+        '''
+        with self._lock:
+            inode = self._inodes.get(inode_number)
+
+            if inode is None:
+                self._miss_count += 1
+            else:
+                self._hit_count += 1
+
+            return inode
+
+    def put(self, inode):
+        size = self._getsizeof(inode)
+
+        with self._lock:
+            self._inodes.pop(inode.inode_number, None)
+
+            if size > self._max_bytes:
+                return  # Would not fit even in an empty cache
+
+            # Count the inodes that LRUCache evicts to make room
+            length = len(self._inodes)
+            self._inodes[inode.inode_number] = inode
+            self._eviction_count += length + 1 - len(self._inodes)
+
+    def invalidate(self, inode_number):
+        with self._lock:
+            self._inodes.pop(inode_number, None)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                entries=len(self._inodes),
+                bytes=self._inodes.currsize,
+                max_bytes=self._max_bytes,
+                hits=self._hit_count,
+                misses=self._miss_count,
+                evictions=self._eviction_count)
+
+    # Private methods
+
+    @staticmethod
+    def _getsizeof(inode):
+        return inode.memory_size()
@@ -0,0 +1,27 @@
+from .blockaddress import BlockAddress
+
+
+class INodeAddress(BlockAddress):
+    '''
+    The address of an inode which shares its block with other inodes: the
+    block's address plus the inode's slot within the block (see INodeBlock).
+
+    Inodes written before inodes were packed are addressed by a plain
+    BlockAddress and take up a whole block.
+    '''
+
+    def __init__(self, segmentid, offset, slot):
+        super().__init__(segmentid, offset)
+        self.slot = slot
+
+    def __eq__(self, other):
+        if isinstance(other, INodeAddress):
+            return super().__eq__(other) and self.slot == other.slot
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.segmentid, self.offset, self.slot))
+
+    def __str__(self):
+        return "INodeAddress(" + str(self.segmentid) + "," + str(self.offset) + \
+            "," + str(self.slot) + ")"
@@ -0,0 +1,73 @@
+from struct import Struct
+
+
+class INodeBlock:
+    '''
+    Packs several serialized inodes into a single log block.
+
+    Layout:
+      count    H  the number of inodes in the block
+      ends     H  per inode, the offset of the end of its bytes
+      inodes      the serialized inodes, one after the other
+    '''
+
+    COUNT_STRUCT = Struct('H')
+    END_STRUCT = Struct('H')
+
+    def __init__(self, block_size):
+        self._block_size = block_size
+        self._inodes = []
+        self._length = self.COUNT_STRUCT.size
+
+    def __len__(self):
+        return len(self._inodes)
+
+    def add(self, inode_bytes):
+        '''
+        Adds the serialized inode to the block and returns its slot, or None
+        if there is not enough space left in the block.
+        '''
+        length = self._length + self.END_STRUCT.size + len(inode_bytes)
+
+        if length > self._block_size:
+            return None
+
+        self._inodes.append(inode_bytes)
+        self._length = length
+        return len(self._inodes) - 1
+
+    def to_bytes(self):
+        data = bytearray(self.COUNT_STRUCT.pack(len(self._inodes)))
+        end = self.COUNT_STRUCT.size + len(self._inodes) * self.END_STRUCT.size
+
+        for inode_bytes in self._inodes:
+            end += len(inode_bytes)
+            data.extend(self.END_STRUCT.pack(end))
+
+        for inode_bytes in self._inodes:
+            data.extend(inode_bytes)
+
+        return bytes(data)
+
+    @classmethod
+    def read_slot(klass, block_bytes, slot):
+        '''
+        Returns the serialized inode in the given slot of a packed block.
+        '''
+        count = klass.COUNT_STRUCT.unpack_from(block_bytes)[0]
+
+        if slot >= count:
+            raise IndexError('Slot ' + str(slot) + ' of ' + str(count))
+
+        ends_offset = klass.COUNT_STRUCT.size
+
+        if slot == 0:
+            start = ends_offset + count * klass.END_STRUCT.size
+        else:
+            start = klass.END_STRUCT.unpack_from(
+                block_bytes, ends_offset + (slot - 1) * klass.END_STRUCT.size)[0]
+
+        end = klass.END_STRUCT.unpack_from(
+            block_bytes, ends_offset + slot * klass.END_STRUCT.size)[0]
+
+        return block_bytes[start:end]
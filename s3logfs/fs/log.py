@@ -1,6 +1,13 @@
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import RLock, local
+from time import time
 from .segment import ReadOnlySegment, ReadWriteSegment
 from .blockaddress import BlockAddress
+from .inodeaddress import INodeAddress
+from .inodeblock import INodeBlock
+from .cache_miss import CacheMiss
 
 
 class Log:
@@ -8,91 +15,355 @@ class Log:
     Abstract representation of the log.
 
     Only a single instance of this class should exist for a filesystem at one
-    time.
+    time. Its methods may be called from more than one thread (for example by
+    GroupCommit), so access to the open segments is guarded by a lock.
+
+    Blocks are separated into streams by how often they are rewritten. Inodes,
+    directory entries and indirect blocks go to the metadata stream, and file
+    data to the data stream. Each stream has its own open segment, so
+    frequently rewritten metadata does not end up interleaved with large,
+    rarely touched file data.
+
+    Segment ids are allocated when a stream writes its first block to a new
+    segment, so every id below get_current_segment_id() belongs to a segment
+    which has been sent to the backend.
+
+    read_inodes() fetches the segments holding a batch of inodes from the
+    backend in parallel, using up to fetch_threads threads.
+
+    A thread may limit its reads to segments which are open or cached by the
+    backend (see cached_only), so that it can tell when a read would wait
+    for a fetch before it does.
     """
 
-    def __init__(self, current_segment_id, backend, block_size=4096, blocks_per_segment=512):
-        self._current_segment_id = current_segment_id
+    METADATA_STREAM = 'metadata'
+    DATA_STREAM = 'data'
+    # Metadata is last so that its blocks are put after the data they refer to
+    STREAMS = (DATA_STREAM, METADATA_STREAM)
+
+    def __init__(self, current_segment_id, backend, block_size=4096, blocks_per_segment=512,
+                 fetch_threads=8):
+        self._next_segment_id = current_segment_id
         self._backend = backend
         self._block_size = block_size
         self._blocks_per_segment = blocks_per_segment
-        self._current_segment = ReadWriteSegment(
-            current_segment_id,
-            block_size=block_size,
-            max_block_count=blocks_per_segment
-        )
+        self._fetch_threads = fetch_threads
+        self._fetch_executor = None  # started by the first parallel fetch
+        self._fetched_segment_count = 0
+        self._lock = RLock()
+        self._thread_state = local()  # .cached_only and .segment_reads
+        self._open_segments = {}     # stream -> ReadWriteSegment
+        # Bytes of each open segment already uploaded by sync()
+        self._synced_lengths = {}    # stream -> int
+        self._unsynced_since = {}    # stream -> time of oldest write not yet uploaded
+        self._last_write_time = None
 
     def get_current_segment_id(self):
-        return self._current_segment_id
+        '''
+        Returns the lowest segment id which has not yet been sent to the
+        backend.
+        '''
+        with self._lock:
+            if self._open_segments:
+                return min(s.get_id() for s in self._open_segments.values())
+            else:
+                return self._next_segment_id
 
     def get_block_size(self):
         return self._block_size
 
+    def last_write_time(self):
+        return self._last_write_time
+
+    def unsynced_since(self):
+        '''
+        Returns the time of the oldest write which has not been sent to the
+        backend, or None if there is no such write.
+        '''
+        with self._lock:
+            return min(self._unsynced_since.values(), default=None)
+
+    def unsynced_length(self):
+        '''
+        Returns the number of bytes in the open segments which have not been
+        sent to the backend.
+        '''
+        with self._lock:
+            return sum(len(segment) - self._synced_lengths[stream]
+                       for stream, segment in self._open_segments.items())
+
+    def fetched_segment_count(self):
+        '''
+        Returns the number of segments read_inodes() has fetched from the
+        backend.
+        '''
+        return self._fetched_segment_count
+
+    @contextmanager
+    def cached_only(self):
+        '''
+        Within the with block, reads by the calling thread which would fetch
+        a segment from the backend raise CacheMiss instead.
+        '''
+        self._thread_state.cached_only = True
+        try:
+            yield
+        finally:
+            self._thread_state.cached_only = False
+
+    def thread_segment_reads(self):
+        '''
+        Returns the number of segments the calling thread has read from the
+        backend, whether or not the backend had them cached.
+        '''
+        return getattr(self._thread_state, 'segment_reads', 0)
+
     def read_block(self, block_address):
         '''
         Returns the block (as a memoryview) at the given block_address.
 
         Precondition: block_address.segmentid <= current_segment_id
         '''
-        if block_address.segmentid == self._current_segment_id:
-            segment = self._current_segment
-        else:
-            segment_bytes = self._backend.get_segment(block_address.segmentid)
-            segment = ReadOnlySegment(
-                segment_bytes,
-                block_address.segmentid,
-                block_size=self._block_size,
-                max_block_count=self._blocks_per_segment,
-            )
+        with self._lock:
+            for segment in self._open_segments.values():
+                if segment.get_id() == block_address.segmentid:
+                    return segment.read_block(block_address.offset)
+
+        self._check_cached(block_address.segmentid)
+        self._thread_state.segment_reads = self.thread_segment_reads() + 1
+        segment_bytes = self._backend.get_segment(block_address.segmentid)
+        segment = self._read_only_segment(block_address.segmentid, segment_bytes)
 
         return segment.read_block(block_address.offset)
 
-    def write_data_block(self, block_bytes):
+    def read_inode(self, inode_address):
+        '''
+        Returns the serialized inode at the given address, which is either an
+        INodeAddress of a packed inode or the BlockAddress of a whole block.
+        '''
+        return self._read_inode_from(self.read_block(inode_address), inode_address)
+
+    def read_inodes(self, inode_addresses):
+        '''
+        Returns the serialized inodes at the given addresses, like
+        read_inode(). Each segment holding any of them is fetched from the
+        backend once, and the segments are fetched in parallel.
         '''
-        Writes the given bytes to the current segment. If this fills the segment
-        then the segment is sent to the backend.
+        segments, fetched_count = self._read_segments(inode_addresses)
+
+        # open segments may be written by other threads while they are read
+        with self._lock:
+            self._fetched_segment_count += fetched_count
+            return [self._read_inode_from(
+                        segments[address.segmentid].read_block(address.offset), address)
+                    for address in inode_addresses]
+
+    def read_blocks(self, block_addresses):
+        '''
+        Returns the blocks at the given addresses, like read_block(). Each
+        segment holding any of them is fetched from the backend and decoded
+        once, rather than once per block.
+        '''
+        segments, _ = self._read_segments(block_addresses)
+
+        with self._lock:
+            return [segments[address.segmentid].read_block(address.offset)
+                    for address in block_addresses]
+
+    def write_data_block(self, block_bytes, stream=DATA_STREAM):
+        '''
+        Writes the given bytes to the open segment of the given stream. If this
+        fills the segment then the segment is sent to the backend.
 
         Precondition: len(block_bytes) <= block_size
         '''
-        block_number = self._current_segment.write_data(block_bytes)
-        segment_number = self._current_segment_id
+        with self._lock:
+            segment = self._open_segment(stream)
+            block_number = segment.write_data(block_bytes)
+            self._record_write(stream)
 
-        if self._current_segment.is_full():
-            self._put_current_segment()
+            if segment.is_full():
+                self._put_segment(stream)
 
-        return BlockAddress(segment_number, block_number)
+        return BlockAddress(segment.get_id(), block_number)
 
     def write_inode(self, inode_bytes, inode_number):
         '''
-        Writes the serialized inode to the current segment. If this fills the segment
-        then the segment is sent to the backend.
+        Writes the serialized inode to the open metadata segment. If this fills
+        the segment then the segment is sent to the backend.
 
         Precondition: len(inode_bytes) <= block_size
         '''
-        block_number = self._current_segment.write_inode(
-            inode_bytes, inode_number)
-        segment_number = self._current_segment_id
+        stream = self.METADATA_STREAM
+
+        with self._lock:
+            segment = self._open_segment(stream)
+            block_number = segment.write_inode(inode_bytes, inode_number)
+            self._record_write(stream)
 
-        if self._current_segment.is_full():
-            self._put_current_segment()
+            if segment.is_full():
+                self._put_segment(stream)
 
-        return BlockAddress(segment_number, block_number)
+        return BlockAddress(segment.get_id(), block_number)
+
+    def write_inodes(self, inodes):
+        '''
+        Writes the serialized inodes to the open metadata segment, packing as
+        many as fit into each block. inodes is a list of (inode number, inode
+        bytes), and an INodeAddress is returned for each in the same order.
+
+        Precondition: each inode fits in an empty INodeBlock
+        '''
+        addresses = []
+        block = INodeBlock(self._block_size)
+        inode_numbers = []
+
+        for inode_number, inode_bytes in inodes:
+            if block.add(inode_bytes) is None:
+                addresses.extend(self._write_inode_block(block, inode_numbers))
+                block = INodeBlock(self._block_size)
+                inode_numbers = []
+                block.add(inode_bytes)
+
+            inode_numbers.append(inode_number)
+
+        if inode_numbers:
+            addresses.extend(self._write_inode_block(block, inode_numbers))
+
+        return addresses
 
     def flush(self):
-        if len(self._current_segment) > 0:
-            self._put_current_segment()
+        self.seal()
+        self._backend.flush()
+
+    def seal(self):
+        '''
+        Sends every open segment which contains any blocks to the backend. New
+        segments are started by the next writes. Unlike flush() this does not
+        wait for the backend to finish writing.
+        '''
+        with self._lock:
+            for stream in self.STREAMS:
+                if stream in self._open_segments:
+                    self._put_segment(stream)
+
+    def sync(self):
+        '''
+        Makes every block written so far durable without sealing the open
+        segments.
+
+        The blocks written since the last put are uploaded as a partial
+        segment under the open segment's id. A partial segment is a prefix of
+        the segment it will eventually become, so later syncs (and the final
+        put when the segment fills) simply overwrite it, and roll-forward reads
+        it like any other segment. No segment id is used up by a sync.
+        '''
+        with self._lock:
+            for stream in self.STREAMS:
+                self._sync_segment(stream)
 
         self._backend.flush()
 
-    def _put_current_segment(self):
-        self._backend.put_segment(
-            self._current_segment_id,
-            self._current_segment.to_bytes()
-        )
+    # Private methods
+
+    # returns the segments holding the given addresses by id, the open
+    # segments and those fetched from the backend, and the number fetched
+    def _read_segments(self, addresses):
+        segments = {}
+
+        with self._lock:
+            for segment in self._open_segments.values():
+                segments[segment.get_id()] = segment
+
+        segment_ids = sorted({address.segmentid for address in addresses} - set(segments))
+        for segment_id in segment_ids:
+            self._check_cached(segment_id)
+        self._thread_state.segment_reads = self.thread_segment_reads() + len(segment_ids)
+
+        if len(segment_ids) > 1 and self._fetch_threads > 1:
+            with self._lock:
+                if self._fetch_executor is None:
+                    self._fetch_executor = ThreadPoolExecutor(max_workers=self._fetch_threads)
+            fetched = self._fetch_executor.map(self._backend.get_segment, segment_ids)
+        else:
+            fetched = map(self._backend.get_segment, segment_ids)
+
+        for segment_id, segment_bytes in zip(segment_ids, fetched):
+            segments[segment_id] = self._read_only_segment(segment_id, segment_bytes)
 
-        self._current_segment_id += 1
-        self._current_segment = ReadWriteSegment(
-            self._current_segment_id,
+        return segments, len(segment_ids)
+
+    def _check_cached(self, segment_id):
+        if getattr(self._thread_state, 'cached_only', False) and \
+                not self._backend.is_cached(segment_id):
+            raise CacheMiss(segment_id)
+
+    def _read_only_segment(self, segment_id, segment_bytes):
+        return ReadOnlySegment(
+            segment_bytes,
+            segment_id,
             block_size=self._block_size,
-            max_block_count=self._blocks_per_segment
+            max_block_count=self._blocks_per_segment,
         )
+
+    @staticmethod
+    def _read_inode_from(block_bytes, inode_address):
+        if isinstance(inode_address, INodeAddress):
+            return INodeBlock.read_slot(block_bytes, inode_address.slot)
+        else:
+            return block_bytes
+
+    def _write_inode_block(self, block, inode_numbers):
+        stream = self.METADATA_STREAM
+
+        with self._lock:
+            segment = self._open_segment(stream)
+            block_number = segment.write_inodes(block.to_bytes(), inode_numbers)
+            self._record_write(stream)
+
+            if segment.is_full():
+                self._put_segment(stream)
+
+        return [INodeAddress(segment.get_id(), block_number, slot)
+                for slot in range(len(inode_numbers))]
+
+    def _open_segment(self, stream):
+        if stream not in self._open_segments:
+            self._open_segments[stream] = ReadWriteSegment(
+                self._next_segment_id,
+                block_size=self._block_size,
+                max_block_count=self._blocks_per_segment
+            )
+            self._synced_lengths[stream] = 0
+            self._next_segment_id += 1
+
+        return self._open_segments[stream]
+
+    def _sync_segment(self, stream):
+        segment = self._open_segments.get(stream)
+
+        if segment and len(segment) > self._synced_lengths[stream]:
+            self._backend.put_segment(segment.get_id(), segment.to_bytes())
+            self._synced_lengths[stream] = len(segment)
+            self._unsynced_since.pop(stream, None)
+
+    def _put_segment(self, stream):
+        if stream == self.METADATA_STREAM:
+            # Inodes in this segment may point at blocks in the open data
+            # segment, so those must not be lost if the metadata survives
+            self._sync_segment(self.DATA_STREAM)
+
+        segment = self._open_segments.pop(stream)
+
+        # A segment which was completely uploaded by sync() is already stored
+        if len(segment) > self._synced_lengths[stream]:
+            self._backend.put_segment(segment.get_id(), segment.to_bytes())
+
+        del self._synced_lengths[stream]
+        self._unsynced_since.pop(stream, None)
+
+    def _record_write(self, stream):
+        self._last_write_time = time()
+
+        if stream not in self._unsynced_since:
+            self._unsynced_since[stream] = self._last_write_time
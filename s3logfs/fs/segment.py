@@ -1,11 +1,19 @@
 from abc import ABC
 from collections import defaultdict
-from pickle import dumps, loads
+from io import BytesIO
+from pickle import dumps, Unpickler, UnpicklingError
+import math
 
 class Segment(ABC):
     '''
     This is an abstract class and should not be instantiated directly.
     Instead, use either ReadOnlySegment or ReadWriteSegment.
+
+    A serialized segment starts with its summary, a pickled list with an
+    entry for every inode in the segment: (inode number, block number) for an
+    inode which fills a whole block, or (inode number, block number, slot) for
+    an inode packed into a block with others (see INodeBlock). The summary is
+    padded to a whole number of blocks and is followed by the blocks.
     '''
 
     def __init__(self, segment_id, block_size, max_block_count):
@@ -40,8 +48,11 @@ class Segment(ABC):
     def to_bytes(self):
         summary_bytes = dumps(self._inode_block_numbers)
 
-        if len(summary_bytes) < self._block_size:
-            padding = (self._block_size - len(summary_bytes)) * b'\0'
+        # a summary of many packed inodes may not fit in a single block
+        summary_length = max(1, math.ceil(len(summary_bytes) / self._block_size)) * self._block_size
+
+        if len(summary_bytes) < summary_length:
+            padding = (summary_length - len(summary_bytes)) * b'\0'
             summary_bytes += padding
 
         return summary_bytes + self._block_bytes
@@ -68,9 +79,33 @@ class ReadOnlySegment(Segment):
     def __init__(self, bytes, segment_id, block_size=4096, max_block_count=512):
         super().__init__(segment_id, block_size, max_block_count)
         memview = memoryview(bytes)
-        self._block_bytes = memview[block_size:]
-        summary_bytes = memview[:block_size]
-        self._inode_block_numbers = loads(summary_bytes)
+        self._inode_block_numbers, summary_length = self._load_summary(memview)
+        self._block_bytes = memview[summary_length:]
+
+    def _load_summary(self, memview):
+        '''
+        Returns the summary and the number of bytes it takes up, including
+        padding.
+        '''
+        # Almost every summary fits in the first block, so try that before
+        # reading further into the segment
+        length = self._block_size
+
+        while True:
+            summary_file = BytesIO(memview[:length])
+
+            try:
+                summary = Unpickler(summary_file).load()
+                break
+            except (EOFError, UnpicklingError):
+                if length >= len(memview):
+                    raise
+
+                length *= 2
+
+        summary_blocks = max(1, math.ceil(summary_file.tell() / self._block_size))
+
+        return summary, summary_blocks * self._block_size
 
 
 class ReadWriteSegment(Segment):
@@ -84,7 +119,7 @@ class ReadWriteSegment(Segment):
         super().__init__(segment_id, block_size, max_block_count)
         self._block_bytes = bytearray()
         self._next_block_number = 0
-        self._inode_block_numbers = [] # (inode number, block number)
+        self._inode_block_numbers = [] # (inode number, block number[, slot])
 
     def to_read_only(self):
         return ReadOnlySegment(self.to_bytes(), self._id, self._block_size, self._max_block_count)
@@ -94,6 +129,18 @@ class ReadWriteSegment(Segment):
         self._inode_block_numbers.append((inode_number, block_number))
         return block_number
 
+    def write_inodes(self, block_bytes, inode_numbers):
+        '''
+        Writes a block of packed inodes (see INodeBlock), in which the inode in
+        slot i is inode_numbers[i].
+        '''
+        block_number = self._write_block(block_bytes)
+
+        for slot, inode_number in enumerate(inode_numbers):
+            self._inode_block_numbers.append((inode_number, block_number, slot))
+
+        return block_number
+
     def write_data(self, block_bytes):
         return self._write_block(block_bytes)
 
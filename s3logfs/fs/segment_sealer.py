@@ -0,0 +1,104 @@
+import logging
+from threading import Condition, Thread
+from time import time
+
+
+class SegmentSealer:
+    '''
+    Bounds how long written blocks can stay in the log's current segment,
+    independently of filesystem traffic.
+
+    A background thread wakes every interval seconds and:
+      - calls the checkpoint callback (if given), so that checkpoints are taken
+        on schedule even when no operations arrive. The checks below only see
+        blocks already in the log, so FuseApi's callback also writes and syncs
+        file data and inodes which have been held in memory for max_age
+        seconds (see FuseApi._flush_old_writes).
+      - seals the current segment once no block has been written to it for
+        idle_timeout seconds.
+      - syncs the current segment as a partial segment (see Log.sync) when its
+        oldest unsynced block is more than max_age seconds old, or when more
+        than max_unsynced_bytes are waiting. This bounds staleness for a busy
+        log without sealing segments early.
+
+    A limit of 0 (or None) disables that check.
+    '''
+
+    def __init__(self, log, idle_timeout=0, max_age=0, max_unsynced_bytes=0,
+                 checkpoint=None, interval=1):
+        self._log = log
+        self._idle_timeout = idle_timeout        # In seconds
+        self._max_age = max_age                  # In seconds
+        self._max_unsynced_bytes = max_unsynced_bytes
+        self._checkpoint = checkpoint
+        self._interval = interval                # In seconds
+        self._seal_count = 0
+        self._sync_count = 0
+        self._stopping = False
+        self._stopping_cv = Condition()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def stop(self):
+        with self._stopping_cv:
+            self._stopping = True
+            self._stopping_cv.notify()
+
+        self._thread.join()
+
+    def seal_count(self):
+        return self._seal_count
+
+    def sync_count(self):
+        return self._sync_count
+
+    def check(self, now=None):
+        '''
+        Seals or syncs the current segment if one of the limits is exceeded.
+        This is called periodically by the background thread.
+        '''
+        if now is None:
+            now = time()
+
+        if self._checkpoint:
+            self._checkpoint()
+
+        unsynced_length = self._log.unsynced_length()
+
+        if unsynced_length == 0:
+            return
+
+        last_write_time = self._log.last_write_time()
+        unsynced_since = self._log.unsynced_since()
+
+        if self._idle_timeout and now - last_write_time >= self._idle_timeout:
+            self._log.seal()
+            self._seal_count += 1
+        elif (self._max_age and unsynced_since is not None and
+              now - unsynced_since >= self._max_age) or \
+             (self._max_unsynced_bytes and
+              unsynced_length >= self._max_unsynced_bytes):
+            self._log.sync()
+            self._sync_count += 1
+
+    # Private methods
+
+    def _run(self):
+        while True:
+            with self._stopping_cv:
+                self._stopping_cv.wait_for(lambda: self._stopping, self._interval)
+
+                if self._stopping:
+                    return
+
+            try:
+                self.check()
+            except Exception:
+                # Keep the thread alive, the next check will try again
+                logging.exception('SegmentSealer check failed')
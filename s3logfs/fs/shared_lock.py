@@ -0,0 +1,107 @@
+from contextlib import contextmanager
+from threading import Condition, Lock, get_ident
+
+
+class SharedLock:
+    '''
+    A lock which is either held exclusively by one thread, or shared by any
+    number of threads. Operations which only read the filesystem share it,
+    so that one of them waiting on the backend does not hold up the others,
+    and operations which change it hold it exclusively.
+
+    Both kinds of hold are reentrant, and the thread holding the lock
+    exclusively may also acquire it shared. A thread holding it shared must
+    not acquire it exclusively. Threads waiting to acquire it exclusively
+    are preferred over new shared holders, so that a steady stream of
+    readers cannot keep writers waiting forever.
+
+    Used as a context manager (or with acquire() and release()), the lock
+    is held exclusively, like a threading.RLock. shared() holds it shared.
+    '''
+
+    def __init__(self):
+        self._condition = Condition(Lock())
+        self._owner = None          # thread holding the lock exclusively
+        self._owner_count = 0
+        self._shared_counts = {}    # thread -> number of shared holds
+        self._waiting_count = 0     # threads waiting to hold it exclusively
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def acquire(self, blocking=True):
+        '''
+        Acquires the lock exclusively. Returns False if blocking is False
+        and the lock is held by another thread.
+        '''
+        thread = get_ident()
+
+        with self._condition:
+            if self._owner == thread:
+                self._owner_count += 1
+                return True
+
+            if thread in self._shared_counts:
+                raise RuntimeError('SharedLock cannot be upgraded to exclusive')
+
+            if not blocking and not self._is_free():
+                return False
+
+            self._waiting_count += 1
+            try:
+                self._condition.wait_for(self._is_free)
+            finally:
+                self._waiting_count -= 1
+
+            self._owner = thread
+            self._owner_count = 1
+            return True
+
+    def release(self):
+        with self._condition:
+            if self._owner != get_ident():
+                raise RuntimeError('SharedLock released by a thread which does not hold it')
+
+            self._owner_count -= 1
+            if self._owner_count == 0:
+                self._owner = None
+                self._condition.notify_all()
+
+    def acquire_shared(self):
+        thread = get_ident()
+
+        with self._condition:
+            # a thread which already holds the lock must not wait for the
+            # threads waiting for it
+            if self._owner != thread and thread not in self._shared_counts:
+                self._condition.wait_for(
+                    lambda: self._owner is None and self._waiting_count == 0)
+
+            self._shared_counts[thread] = self._shared_counts.get(thread, 0) + 1
+
+    def release_shared(self):
+        thread = get_ident()
+
+        with self._condition:
+            count = self._shared_counts.pop(thread) - 1
+            if count > 0:
+                self._shared_counts[thread] = count
+            elif not self._shared_counts:
+                self._condition.notify_all()
+
+    @contextmanager
+    def shared(self):
+        self.acquire_shared()
+        try:
+            yield self
+        finally:
+            self.release_shared()
+
+    # Private methods
+
+    def _is_free(self):
+        return self._owner is None and not self._shared_counts
@@ -0,0 +1,105 @@
+from itertools import count
+from statistics import mean
+
+
+class Tracer:
+    '''
+    Records FUSE operations (see FuseApi.wrap_operation) in a ring buffer of
+    the last capacity records, each a tuple of FIELDS:
+
+    - time: when the operation started, in seconds since the epoch
+    - operation: its name, such as 'read'
+    - inode: the inode it was given
+    - size: the number of bytes it was asked to read or write, or 0
+    - latency: the seconds it took
+    - outcome: HIT if it read no segments, READ if it read segments through
+      the backend's caches, and MISS if it was handed to an offload thread
+      because it would have fetched a segment from the bucket
+
+    Operations record from several threads at once without a lock: each
+    claims a slot from an itertools.count, whose next() is atomic.
+
+    The level can be changed while mounted. At OFF nothing is recorded, at
+    ON one in every sample operations is recorded, and at PRINT each of
+    those is also printed as it starts.
+    '''
+
+    OFF = 0
+    ON = 1
+    PRINT = 2
+    LEVELS = {'off': OFF, 'on': ON, 'print': PRINT}
+
+    HIT = 'hit'
+    READ = 'read'
+    MISS = 'miss'
+
+    FIELDS = ('time', 'operation', 'inode', 'size', 'latency', 'outcome')
+
+    def __init__(self, capacity=65536, level=OFF, sample=1):
+        self.level = level
+        self.sample = sample
+        self._records = [None] * capacity
+        self._slots = count()
+        self._operations = count()    # operations seen while sampling
+
+    def sampled(self):
+        '''
+        Returns whether the current operation should be recorded.
+        '''
+        if self.level == self.OFF:
+            return False
+        return self.sample <= 1 or next(self._operations) % self.sample == 0
+
+    def record(self, start, operation, inode, size, latency, outcome):
+        self._records[next(self._slots) % len(self._records)] = \
+            (start, operation, inode, size, latency, outcome)
+
+    def records(self):
+        '''
+        Returns the records in the buffer, oldest first.
+        '''
+        return sorted(record for record in list(self._records) if record is not None)
+
+    def clear(self):
+        self._records = [None] * len(self._records)
+
+    def status(self):
+        return dict(
+            level=next(name for name, level in self.LEVELS.items() if level == self.level),
+            sample=self.sample,
+            records=sum(record is not None for record in self._records),
+            capacity=len(self._records))
+
+    @staticmethod
+    def summarize(records):
+        '''
+        Returns a dict of the count, latency percentiles (in milliseconds),
+        mean size and outcomes of the records of each operation.
+        '''
+        by_operation = {}
+        for record in records:
+            by_operation.setdefault(record[1], []).append(record)
+
+        summary = {}
+        for operation, records in by_operation.items():
+            latencies = sorted(record[4] * 1000 for record in records)
+            outcomes = {}
+            for record in records:
+                outcomes[record[5]] = outcomes.get(record[5], 0) + 1
+
+            summary[operation] = dict(
+                count=len(records),
+                p50=Tracer._percentile(latencies, 0.5),
+                p90=Tracer._percentile(latencies, 0.9),
+                p99=Tracer._percentile(latencies, 0.99),
+                max=latencies[-1],
+                mean_size=mean(record[3] for record in records),
+                outcomes=outcomes)
+
+        return summary
+
+    # Private methods
+
+    @staticmethod
+    def _percentile(ordered, fraction):
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
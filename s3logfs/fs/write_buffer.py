@@ -0,0 +1,132 @@
+from collections import OrderedDict
+from time import time
+
+
+class WriteBuffer:
+    '''
+    Holds written file blocks in memory until they are flushed to the log, so
+    that repeated writes to the same block only reach the log once.
+
+    Blocks are kept per inode, keyed by their block index within the file.
+    Writing a block which is already buffered replaces the written bytes of it
+    in memory; such writes are counted as absorbed. A buffered block may be
+    shorter than a full block, it only extends to the last byte written.
+
+    Inodes are kept in the order in which they first became dirty, so that
+    when the buffer holds more than max_dirty_bytes the owner can flush the
+    oldest ones (see oldest_inode_number()), and those which have been dirty
+    for too long (see inode_numbers_dirty_before()).
+    '''
+
+    def __init__(self, max_dirty_bytes):
+        self._max_dirty_bytes = max_dirty_bytes
+        self._blocks = OrderedDict()  # inode number -> {block index -> bytearray}
+        self._dirty_since = {}        # inode number -> time it became dirty
+        self._dirty_bytes = 0
+        self._write_count = 0
+        self._absorbed_count = 0
+        self._flushed_count = 0
+
+    def write(self, inode_number, block_index, block_bytes, offset=0):
+        '''
+        Writes block_bytes at offset within the block. Any gap between the end
+        of the buffered block and offset is filled with zeros.
+        '''
+        if inode_number not in self._blocks:
+            self._blocks[inode_number] = {}
+            self._dirty_since[inode_number] = time()
+
+        blocks = self._blocks[inode_number]
+        existing = blocks.get(block_index)
+        self._write_count += 1
+
+        if existing is None:
+            existing = blocks[block_index] = bytearray()
+        else:
+            self._absorbed_count += 1
+            self._dirty_bytes -= len(existing)
+
+        if offset > len(existing):
+            existing.extend(bytes(offset - len(existing)))
+        existing[offset:offset + len(block_bytes)] = block_bytes
+        self._dirty_bytes += len(existing)
+
+    def read(self, inode_number, block_index):
+        '''
+        Returns the buffered block, or None if the block is not buffered.
+        '''
+        blocks = self._blocks.get(inode_number)
+
+        if blocks is None:
+            return None
+
+        return blocks.get(block_index)
+
+    def has_blocks(self, inode_number):
+        return inode_number in self._blocks
+
+    def inode_numbers(self):
+        return list(self._blocks.keys())
+
+    def oldest_inode_number(self):
+        return next(iter(self._blocks))
+
+    def inode_numbers_dirty_before(self, before):
+        '''
+        Returns the inodes which became dirty before the time before, oldest
+        first.
+        '''
+        inode_numbers = []
+
+        for inode_number in self._blocks:
+            if self._dirty_since[inode_number] >= before:
+                break
+            inode_numbers.append(inode_number)
+
+        return inode_numbers
+
+    def pop_blocks(self, inode_number):
+        '''
+        Removes the inode's blocks from the buffer and returns them as a list
+        of (block index, block bytes), in block index order.
+        '''
+        blocks = self._blocks.pop(inode_number, {})
+        self._dirty_since.pop(inode_number, None)
+
+        for block in blocks.values():
+            self._dirty_bytes -= len(block)
+
+        self._flushed_count += len(blocks)
+
+        return sorted(blocks.items())
+
+    def discard(self, inode_number, first_block_index=0):
+        '''
+        Drops the inode's blocks from first_block_index onwards without
+        flushing them (for example when a file is truncated).
+        '''
+        blocks = self._blocks.get(inode_number)
+
+        if blocks is None:
+            return
+
+        for block_index in [i for i in blocks if i >= first_block_index]:
+            self._dirty_bytes -= len(blocks.pop(block_index))
+
+        if not blocks:
+            del self._blocks[inode_number]
+            del self._dirty_since[inode_number]
+
+    def is_full(self):
+        return self._dirty_bytes > self._max_dirty_bytes
+
+    def dirty_bytes(self):
+        return self._dirty_bytes
+
+    def stats(self):
+        return dict(
+            dirty_bytes=self._dirty_bytes,
+            dirty_inodes=len(self._blocks),
+            writes=self._write_count,
+            absorbed_writes=self._absorbed_count,
+            flushed_blocks=self._flushed_count)
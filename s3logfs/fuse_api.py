@@ -4,27 +4,103 @@ from __future__ import print_function, absolute_import, division
 import logging
 
 import errno
+import json
 from datetime import datetime
+from os import SEEK_DATA, SEEK_HOLE, replace
 from stat import *
 import math
-from time import time
-from fusell import FUSELL
+from time import perf_counter, time
+from fusell import FUSELL, FUSE_CAP_ASYNC_READ, FUSE_CAP_BIG_WRITES, FUSE_CAP_READDIRPLUS, \
+    FUSE_CAP_WRITEBACK_CACHE
 
 from botocore.exceptions import ClientError
 from collections import deque
+from functools import partial
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, RLock
 
 from .fs import CheckpointRegion
 from .backends import S3Bucket, DiskCache, MemoryCache, BackendError
 from .fs import Log, ReadOnlySegment
 from .fs import INode
 from .fs import BlockAddress
-from .fs import AddressBlock
-
-CONSOLE_OUTPUT = True
+from .fs import INodeAddress
+from .fs import GroupCommit
+from .fs import SegmentSealer
+from .fs import WriteBuffer
+from .fs import INodeCache
+from .fs import IndirectBlockCache
+from .fs import ExtentMap
+from .fs import DirectoryBlock
+from .fs import DentryCache
+from .fs import SharedLock
+from .fs import CacheMiss
+from .fs import Tracer
+
+# getxattr of this name on any inode returns filesystem statistics as JSON
+STATS_XATTR = 'user.s3logfs.stats'
+
+# getxattr of this name on any inode returns the state of the tracer as JSON,
+# and setxattr of it controls the tracer (see FuseApi.trace_command)
+TRACE_XATTR = 'user.s3logfs.trace'
+
+# getxattr of this name on a file returns the [start, end) byte ranges which
+# hold data as JSON, the rest of the file is holes (see FuseApi.seek)
+DATA_RANGES_XATTR = 'user.s3logfs.data_ranges'
 
 class FuseApi(FUSELL):
 
-    def __init__(self, mountpoint, bucket, checkpoint_frequency, encoding='utf-8'):
+    # the address of blocks of a file which have never been written, or were
+    # written as zeros, segment ids start at 1 so it never refers to a block
+    HOLE = BlockAddress()
+
+    # FUSE operations which only read the filesystem. They share self._lock,
+    # so that they run alongside each other with the multithreaded session
+    # loop, and each also holds the lock of the inode it is given (see
+    # wrap_operation). The others hold self._lock exclusively.
+    SHARED_OPERATIONS = frozenset((
+        'lookup', 'getattr', 'read', 'readdir', 'readdirplus', 'readlink',
+        'getxattr', 'listxattr', 'statfs'))
+
+    # FUSE operations which are not given an inode as their first argument
+    # after the request, and so are never offloaded (see wrap_operation)
+    UNQUEUED_OPERATIONS = frozenset(('init', 'destroy'))
+
+    # the position of the requested size among the arguments libfuse passes
+    # to operations which read or write data, recorded by the tracer
+    TRACED_SIZE_ARGUMENTS = dict(read=2, write=3, readdir=2, readdirplus=2)
+
+    # how opening a file updates its access time: always, writing the inode
+    # (strictatime), only when it is older than the last change or a day old
+    # (relatime), in memory only, so it is written with the inode's next
+    # change, an fsync, forget or the next checkpoint (lazytime), or never
+    # (noatime)
+    ATIME_POLICIES = ('strictatime', 'relatime', 'lazytime', 'noatime')
+
+    # relatime updates an access time at least this often, in seconds
+    RELATIME_INTERVAL = 24 * 60 * 60
+
+    # the number of locks inodes are spread over, see _inode_lock
+    INODE_LOCK_COUNT = 64
+
+    # the size of the smallest fuse_direntplus, whose name is padded to 8 bytes
+    MIN_DIRENTPLUS_SIZE = 160
+
+    # when readdirplus finds inodes which are not cached, it also loads the
+    # inodes of up to this many of the following entries in the same batch
+    READDIRPLUS_READAHEAD = 1024
+
+    def __init__(self, mountpoint, bucket, checkpoint_frequency, commit_delay=0,
+                 idle_seal=0, max_dirty_age=0, max_dirty_bytes=0,
+                 write_buffer_size=16 * 2**20, inode_flush_interval=5,
+                 inode_cache_size=16 * 2**20, indirect_cache_size=4 * 2**20,
+                 dentry_cache_size=65536, segment_fetch_threads=8, multithreaded=False,
+                 offload_threads=0, trace_level=Tracer.OFF, trace_sample=1,
+                 trace_capacity=65536, trace_file='/tmp/s3logfs-trace.json',
+                 max_write=128 * 2**10, writeback_cache=False, attr_timeout=1.0,
+                 entry_timeout=1.0, type_timeouts=None, negative_timeout=0.0,
+                 atime='relatime', encoding='utf-8'):
         '''
         This overrides the FUSELL __init__() so that we can set the bucket.
         '''
@@ -32,42 +108,196 @@ class FuseApi(FUSELL):
         self._bucket = bucket
         self._checkpoint_frequency = checkpoint_frequency  # In seconds
 
+        # held for the duration of every FUSE operation, shared by those which
+        # only read and exclusively by the others and by the segment sealer
+        # while it checkpoints
+        self._lock = SharedLock()
+        self._inode_locks = [RLock() for _ in range(self.INODE_LOCK_COUNT)]
+
+        # guards the statistics which operations sharing self._lock update
+        self._stats_lock = Lock()
+
+        # checkpoints are serialized and stored by this thread, in order, so
+        # that operations do not wait for a large inode map to be pickled
+        self._checkpoint_writer = ThreadPoolExecutor(max_workers=1)
+
+        # SHARED_OPERATIONS which would fetch a segment from the backend are
+        # finished by these threads, which reply once the segment arrives,
+        # rather than by the session thread (see wrap_operation). Later
+        # operations on the same inode are queued behind them, so they still
+        # run in the order they arrived. 0 runs every operation in the
+        # session thread.
+        self._offload_threads = offload_threads
+        self._offload_executor = None
+        if offload_threads:
+            self._offload_executor = ThreadPoolExecutor(max_workers=offload_threads)
+        self._offload_queues = {}     # inode number -> deque of operations
+        self._offload_lock = Lock()
+        self._offload_count = 0
+        self._queued_count = 0
+
+        # negotiated with the kernel in init: the largest write it sends, and
+        # whether it caches written pages and sends them to write() merged,
+        # rather than sending each write() call as it is made
+        self._max_write = max_write
+        self._writeback_cache = writeback_cache
+        self._connection = {}         # what was agreed, see init
+
+        # how long the kernel may cache attributes and names before asking
+        # again, by file type (S_IFDIR, S_IFREG, ...) where type_timeouts has
+        # (attr_timeout, entry_timeout) for it, and how long it may cache
+        # that a name does not exist. 0 caches nothing.
+        self._default_timeouts = dict(attr_timeout=attr_timeout, entry_timeout=entry_timeout)
+        self._type_timeouts = {
+            file_type: dict(attr_timeout=timeouts[0], entry_timeout=timeouts[1])
+            for file_type, timeouts in (type_timeouts or {}).items()}
+        self._negative_timeout = negative_timeout
+
+        if atime not in self.ATIME_POLICIES:
+            raise ValueError('atime must be one of ' + ', '.join(self.ATIME_POLICIES))
+        self._atime = atime
+        self._atime_write_count = 0       # access times written to the log
+        self._atime_memory_count = 0      # access times only updated in memory
+
+        # the (last_modified_at, size) of each file when it was last opened,
+        # which decides whether open keeps the kernel's cached pages
+        self._open_versions = {}      # inode number -> (mtime, size)
+
+        # invalidations of the kernel's caches are sent by this thread, as
+        # sending one while handling an operation can deadlock with the
+        # kernel (see invalidate_inode)
+        self._notifier = ThreadPoolExecutor(max_workers=1)
+
+        # records operations when enabled, see wrap_operation, and writes
+        # them to trace_file when asked to dump them (see trace_command)
+        self._tracer = Tracer(trace_capacity, trace_level, trace_sample)
+        self._trace_file = trace_file
+
         self._CR = CheckpointRegion.from_bytes(self._bucket.get_checkpoint())
         self._roll_forward()
         self._log = Log(
             self._CR.next_segment_id(),
             self._bucket,
             self._CR.block_size,
-            self._CR.segment_size
+            self._CR.segment_size,
+            fetch_threads=segment_fetch_threads
+        )
+        self._write_buffer = WriteBuffer(write_buffer_size)
+
+        # holes are read as, and all zero blocks written as, HOLE addresses
+        self._zero_block = bytes(self._CR.block_size)
+        self._hole_write_count = 0
+        self._hole_read_count = 0
+
+        # blocks read so that a partial write to them can be merged in
+        self._rmw_read_count = 0
+
+        # indirect blocks of files being written, they are written to the log
+        # when the file is flushed rather than on every write
+        self._indirect_blocks = IndirectBlockCache(
+            self._log, indirect_cache_size // self._CR.block_size)
+
+        # modified inodes which have not been written to the log yet, they are
+        # written together at most once every inode_flush_interval seconds
+        self._dirty_inodes = {}               # inode number -> INode
+        self._inodes_dirty_since = None
+        self._inode_flush_interval = inode_flush_interval  # In seconds
+        self._inode_update_count = 0
+        self._inode_write_count = 0
+
+        # inodes whose access time has only been updated in memory (lazytime),
+        # they are held here rather than only in the inode cache so that they
+        # are not evicted before they are written
+        self._lazy_inodes = {}                # inode number -> INode
+
+        # decoded inodes, so that loading an inode does not read the log
+        self._inode_cache = INodeCache(inode_cache_size)
+
+        # results of looking up names in directories, including names which
+        # do not exist, kept up to date by add_entry and remove_entry
+        self._dentry_cache = DentryCache(dentry_cache_size)
+
+        # file data and inodes which are older than this are written to the
+        # log by the segment sealer's checks, which then syncs them
+        self._max_dirty_age = max_dirty_age
+
+        self._group_commit = GroupCommit(self._log, commit_delay)
+        self._segment_sealer = SegmentSealer(
+            self._log,
+            idle_timeout=idle_seal,
+            max_age=max_dirty_age,
+            max_unsynced_bytes=max_dirty_bytes,
+            checkpoint=self._checkpoint_in_background
         )
 
-        super().__init__(mountpoint, encoding=encoding)
+        super().__init__(mountpoint, encoding=encoding, multithreaded=multithreaded)
 
     ### FUSE METHODS ###
 
+    def init(self, userdata, conn):
+        # ask for writes of up to max_write bytes, rather than a page at a
+        # time, and for readahead to be sent without waiting for earlier
+        # reads. libfuse lowers max_write to the size of its buffer.
+        # readdirplus and the writeback cache need libfuse 3, libfuse 2 never
+        # offers them to the kernel.
+        wanted = [
+            ('async_read', FUSE_CAP_ASYNC_READ, 'readahead waits for earlier reads'),
+            ('big_writes', FUSE_CAP_BIG_WRITES, 'writes are sent a page at a time'),
+            ('readdirplus', FUSE_CAP_READDIRPLUS, 'directories are listed with readdir')]
+        if self._writeback_cache:
+            wanted.append(('writeback_cache', FUSE_CAP_WRITEBACK_CACHE,
+                           'every write is sent to the filesystem as it is made'))
+
+        for name, capability, without in wanted:
+            if conn.capable & capability:
+                conn.want |= capability
+            else:
+                logging.warning('%s is not supported by libfuse, %s', name, without)
+
+        conn.async_read = int(bool(conn.want & FUSE_CAP_ASYNC_READ))
+        conn.max_write = self._max_write
+
+        self._connection = dict(
+            max_write=conn.max_write,
+            max_readahead=conn.max_readahead,
+            async_read=bool(conn.async_read),
+            big_writes=bool(conn.want & FUSE_CAP_BIG_WRITES),
+            readdirplus=bool(conn.want & FUSE_CAP_READDIRPLUS),
+            writeback_cache=bool(conn.want & FUSE_CAP_WRITEBACK_CACHE))
+
     def destroy(self, userdata):
-        if CONSOLE_OUTPUT:
-            print('FS-DESTROY:', userdata)
         """Clean up filesystem
 
         There's no reply to this method
         """
+        self._segment_sealer.stop()
+        self._group_commit.stop()
+        self._flush_write_buffer()
+        self._flush_indirect_blocks()
+        self._write_lazy_inodes()
+        self._flush_inodes()
         self._log.flush()
         self._save_checkpoint()
+        self._checkpoint_writer.shutdown()
+        self._notifier.shutdown()
 
     def lookup(self, req, parent, name):
-        if CONSOLE_OUTPUT:
-            print("FS-LOOKUP", req, parent, name)
-
         # verify parent inode exists in inode_map lookup
-        if self._CR.inode_exists(parent):
-
-            # load parent inode w/ children
-            parent_inode = self.load_directory(parent)
+        if self.inode_exists(parent):
 
             # load child inode with name, and return entry object with attributes
             try:
-                child_inode_id = int(parent_inode.children[name])
+                child_inode_id = self._dentry_cache.get(parent, name)
+
+                # load parent inode w/ children if the name is not cached
+                if child_inode_id is None:
+                    parent_inode = self.load_directory(parent)
+                    child_inode_id = self.lookup_entry(parent_inode, name)
+                    self._dentry_cache.put(
+                        parent, name, child_inode_id or DentryCache.NEGATIVE)
+
+                if not child_inode_id:
+                    raise KeyError(name)
 
                 # load child inode
                 child_inode = self.load_inode(child_inode_id)
@@ -78,14 +308,19 @@ class FuseApi(FUSELL):
                 entry = dict(
                     ino=child_inode_id,
                     attr=attr,
-                    attr_timeout=1.0,
-                    entry_timeout=1.0)
+                    **self._timeouts(child_inode.mode))
 
                 self.reply_entry(req, entry)
 
             except KeyError:
-                # No such file or directory if no child found
-                self.reply_err(req, errno.ENOENT)
+                # No such file or directory if no child found, an entry with
+                # an inode of 0 lets the kernel cache that the name is missing
+                if self._negative_timeout:
+                    self.reply_entry(req, dict(
+                        ino=0, attr={}, attr_timeout=0.0,
+                        entry_timeout=self._negative_timeout))
+                else:
+                    self.reply_err(req, errno.ENOENT)
             #else:
             #    # No such file or directory if there is no children data
             #    self.reply_err(req, errno.ENOENT)
@@ -94,9 +329,6 @@ class FuseApi(FUSELL):
             self.reply_err(req, errno.ENOENT)
 
     def forget(self, req, ino, nlookup):
-        if CONSOLE_OUTPUT:
-            print('FS-FORGET:', req, ino, nlookup)
-
         # removes inode form inode_map
         # this is done here because the inode must be
         # maintained until all lookups have been cleared, FUSE
@@ -111,9 +343,22 @@ class FuseApi(FUSELL):
         # load inode
         inode = self.load_inode(ino)
         
-        # if hard links == 0 then remove inode
+        # if hard links == 0 then remove inode, and any of its data which
+        # has not been written yet (a new inode may never have been written)
         if inode.hard_links < 1:
-            del self._CR.inode_map[ino]
+            self._CR.remove_inode(ino)
+            self._dirty_inodes.pop(ino, None)
+            self._lazy_inodes.pop(ino, None)
+            self._inode_cache.invalidate(ino)
+            self._indirect_blocks.discard(ino)
+            self._write_buffer.discard(ino)
+
+        # like the kernel writes lazytime timestamps when it evicts an inode
+        else:
+            self._write_lazy_inodes([ino])
+
+        # the kernel has dropped its cached pages along with the inode
+        self._open_versions.pop(ino, None)
 
         # CHECKPOINT
         self._checkpoint_if_necessary()
@@ -121,11 +366,8 @@ class FuseApi(FUSELL):
         self.reply_none(req)
 
     def getattr(self, req, ino, fi):
-        if CONSOLE_OUTPUT:
-            print("FS-GETATTR", req, ino, fi)
-
         # verify inode exists
-        if self._CR.inode_exists(ino):
+        if self.inode_exists(ino):
 
             # LOAD INODE FROM STORAGE (does not need to be type specific)
             inode = self.load_inode(ino)
@@ -135,7 +377,7 @@ class FuseApi(FUSELL):
 
             # make sure attr object is not an empty dict()
             if attr:
-                self.reply_attr(req, attr, 1.0)
+                self.reply_attr(req, attr, self._timeouts(inode.mode)['attr_timeout'])
             else:
                 self.reply_err(req, errno.ENOENT)
         else:
@@ -144,11 +386,8 @@ class FuseApi(FUSELL):
 
 
     def setattr(self, req, ino, attr, to_set, fi):
-        if CONSOLE_OUTPUT:
-            print('FS-SETATTR:', req, ino, attr, to_set, fi)
-
         # verify inode exists
-        if self._CR.inode_exists(ino):
+        if self.inode_exists(ino):
 
             # LOAD INODE FROM STORAGE
             inode = self.load_inode(ino)
@@ -164,7 +403,11 @@ class FuseApi(FUSELL):
                             inode.mode) | S_IMODE(attr["st_mode"])
                         inode.status_last_changed_at = time()
                     elif key == "st_size":
-                        inode.size = attr["st_size"]
+                        if inode.inline_data is not None:
+                            inode.size = attr["st_size"]
+                            self.truncate_inline(inode)
+                        else:
+                            self.truncate_file(inode, attr["st_size"])
                     elif key == "st_blksize":
                         inode.block_size = attr["st_blksize"]
                     elif key == "st_nlink":
@@ -198,7 +441,7 @@ class FuseApi(FUSELL):
                 inode_attr = inode.get_attr()
 
                 # return reply_attr wtih modified inode_attr
-                self.reply_attr(req, inode_attr, 1.0)
+                self.reply_attr(req, inode_attr, self._timeouts(inode.mode)['attr_timeout'])
             else:
                 self.reply_err(req, errno.ENOENT)
         else:
@@ -206,11 +449,8 @@ class FuseApi(FUSELL):
 
 
     def mknod(self, req, parent, name, mode, rdev):
-        if CONSOLE_OUTPUT:
-            print('FS-MKNOD:', req, parent, name,  mode, rdev)
-
         # verify inode exists
-        if self._CR.inode_exists(parent):
+        if self.inode_exists(parent):
 
             # 1. load directory
             directory = self.load_directory(parent)
@@ -239,6 +479,13 @@ class FuseApi(FUSELL):
             # set rdev
             new_node.rdev = rdev
 
+            # - files start with their data inline, and map their blocks with
+            #   extents in an extent layout filesystem once it outgrows the inode
+            if S_ISREG(mode):
+                new_node.inline_data = b''
+                if self._CR.layout == CheckpointRegion.EXTENT_LAYOUT:
+                    new_node.extents = ExtentMap()
+
             # 4. WRITE NEW NODE
             self.write_inode(new_node)
 
@@ -246,12 +493,9 @@ class FuseApi(FUSELL):
             # - increment hard_links by 1
 #            directory.hard_links += 1
 
-            # - add new node to directory
-            directory.children[name] = new_node.inode_number
-
-            # 5. WRITE PARENT AND UPDATE INODE_MAP
-            # - write parent data to log
-            self.write_directory(directory)
+            # 5. ADD NEW NODE TO PARENT
+            # - writes the parent's changed directory block and inode
+            self.add_entry(directory, name, new_node.inode_number, new_node.mode)
  
             # 6. checkpoint if needed
             self._checkpoint_if_necessary()
@@ -264,8 +508,7 @@ class FuseApi(FUSELL):
                 # - create entry
                 entry = dict(ino=new_node.inode_number,
                              attr=attr,
-                             attr_timeout=1.0,
-                             entry_timeout=1.0)
+                             **self._timeouts(new_node.mode))
                 # reply with entry
                 self.reply_entry(req, entry)
             else:
@@ -277,11 +520,8 @@ class FuseApi(FUSELL):
 
 
     def mkdir(self, req, parent, name, mode):
-        if CONSOLE_OUTPUT:
-            print('FS-MKDIR:', parent, name, mode)
-
         # verify inode exists
-        if self._CR.inode_exists(parent):
+        if self.inode_exists(parent):
 
             # 1. LOAD CURRENT DIRECTORY w/ children
             current_directory = self.load_directory(parent)
@@ -320,14 +560,15 @@ class FuseApi(FUSELL):
             # - increment hard_links by 1
 #            current_directory.hard_links += 1
 
-            # - add new directory to children
-            current_directory.children[name] = newdir.inode_number
+            # - new directories start with a single empty directory block
+            newdir.entry_count = 0
+            newdir.inline_data = b''
 
             # 4. WRITE NEW DIRECTORY AND UPDATE INODE_MAP
-            self.write_directory(newdir)
+            self.write_inode(newdir)
 
-            # 5. WRITE PARENT AND UPDATE INODE_MAP
-            self.write_directory(current_directory)
+            # 5. ADD NEW DIRECTORY TO PARENT
+            self.add_entry(current_directory, name, newdir.inode_number, newdir.mode)
 
             # 6. CHECKPOINT
             self._checkpoint_if_necessary()
@@ -340,8 +581,7 @@ class FuseApi(FUSELL):
                 # - create entry
                 entry = dict(ino=newdir.inode_number,
                              attr=attr,
-                             attr_timeout=1.0,
-                             entry_timeout=1.0)
+                             **self._timeouts(newdir.mode))
                 # reply with entry
                 self.reply_entry(req, entry)
             else:
@@ -352,20 +592,14 @@ class FuseApi(FUSELL):
             self.reply_err(req, errno.EIO)
 
     def unlink(self, req, parent, name):
-        if CONSOLE_OUTPUT:
-            print('FS-UNLINK:', req, parent, name)
-
         # verify inode exists
-        if self._CR.inode_exists(parent):
+        if self.inode_exists(parent):
 
             # 1. LOAD DIRECTORY
             directory = self.load_directory(parent)
 
-            # remove inode from parents children
-            inode_id = directory.children.pop(name)
-
-            # write directory
-            self.write_directory(directory)
+            # remove inode from parents children, writing the directory
+            inode_id = self.remove_entry(directory, name)
 
             # update inode, decrement hard link and update last changed
             inode = self.load_inode(inode_id)
@@ -386,23 +620,20 @@ class FuseApi(FUSELL):
             self.reply_err(req, errno.EIO)
 
     def rmdir(self, req, parent, name):
-        if CONSOLE_OUTPUT:
-            print("FS-RMDIR:", req, parent, name)
-
         # verify inode exists
-        if self._CR.inode_exists(parent):
+        if self.inode_exists(parent):
 
             # 1. LOAD CURRENT DIRECTORY
             current_directory = self.load_directory(parent)
 
             # remove directory from parents children
-            inode = current_directory.children.pop(name)
+            inode = self.remove_entry(current_directory, name)
 
             # decrement parent hard_links
             current_directory.hard_links -= 1
 
             # write current directory
-            self.write_directory(current_directory)
+            self.write_inode(current_directory)
 
             # CHECKPOINT
             self._checkpoint_if_necessary()
@@ -415,9 +646,6 @@ class FuseApi(FUSELL):
             self.reply_err(req, errno.EIO)
 
     def rename(self, req, parent, name, newparent, newname):
-        if CONSOLE_OUTPUT:
-            print('FS-RENAME:', req, parent, name, newparent, newname)
-
         # load current directory
         current_directory = self.load_directory(parent)
 
@@ -426,13 +654,10 @@ class FuseApi(FUSELL):
         if (parent == newparent):
 
             # pop child with name from parent
-            inode = current_directory.children.pop(name)
+            inode = self.remove_entry(current_directory, name)
 
             # add child with newname to parent's children
-            current_directory.children[newname] = inode
-
-            # write current directory
-            self.write_directory(current_directory)
+            self.add_entry(current_directory, newname, inode, self.load_inode(inode).mode)
 
         else:
 
@@ -440,16 +665,10 @@ class FuseApi(FUSELL):
             new_directory = self.load_directory(newparent)
 
             # remove child with name from current directory
-            inode = current_directory.children.pop(name)
+            inode = self.remove_entry(current_directory, name)
 
             # add child with newname to newparent
-            new_directory.children[newname] = inode
-
-            # write current directory
-            self.write_directory(current_directory)
-
-            # write newparent data
-            self.write_directory(new_directory)
+            self.add_entry(new_directory, newname, inode, self.load_inode(inode).mode)
 
         # checkpoint
         self._checkpoint_if_necessary()
@@ -459,15 +678,9 @@ class FuseApi(FUSELL):
 
 
     def link(self, req, ino, newparent, newname):
-        if CONSOLE_OUTPUT:
-            print('FS-LINK:', req, ino, newparent, newname)
-
         # 1. LOAD DIRECTORY
         directory = self.load_directory(newparent)
 
-        # - add newname to directory
-        directory.children[newname] = ino
-
         # - increase directory hard links
 #        directory.hard_links += 1
 
@@ -481,8 +694,8 @@ class FuseApi(FUSELL):
         # 3. WRITE TARGET FILE INODE
         self.write_inode(target_file)
 
-        # 4. WRITE DIRECTORY TO LOG & UPDATE inode map
-        self.write_directory(directory)
+        # 4. ADD NEWNAME TO DIRECTORY, WRITING IT TO THE LOG
+        self.add_entry(directory, newname, ino, target_file.mode)
 
         # 5. CHECKPOINT
         self._checkpoint_if_necessary()
@@ -494,40 +707,35 @@ class FuseApi(FUSELL):
             # - create entry
             entry = dict(ino=target_file.inode_number,
                          attr=attr,
-                         attr_timeout=1.0,
-                         entry_timeout=1.0)
+                         **self._timeouts(target_file.mode))
             # reply with entry
             self.reply_entry(req, entry)
         else:
             return dict()
 
     def open(self, req, ino, fi):
-        if CONSOLE_OUTPUT:
-            print('FS-OPEN:', req, ino)
-
         # verify inode exists, return open reply or error
-        if self._CR.inode_exists(ino):
+        if self.inode_exists(ino):
 
             # load inode
             inode = self.load_inode(ino)
 
-            # update access time
-            now = time()
-            inode.last_accessed_at = now
+            # update access time, as the atime policy allows
+            self._update_atime(inode)
 
-            # write inode
-            self.write_inode(inode)
+            # the kernel may keep the pages it cached while the file was open
+            # before if the file has not changed since
+            version = (inode.last_modified_at, inode.size)
+            fi['keep_cache'] = int(self._open_versions.get(ino) == version)
+            self._open_versions[ino] = version
 
             self.reply_open(req, fi)
         else:
             self.reply_err(req, errno.EIO)
 
     def read(self, req, ino, size, off, fi):
-        if CONSOLE_OUTPUT:
-            print('FS-READ:', req, ino, size, off)
-
         # verify inode exists
-        if self._CR.inode_exists(ino):
+        if self.inode_exists(ino):
 
             # 1. LOAD INODE
             inode = self.load_inode(ino)
@@ -547,11 +755,8 @@ class FuseApi(FUSELL):
             self.reply_err(req, errno.ENOENT)
 
     def write(self, req, ino, buf, off, fi):
-        if CONSOLE_OUTPUT:
-            print('FS-WRITE:', req, ino, len(buf), off)
-
         # verify inode exists
-        if self._CR.inode_exists(ino):
+        if self.inode_exists(ino):
 
             # 1. LOAD FILE
             inode = self.load_inode(ino)
@@ -570,41 +775,24 @@ class FuseApi(FUSELL):
             self.reply_err(req, errno.ENOENT)
 
     def readdir(self, req, ino, size, off, fi):
-        if CONSOLE_OUTPUT:
-            print('FS-READDIR:', req, ino, size, off, fi)
-
         # 1. LOAD DIRECTORY INODE
         directory = self.load_directory(ino)
 
-        # 2. BUILD DEFUALT LIST OF ENTRIES
-        entries = [
-            ('.', {'st_ino': directory.inode_number, 'st_mode': S_IFDIR}),
-            ('..', {'st_ino': directory.parent, 'st_mode': S_IFDIR})]
+        # 2. REPLY WITH THE ENTRIES FROM OFF
+        # - only the entries which fit in size are read, and the file type
+        #   of each comes from its entry rather than its inode
+        self.reply_readdir_entries(req, size, self._readdir_entries(directory, off))
 
-        # 3. ADD CHILDREN TO LIST
-        for k, v in directory.children.items():
-            # when trying to load inode, if it fails because
-            # it is not in the inode_map, we don't want to include
-            # it with the entries
-            try:
-                # load child inode
-                child_inode = self.load_inode(int(v))
-                # get child name
-                child_name = k
-                # set attr object
-                child_attr = child_inode.get_attr()
-                # add inode/attr to entries
-                entries.append((child_name, child_attr))
-            except KeyError:
-                print("INode (", inode_id, ") not found in inode_map!")
-                self.reply_err(req, errno.EIO)
+    def readdirplus(self, req, ino, size, off, fi):
+        # 1. LOAD DIRECTORY INODE
+        directory = self.load_directory(ino)
 
-        self.reply_readdir(req, size, off, entries)
+        # 2. REPLY WITH THE ENTRIES FROM OFF AND THEIR ATTRIBUTES
+        # - the inodes of the entries are loaded in batches
+        self.reply_readdirplus_entries(
+            req, size, self._readdirplus_entries(directory, size, off))
 
     def symlink(self, req, link, parent, name):
-        if CONSOLE_OUTPUT:
-            print('FS-SYMLINK:', req, link, parent, name)
-
         # create symlink inode
         link_node = INode()
         link_node.inode_number = self._CR.next_inode_id()
@@ -632,11 +820,8 @@ class FuseApi(FUSELL):
         # load directory
         directory = self.load_directory(parent)
         
-        # update parent
-        directory.children[name] = link_node.inode_number
-
-        # write directory to log
-        self.write_directory(directory)
+        # update parent, writing it to the log
+        self.add_entry(directory, name, link_node.inode_number, link_node.mode)
 
         # - get newdir attr object
         attr = link_node.get_attr()
@@ -645,8 +830,7 @@ class FuseApi(FUSELL):
             # - create entry
             entry = dict(ino=link_node.inode_number,
                          attr=attr,
-                         attr_timeout=1.0,
-                         entry_timeout=1.0)
+                         **self._timeouts(link_node.mode))
             # reply with entry
             self.reply_entry(req, entry)
         else:
@@ -655,9 +839,6 @@ class FuseApi(FUSELL):
 
 
     def readlink(self, req, ino):
-        if CONSOLE_OUTPUT:
-            print('FS-READLINK::', req, ino)
-
         # load inode
         inode = self.load_inode(ino)
 
@@ -673,11 +854,11 @@ class FuseApi(FUSELL):
     # ************
 
     def release(self, req, ino, fi):
-        if CONSOLE_OUTPUT:
-            print('FS-RELEASE:', req, ino, fi)
-
-        # for the type of file system we have , we won't need to implement
-        # this function beyond checking if a checkpoint is necessary.
+        # write any buffered blocks of the file, its indirect blocks and its
+        # inode to the log
+        self.flush_file(ino)
+        self.flush_indirect(ino, discard=True)
+        self._flush_inode(ino)
 
         self._checkpoint_if_necessary()
 
@@ -685,16 +866,10 @@ class FuseApi(FUSELL):
         self.reply_err(req, 0)
 
     def flush(self, req, ino, fi):
-        if CONSOLE_OUTPUT:
-            print('FS-FLUSH:', req, ino, fi)
-
         # error because its not implemented
         self.reply_err(req, errno.ENOSYS)
 
     def statfs(self, req, ino):
-        if CONSOLE_OUTPUT:
-            print('statfs:', req, ino)
-
         stat_fs_info = dict()
         stat_fs_info["f_bavail"] = 0
         stat_fs_info["f_bfree"] = 0
@@ -714,84 +889,426 @@ class FuseApi(FUSELL):
         self.reply_err(req, errno.ENOSYS)
 
     def listxattr(self, req, ino, size):
-        if CONSOLE_OUTPUT:
-            print('listxattr:', req, ino, size)
-
         # error because its not implemented
         self.reply_err(req, errno.ENOTSUP)
 
-    def setxattr(self, req, ino, name, value, size, flags):
-        if CONSOLE_OUTPUT:
-            print('setxattr:', req, ino, name, value, size, flags)
+    def setxattr(self, req, ino, name, value, flags):
+        if name == TRACE_XATTR:
+            try:
+                self.trace_command(value.decode('utf-8'))
+            except ValueError:
+                self.reply_err(req, errno.EINVAL)
+            else:
+                self.reply_err(req, 0)
+            return
 
         # error because its not implemented
         self.reply_err(req, errno.ENOTSUP)
 
     def getxattr(self, req, ino, name, size):
-        if CONSOLE_OUTPUT:
-            print('getxattr:', req, ino, name, size)
-
-        # error because its not implemented
-        self.reply_err(req, errno.ENOTSUP)
+        if name == STATS_XATTR:
+            value = json.dumps(self.stats(), sort_keys=True).encode('utf-8')
+        elif name == TRACE_XATTR:
+            status = dict(self._tracer.status(), file=self._trace_file)
+            value = json.dumps(status, sort_keys=True).encode('utf-8')
+        elif name == DATA_RANGES_XATTR and self.inode_exists(ino):
+            ranges = self.data_ranges(self.load_inode(ino))
+            value = json.dumps(ranges).encode('utf-8')
+        else:
+            # error because its not implemented
+            self.reply_err(req, errno.ENOTSUP)
+            return
+
+        # a size of 0 asks for the size of the value
+        if size == 0:
+            self.reply_xattr(req, len(value))
+        elif size < len(value):
+            self.reply_err(req, errno.ERANGE)
+        else:
+            self.reply_buf(req, value)
 
     def removexattr(self, req, ino, name):
-        if CONSOLE_OUTPUT:
-            print('removexattr:', req, ino, name)
-
         # error because its not implemented
         self.reply_err(req, errno.ENOSYS)
 
     def fsync(self, req, ino, datasync, fi):
-        """Synchronize file contents
+        # write any buffered blocks of the file to the log, followed by every
+        # modified inode so that the directory entries of a new file are
+        # durable along with it
+        self.flush_file(ino)
+        self.flush_indirect(ino)
+        self._write_lazy_inodes([ino])
+        self._flush_inodes()
+
+        # the reply is sent by the group commit thread once the log has been
+        # synced, fsyncs which arrive close together share a single sync
+        self._group_commit.request(
+            lambda error: self.reply_err(req, errno.EIO if error else 0))
+
+    def fsyncdir(self, req, ino, datasync, fi):
+        # directory blocks are written to the log as soon as they change, only
+        # the indirect blocks of large directories and the modified inodes
+        # need to be written first
+        self.flush_indirect(ino)
+        self._flush_inodes()
+
+        self._group_commit.request(
+            lambda error: self.reply_err(req, errno.EIO if error else 0))
+
+
+    # returns statistics from the filesystem's caches and buffers
+    def stats(self):
+        return dict(
+            write_buffer=self._write_buffer.stats(),
+            inodes=dict(
+                dirty=len(self._dirty_inodes),
+                updates=self._inode_update_count,
+                writes=self._inode_write_count),
+            connection=self._connection,
+            atime=dict(
+                policy=self._atime,
+                written=self._atime_write_count,
+                in_memory=self._atime_memory_count,
+                unwritten_inodes=len(self._lazy_inodes)),
+            inode_cache=self._inode_cache.stats(),
+            dentry_cache=self._dentry_cache.stats(),
+            batch_fetched_segments=self._log.fetched_segment_count(),
+            offload=dict(
+                cache_misses=self._offload_count,
+                queued=self._queued_count,
+                pending_inodes=len(self._offload_queues)),
+            indirect_blocks=self._indirect_blocks.stats(),
+            partial_block_reads=self._rmw_read_count,
+            holes=dict(
+                written_blocks=self._hole_write_count,
+                read_blocks=self._hole_read_count),
+            group_commit=dict(
+                requests=self._group_commit.request_count(),
+                commits=self._group_commit.commit_count()),
+            segment_sealer=dict(
+                seals=self._segment_sealer.seal_count(),
+                syncs=self._segment_sealer.sync_count()))
+
+    def wrap_operation(self, name, method):
+        '''
+        Runs every FUSE operation while holding self._lock, so that they do
+        not interleave with checkpoints taken by the segment sealer thread.
+        SHARED_OPERATIONS share it and hold the lock of their inode (the first
+        argument after the request), the others hold it exclusively.
+
+        Each operation is recorded by the tracer when it is sampled (see
+        _traced).
+
+        With offload threads, SHARED_OPERATIONS first run reading only cached
+        segments, and are handed to an offload thread if they miss. Any
+        operation on an inode with offloaded operations still queued is
+        queued behind them.
+        '''
+        if name in self.SHARED_OPERATIONS:
+            def operation(*args):
+                with self._lock.shared(), self._inode_lock(args[1]):
+                    return method(*args)
+        else:
+            def operation(*args):
+                with self._lock:
+                    return method(*args)
 
-        Valid replies:
-            reply_err
-        """
+        operation = self._traced(name, operation)
 
-        self._log.flush()
+        if not self._offload_threads:
+            return operation
 
+        if name == 'destroy':
+            def destroy_operation(*args):
+                # offloaded operations need self._lock, so they are
+                # finished before destroy holds it
+                self._offload_executor.shutdown()
+                return operation(*args)
 
-### Helper methods ###
+            return destroy_operation
 
-    # this method will load a directory inode from the log
-    # it can optionally not load children if they are not needed
-    def load_directory(self, inode_id, load_children=True):
+        if name in self.UNQUEUED_OPERATIONS:
+            return operation
 
-        # load inode from inode_id
-        inode = self.load_inode(inode_id)
+        def offloading_operation(*args):
+            inode_id = self._operation_inode(name, args)
+            if self._queue_behind_offloaded(inode_id, partial(operation, *args)):
+                return
 
-        # load directory data and set children
-        if load_children:
-            data = bytearray()
-            for x in range(int(inode.size / inode.block_size)):
-                data = self.read_data_block(inode, data, x)
-
-            if len(bytes(data)) > 0:
-                inode.bytes_to_children(bytes(data))
-
-        # return created inode
-        return inode
+            if name not in self.SHARED_OPERATIONS:
+                return operation(*args)
 
-    # this method will write a directory inode to the log
-    def write_directory(self, inode, write_children=True):
-        
-        # there could be situations where the contents of a directory do not
-        # change, but its attributes do.
-        if write_children:
+            try:
+                with self._log.cached_only():
+                    return operation(*args)
+            except CacheMiss:
+                self._offload(inode_id, partial(operation, *args))
+
+        return offloading_operation
+
+    # makes the kernel drop its cached attributes and pages of an inode, for
+    # code which changes a file other than through a FUSE operation. The
+    # invalidation is sent later by the notifier thread, so this can be
+    # called while handling an operation.
+    def invalidate_inode(self, inode_id):
+        self._open_versions.pop(inode_id, None)
+        self._notifier.submit(self._notify, self.notify_inval_inode, inode_id, 0, 0)
+
+    # makes the kernel drop its cached entry for a name in a directory, or
+    # that the name does not exist, like invalidate_inode
+    def invalidate_entry(self, parent_id, name):
+        self._notifier.submit(self._notify, self.notify_inval_entry, parent_id, name)
+
+    # runs a command given by setxattr of TRACE_XATTR: a level (off, on or
+    # print), "sample N" to record one in every N operations, "clear" to
+    # empty the buffer or "dump" to write its records to the trace file.
+    # Raises ValueError for any other command.
+    def trace_command(self, command):
+        words = command.split()
+
+        if len(words) == 1 and words[0] in Tracer.LEVELS:
+            self._tracer.level = Tracer.LEVELS[words[0]]
+        elif len(words) == 2 and words[0] == 'sample' and int(words[1]) > 0:
+            self._tracer.sample = int(words[1])
+        elif words == ['clear']:
+            self._tracer.clear()
+        elif words == ['dump']:
+            records = dict(fields=Tracer.FIELDS, records=self._tracer.records())
+            with open(self._trace_file + '.tmp', 'w') as f:
+                json.dump(records, f)
+            replace(self._trace_file + '.tmp', self._trace_file)
+        else:
+            raise ValueError(command)
 
-            # get inode data & set size/block_count attributes
-            data = inode.children_to_bytes()
-            number_blocks = math.ceil(len(data)/self._log.get_block_size())
+### Helper methods ###
 
-            # directory size is always an increment of system block_size (page_size)
-            inode.size = number_blocks * self._log.get_block_size()
+    # updates the access time of an opened file according to the atime policy
+    # (see ATIME_POLICIES), and writes the inode only if the policy needs it
+    def _update_atime(self, inode):
+        if self._atime == 'noatime':
+            return
 
-            # iterate through data block by block and write to log
-            for x in range(number_blocks):
-                inode = self.write_data_block(inode, data, x)
+        now = time()
+        if self._atime == 'relatime' and \
+           inode.last_accessed_at > inode.last_modified_at and \
+           inode.last_accessed_at > inode.status_last_changed_at and \
+           now - inode.last_accessed_at < self.RELATIME_INTERVAL:
+            return
+
+        inode.last_accessed_at = now
+
+        # the inode is not marked dirty, but is kept until it is written (see
+        # _write_lazy_inodes) unless it already is dirty
+        if self._atime == 'lazytime':
+            if inode.inode_number not in self._dirty_inodes:
+                self._lazy_inodes[inode.inode_number] = inode
+            self._atime_memory_count += 1
+            return
 
-        # - write inode to log
         self.write_inode(inode)
+        self._atime_write_count += 1
+
+    # returns the attr_timeout and entry_timeout of an inode of the given mode
+    def _timeouts(self, mode):
+        return self._type_timeouts.get(S_IFMT(mode), self._default_timeouts)
+
+    # sends an invalidation to the kernel, which reports ENOENT if it does not
+    # have the inode or entry cached
+    @staticmethod
+    def _notify(notify, *args):
+        error = notify(*args)
+        if error and error != -errno.ENOENT:
+            logging.warning('kernel cache invalidation %s%s failed: %d',
+                            notify.__name__, args, error)
+
+    # returns the inode an operation is given, the first argument after the
+    # request except for symlink, or 0 for operations without one
+    def _operation_inode(self, name, args):
+        if name in self.UNQUEUED_OPERATIONS:
+            return 0
+        return args[2] if name == 'symlink' else args[1]
+
+    # returns an operation which records its latency and whether it read any
+    # segments in self._tracer, when the tracer samples it
+    def _traced(self, name, operation):
+        tracer = self._tracer
+        size_index = self.TRACED_SIZE_ARGUMENTS.get(name)
+
+        def traced_operation(*args):
+            if not tracer.sampled():
+                return operation(*args)
+
+            if tracer.level == Tracer.PRINT:
+                print('FS-%s:' % name.upper(), *args)
+
+            outcome = None
+            segment_reads = self._log.thread_segment_reads()
+            start, started = time(), perf_counter()
+            try:
+                return operation(*args)
+            except CacheMiss:
+                outcome = Tracer.MISS
+                raise
+            finally:
+                if outcome is None:
+                    read = self._log.thread_segment_reads() != segment_reads
+                    outcome = Tracer.READ if read else Tracer.HIT
+                tracer.record(start, name, self._operation_inode(name, args),
+                              args[size_index] if size_index else 0,
+                              perf_counter() - started, outcome)
+
+        return traced_operation
+
+    # queues an operation behind those already offloaded for an inode,
+    # returns False without queuing it if there are none
+    def _queue_behind_offloaded(self, inode_id, operation):
+        with self._offload_lock:
+            queue = self._offload_queues.get(inode_id)
+            if queue is None:
+                return False
+
+            queue.append(operation)
+            self._queued_count += 1
+            return True
+
+    # runs an operation which missed the segment caches in an offload thread,
+    # after any operations already offloaded for the same inode
+    def _offload(self, inode_id, operation):
+        with self._offload_lock:
+            self._offload_count += 1
+            queue = self._offload_queues.get(inode_id)
+            if queue is not None:
+                queue.append(operation)
+                return
+
+            self._offload_queues[inode_id] = deque([operation])
+
+        self._offload_executor.submit(self._run_offloaded, inode_id)
+
+    # runs the operations queued for an inode in order, until there are none
+    def _run_offloaded(self, inode_id):
+        while True:
+            with self._offload_lock:
+                queue = self._offload_queues[inode_id]
+                if not queue:
+                    del self._offload_queues[inode_id]
+                    return
+
+                operation = queue.popleft()
+
+            try:
+                operation()
+            except Exception:
+                # the request is left without a reply, as it would be had
+                # the operation raised in the session thread
+                logging.exception('offloaded FUSE operation failed')
+
+    # returns the lock of an inode, which is shared with the inodes whose
+    # numbers are congruent to it modulo INODE_LOCK_COUNT
+    def _inode_lock(self, inode_id):
+        return self._inode_locks[inode_id % self.INODE_LOCK_COUNT]
+
+    # this method will load a directory inode from the log. Hashed
+    # directories are read a block at a time by lookup_entry and
+    # directory_entries, and directories in the original pickled format
+    # whole by legacy_children.
+    def load_directory(self, inode_id):
+        return self.load_inode(inode_id)
+
+    # returns the children of a directory in the original pickled format as
+    # a new dict. They are not kept on the inode, which is shared by the
+    # operations running alongside each other under the shared lock.
+    def legacy_children(self, directory):
+        if directory.inline_data is not None:
+            data = directory.inline_data
+        else:
+            data = bytearray()
+            for x in range(int(directory.size / directory.block_size)):
+                data = self.read_data_block(directory, data, x)
+
+        if len(data) == 0:
+            return {}
+        return INode.children_from_bytes(bytes(data))
+
+    # returns the inode number of the named entry of a directory, or None
+    def lookup_entry(self, directory, name):
+        if not directory.is_hashed_directory():
+            return self.legacy_children(directory).get(name)
+
+        index = DirectoryBlock.bucket_index(
+            DirectoryBlock.hash_name(name), self._bucket_count(directory))
+        return self._read_bucket(directory, index).get(name)
+
+    # yields the entries of a directory from position on as (name, inode
+    # number, file type, position of the following entry). Entries are in
+    # order of their position (see DirectoryBlock), which does not change
+    # when other entries are added or removed, and the buckets each hold a
+    # range of positions, so listing a directory in chunks only reads the
+    # buckets of each chunk.
+    def directory_entries(self, directory, position=0):
+        while position is not None:
+            if directory.is_hashed_directory():
+                count = self._bucket_count(directory)
+                index = DirectoryBlock.position_bucket(position, count)
+                bucket = self._read_bucket(directory, index)
+                entries, file_types = bucket.entries, bucket.file_types
+                end = DirectoryBlock.bucket_end(index, count)
+            else:
+                entries, file_types, end = self.legacy_children(directory), {}, None
+
+            for entry_position, name in DirectoryBlock.entry_positions(entries):
+                if entry_position >= position:
+                    yield (name, entries[name],
+                           file_types.get(name, DirectoryBlock.UNKNOWN_TYPE),
+                           entry_position + 1)
+
+            position = end
+
+    # adds (or replaces) an entry of a directory, writing the changed
+    # directory block and the directory's inode. mode is the st_mode of the
+    # entry's inode, whose file type is stored with the entry.
+    def add_entry(self, directory, name, inode_id, mode):
+        if not directory.is_hashed_directory():
+            self._convert_directory(directory)
+
+        name_hash = DirectoryBlock.hash_name(name)
+
+        # split buckets until the entry's bucket has room for it
+        while True:
+            index, bucket = self._find_bucket(directory, name_hash)
+            is_new = bucket.get(name) is None
+            if bucket.add(name, inode_id, DirectoryBlock.file_type(mode)):
+                break
+            self._split_bucket(directory)
+
+        self._write_bucket(directory, index, bucket)
+        self._dentry_cache.put(directory.inode_number, name, inode_id)
+        if is_new:
+            directory.entry_count += 1
+
+        # grow the directory by a bucket whenever one is more than 3/4 full,
+        # so that inserts rarely find their bucket full
+        if bucket.used_bytes() > self._log.get_block_size() * 3 // 4:
+            self._split_bucket(directory)
+
+        self.write_inode(directory)
+
+    # removes an entry of a directory and returns its inode number, writing
+    # the changed directory block and the directory's inode. Raises KeyError
+    # if there is no such entry.
+    def remove_entry(self, directory, name):
+        if not directory.is_hashed_directory():
+            self._convert_directory(directory)
+
+        index, bucket = self._find_bucket(directory, DirectoryBlock.hash_name(name))
+        inode_id = bucket.remove(name)
+
+        self._write_bucket(directory, index, bucket)
+        self._dentry_cache.put(directory.inode_number, name, DentryCache.NEGATIVE)
+        directory.entry_count -= 1
+        self.write_inode(directory)
+
+        return inode_id
 
     # this method will write a directory inode to the log
     def write_symlink(self, inode, link):
@@ -803,14 +1320,22 @@ class FuseApi(FUSELL):
         # directory size is always an increment of system block_size (page_size)
         inode.size = len(data)
 
-        # iterate through data block by block and write to log
-        for x in range(number_blocks):
-            inode = self.write_data_block(inode, data, x)
+        # short targets are kept in the inode, so following them needs no
+        # data block
+        if len(data) <= INode.max_inline_size(self._log.get_block_size()):
+            inode.set_inline_data(data)
+        else:
+            # iterate through data block by block and write to log
+            for x in range(number_blocks):
+                inode = self.write_data_block(inode, data, x)
 
         # - write inode to log
         self.write_inode(inode)
 
     def read_symlink(self, inode):
+        if inode.inline_data is not None:
+            return inode.inline_data.decode('utf-8')
+
         block_count = math.ceil(inode.size / self._log.get_block_size())
         data = bytearray()
         for x in range(block_count):
@@ -820,449 +1345,351 @@ class FuseApi(FUSELL):
         
         return link
 
-    # read_indirect
-    def read_indirect(self, block_addresses, offsets, block_count):
-
-        # just to make the code cleaner 
-        block_size = self._log.get_block_size()
-        address_size = BlockAddress.get_address_size()
-
-        # load data at block_addresses into AddressBlock object
-        indirect_data = bytearray()
-        for addr in block_addresses:
-
-            # if address is 0,0 load a block of zeros, otherwise load from log
-            if addr == BlockAddress():
-                indirect_data.extend(b'\00' * block_size)
-            else:
-                indirect_data.extend(self._log.read_block(addr))
-
-        indirect_ab = AddressBlock(bytes(indirect_data))
-
-        # set start offest for this layer, and remove it from offests
-        # this decrementation will stop the recursive loop
-        start_offset = offsets.pop()
-
-        # if len(offsets) > 0 , then there are more layers to process
-        if len(offsets) > 0:
-
-            ## BCH - I expet the issue with lvl3 offsets is within 
-            ##       the read logic below, and how the read_count
-            ##       is calculated
-
-            # calcluate number of block units per address at this level 
-            block_units = (block_size // address_size)**len(offsets)
-
-            next_offset = offsets[len(offsets)-1]
-
-            # calculate number of addresess to read, limited to max 
-            read_count = math.ceil((next_offset + block_count) / block_units)
-            if read_count > (indirect_ab.get_max_offset() - start_offset):
-                read_count = indirect_ab.get_max_offset() - start_offset
-
-            # get block_addresses from indirect_data for next layer
-            next_block_addresses = deque()
-            for x in range(read_count):
-                addr = indirect_ab.get_address(start_offset + x)
-                next_block_addresses.append(addr)
-
-            # call read_indirect, just return results which will be data addresses
-            return self.read_indirect(next_block_addresses, offsets, block_count)
-
-        else:
-
-            # read block_count addresses from offset in indirect_ab
-            next_block_addresses = deque()
-            for x in range(block_count):
-                addr = indirect_ab.get_address(start_offset + x)
-                next_block_addresses.append(addr)                
-
-            return next_block_addresses
-
-
     # read_file - will return data from a file, based on the size an offset
     def read_file(self, inode, size, off):
 
-        data = bytearray()
+        # reads stop at the end of the file
+        size = min(size, inode.size - off)
 
-        if size>0:
+        # small files are served from the inode
+        if inode.inline_data is not None:
+            return inode.inline_data[off:off + size]
 
-            # determine number of blocks of data to read based on requested size
-            block_count = math.ceil(size / self._log.get_block_size())
-
-            # define file_offset , offset should be divisible by our block_size
-            initial_offset = off // self._log.get_block_size()
-
-            # get list of addresses that need to be read
-            addresses = deque()
-
-            # offset will increment as we work our way through the direct/indirect
-            # address
-            offset = initial_offset
-            block_size = self._log.get_block_size()
-            address_size = BlockAddress.get_address_size()
-            direct_count = inode.NUMBER_OF_DIRECT_BLOCKS
-            addr_block_count = block_size // address_size
-
-            # iterate through direct blocks obtaining addresses to read
-            if (offset < direct_count):
-                while True:
-                    # loop until offset exceeds direct blocks or no addresses left
-                    if offset == direct_count or \
-                       block_count == 0:
-                        break;
-
-                    # write address and increment to next offset
-                    addresses.appendleft(inode.read_address(offset))
-                    offset += 1
-                    block_count -= 1
-
-            # check lvl1 offsets
-            lvl1_max = inode.get_max_indirect_offset(block_size,address_size,1)
-            if block_count > 0 and offset < lvl1_max:
-
-                # get offsets
-                indirect_offsets = inode.get_indirect_offsets(offset, block_size)
- 
-                # identify block_addresses
-                block_addresses = deque()
-                block_addresses.append(inode.indirect_lvl1)
+        data = bytearray()
+        block_size = self._log.get_block_size()
 
-                # get sublist of addreses for this level if its going to spill
-                # into next level, need to maintain orignal addresses list for next level
-                target_count = block_count
-                if (block_count + offset) > lvl1_max:
+        # define file_offset, the block containing the first byte to read
+        initial_offset = off // block_size
 
-                    target_count = lvl1_max - offset
-                    lvl1_addresses = self.read_indirect(block_addresses, indirect_offsets, target_count)
+        if size>0:
 
+            # determine number of blocks of data to read, from the block of
+            # the first byte to the block of the last
+            block_count = (off + size - 1) // block_size - initial_offset + 1
+
+            # iterate through addresses and read data, blocks which are still
+            # in the write buffer are read from there instead of the log, and
+            # holes are zero filled without reading the log. The other blocks
+            # are read together, so a large read decodes each segment once.
+            addresses = self.read_file_addresses(inode, initial_offset, block_count)
+            buffered = [self._write_buffer.read(inode.inode_number, block_index)
+                        for block_index in range(initial_offset, initial_offset + block_count)]
+            stored = iter(self._log.read_blocks(
+                [addr for addr, block in zip(addresses, buffered)
+                 if block is None and addr != self.HOLE]))
+            hole_count = 0
+            for addr, block in zip(addresses, buffered):
+                if block is not None:
+                    data.extend(block)
+                    data.extend(b'\00' * (block_size - len(block)))
+                elif addr == self.HOLE:
+                    data.extend(self._zero_block)
+                    hole_count += 1
                 else:
+                    data.extend(next(stored))
 
-                    # calculate block_addresses and offsets
-                    lvl1_addresses = self.read_indirect(block_addresses, indirect_offsets, target_count)
+            with self._stats_lock:
+                self._hole_read_count += hole_count
 
-                # increment offset
-                offset += target_count
-                block_count -= target_count
+        # return bytes, starting from off within the first block
+        start = off - initial_offset * block_size
+        return bytes(data[start:start + size])
 
-                # add lvl1_addresses
-                for x in range(len(lvl1_addresses)):
-                    addresses.appendleft(lvl1_addresses[x])
+    # read_file_block - returns the first length bytes of a block of a file,
+    # from the write buffer if the block is buffered
+    def read_file_block(self, inode, block_index, length):
+        data = self._write_buffer.read(inode.inode_number, block_index)
 
-            # check lvl2 offsets
-            lvl2_max = inode.get_max_indirect_offset(block_size,address_size,2)
-            if block_count > 0 and offset < lvl2_max:
+        if data is None:
+            addr = self.read_file_addresses(inode, block_index, 1)[0]
+            data = self._zero_block if addr == self.HOLE else self._log.read_block(addr)
 
-                 # get offsets
-                indirect_offsets = inode.get_indirect_offsets(offset, block_size)
- 
-                # identify block_addresses
-                block_addresses = deque()
-                block_addresses.append(inode.indirect_lvl2)
+        data = bytes(data[:length])
+        return data + bytes(length - len(data))
 
-                # get sublist of addreses for this level if its going to spill
-                # into next level, need to maintain orignal addresses list for next level
-                target_count = block_count
-                if (block_count + offset) > lvl2_max:
+    # read_file_addresses - returns the addresses of block_count blocks of a
+    # file from the block at offset, holes have the address HOLE
+    def read_file_addresses(self, inode, offset, block_count):
 
-                    target_count = lvl2_max - offset
-                    lvl2_addresses = self.read_indirect(block_addresses, indirect_offsets, target_count)
+        # files with an extent map have no direct or indirect addresses
+        if inode.extents is not None:
+            return inode.extents.get_addresses(offset, block_count)
 
-                else:
-
-                    # calculate block_addresses and offsets
-                    lvl2_addresses = self.read_indirect(block_addresses, indirect_offsets, target_count)
-
-                # increment offset
-                offset += target_count
-                block_count -= target_count
-
-                # add lvl1_addresses
-                for x in range(len(lvl2_addresses)):
-                    addresses.appendleft(lvl2_addresses[x])
-
-            # check lvl3 offsets
-            lvl3_max = inode.get_max_indirect_offset(block_size,address_size,3)
-            if block_count > 0 and offset < lvl3_max:
+        addresses = []
+        direct_count = inode.NUMBER_OF_DIRECT_BLOCKS
 
-                # get offsets
-                indirect_offsets = inode.get_indirect_offsets(offset, block_size)
+        # iterate through direct blocks obtaining addresses to read
+        while offset < direct_count and block_count > 0:
+            addresses.append(inode.read_address(offset))
+            offset += 1
+            block_count -= 1
 
-                # identify block_addresses
-                block_addresses = deque()
-                block_addresses.append(inode.indirect_lvl3)
+        # the remaining addresses are held in the indirect blocks
+        if block_count > 0:
+            addresses.extend(self._indirect_blocks.get_addresses(inode, offset, block_count))
 
-                # get sublist of addreses for this level if its going to spill
-                # into next level, need to maintain orignal addresses list for next level
-                target_count = block_count
-                if (block_count + offset) > lvl3_max:
+        return addresses
 
-                    target_count = lvl3_max - offset
-                    lvl3_addresses = self.read_indirect(block_addresses, indirect_offsets, target_count)
+    # data_ranges - returns the (start, end) byte ranges of a file which hold
+    # data, everything else up to the file's size is a hole
+    def data_ranges(self, inode):
 
-                else:
+        if inode.inline_data is not None:
+            return [(0, inode.size)] if inode.size > 0 else []
 
-                    # calculate block_addresses and offsets
-                    lvl3_addresses = self.read_indirect(block_addresses, indirect_offsets, target_count)
-
-                # increment offset
-                offset += target_count
-                block_count -= target_count
-
-                # add lvl1_addresses
-                for x in range(len(lvl3_addresses)):
-                    addresses.appendleft(lvl3_addresses[x])
-
-            # iterate through addresses and read data
-            while True:
-                if len(addresses) == 0:
-                    break;
-                addr = addresses.pop()
-                data.extend(self._log.read_block(addr))
-
-        # return bytes
-        return bytes(data[0:size])
-
-    # write_indirect
-    #
-    #     This recursive method will read into the indirect address layer, 
-    #     update a list of addresses at a specific offset, and then as it backs 
-    #     out it will write the updated address pointer blocks and then update 
-    #     the previous layers addresses
-    #
-    #         block_addresses (READ)
-    #             list of BlockAddresses to load into a byte array and update at
-    #             the next level
-    #         offsets
-    #             reverse list of offsets for each layer (Ex 10, 115, 63 would 
-    #             be offset 63 at lvl1, offset 115 at lvl2, offset 10 at lvl3)
-    #         addresses (WRITE)
-    #             reverse list of addresses that need to be writen
-    def write_indirect(self, block_addresses, offsets, addresses):
-
-        # just to make the code cleaner 
         block_size = self._log.get_block_size()
-        address_size = BlockAddress.get_address_size()
-
-        # load data at block_addresses into AddressBlock object
-        indirect_data = bytearray()
-
-        for addr in block_addresses:
-
-            # if address is 0,0 load a block of zeros, otherwise load from log
-            if addr == BlockAddress():
-                indirect_data.extend(b'\00' * block_size)
-            else:
-                indirect_data.extend(self._log.read_block(addr))
-
-        indirect_ab = AddressBlock(bytes(indirect_data))
-
-        # set start offest for this layer, and remove it from offests
-        # this decrementation will stop the recursive loop
-        start_offset = offsets.pop()
-
-        # if len(offsets) > 0 , then there are more layers to process
-        if len(offsets) > 0:
-
-            # calcluate number of block units per address at this level 
-            block_units = (block_size // address_size)**len(offsets)
+        block_count = math.ceil(inode.size / block_size)
+        ranges = []
+
+        # addresses are looked up a chunk of blocks at a time to bound memory use
+        chunk = 4096
+        for first in range(0, block_count, chunk):
+            addresses = self.read_file_addresses(
+                inode, first, min(chunk, block_count - first))
+            for block_index, addr in enumerate(addresses, first):
+                if addr == self.HOLE and \
+                   self._write_buffer.read(inode.inode_number, block_index) is None:
+                    continue
+
+                start = block_index * block_size
+                end = min(start + block_size, inode.size)
+                if ranges and ranges[-1][1] == start:
+                    ranges[-1] = (ranges[-1][0], end)
+                else:
+                    ranges.append((start, end))
 
-            # calculate number of addresess to read, limited to max 
-            read_count = math.ceil((start_offset + len(addresses)) / block_units)
-            if read_count > (indirect_ab.get_max_offset() - start_offset):
-                read_count = indirect_ab.get_max_offset() - start_offset
+        return ranges
 
-            # get block_addresses from indirect_data for next layer
-            next_block_addresses = deque()
-            for x in range(read_count):
-                addr = indirect_ab.get_address(start_offset + x)
-                next_block_addresses.append(addr)
+    # seek - returns the offset that lseek() with SEEK_DATA or SEEK_HOLE would,
+    # or None where lseek() fails with ENXIO. The end of a file counts as a
+    # hole. libfuse 2 has no lseek operation, so clients which need this over
+    # the mount read DATA_RANGES_XATTR instead.
+    def seek(self, inode, off, whence):
 
-            # call write_indirect, update addresses
-            addresses = self.write_indirect(next_block_addresses, offsets, addresses)
+        if off >= inode.size:
+            return None
 
-        # write addresses to indirect_data at start_offset
-        write_count = len(addresses)
-        for x in range(write_count):
-            addr = addresses.pop()
-            indirect_ab.set_address(addr, start_offset + x)
+        for start, end in self.data_ranges(inode):
+            if whence == SEEK_DATA and end > off:
+                return max(start, off)
+            if whence == SEEK_HOLE:
+                if start > off:
+                    return off
+                if end > off:
+                    off = end
 
-        # write indirect_data to log block by block saving a list of addresses to return
-        # addreses in this list must be added with appendleft for reverse order
-        addresses = self.write_data_blocks(indirect_ab.get_bytes())
-
-        # return addresses
-        return addresses
+        return off if whence == SEEK_HOLE else None
 
+    # write_file - writes data to a file through the write buffer, the blocks
+    # reach the log when the file is flushed (see flush_file)
     def write_file(self, inode, buf, off):
 
-        # get file_offset, off should be evenly divisible by block_size
-        initial_offset = off // self._log.get_block_size()
-
-        # write data to log, and get list of addresses for inode
-        addresses = self.write_data_blocks(buf)
-
-        # offset will increment as we work our way through the direct/indirect
-        # address
-        offset = initial_offset
         block_size = self._log.get_block_size()
-        address_size = BlockAddress.get_address_size()
-        direct_count = inode.NUMBER_OF_DIRECT_BLOCKS
 
-        # update inode direct addresses
-        if (offset < direct_count):
-            while True:
-                # loop until offset exceeds direct blocks or no addresses left
-                if offset == direct_count or \
-                   len(addresses) == 0:
-                    break;
-                # write address and increment to next offset
-                inode.write_address(addresses.pop(), offset)
-                offset += 1
-
-        # check lvl1 offsets
-        lvl1_max = inode.get_max_indirect_offset(block_size,address_size,1)
-        if len(addresses) > 0 and offset < lvl1_max:
-        
-            # get offsets
-            indirect_offsets = inode.get_indirect_offsets(offset, block_size)
-
-            # identify block_addresses
-            block_addresses = deque()
-            block_addresses.append(inode.indirect_lvl1)
+        # small files keep their data in the inode until it outgrows it
+        if inode.inline_data is not None and \
+           off + len(buf) <= INode.max_inline_size(block_size):
+            data = bytearray(inode.inline_data)
+            data.extend(bytes(max(0, off - len(data))))
+            data[off:off + len(buf)] = buf
+            inode.inline_data = bytes(data)
+        else:
+            if inode.inline_data is not None:
+                self.migrate_inline(inode)
+
+            # 1. Buffer the written bytes of each block, a block which is
+            #    only partly written is first read into the buffer
+            end = off + len(buf)
+            for block_index in range(off // block_size, math.ceil(end / block_size)):
+                block_start = block_index * block_size
+                start = max(off, block_start) - block_start
+                stop = min(end, block_start + block_size) - block_start
+
+                # the bytes of the block which are within the file already
+                existing_length = min(max(inode.size - block_start, 0), block_size)
+                if (start > 0 or stop < existing_length) and \
+                   self._write_buffer.read(inode.inode_number, block_index) is None:
+                    self._write_buffer.write(
+                        inode.inode_number, block_index,
+                        self.read_file_block(inode, block_index, existing_length))
+                    self._rmw_read_count += 1
+
+                self._write_buffer.write(
+                    inode.inode_number, block_index,
+                    buf[block_start + start - off:block_start + stop - off], start)
+
+        # 2. Increase Size attribute if file grew
+        max_write_size = off + len(buf)
+        if (max_write_size > inode.size):
+            inode.size = max_write_size
 
-            # get sublist of addreses for this level if its going to spill
-            # into next level, need to maintain orignal addresses list for next level
-            if (len(addresses) + offset) > lvl1_max:
-                target_addresses = deque()
-                for x in range( lvl1_max - offset ):
-                    target_addresses.appendleft(addresses.pop())
+        # update modified attr
+        now = time()
+        inode.last_modified_at = now
+        inode.status_last_changed_at = now
 
-                # get address count to increase offset after we write indirects
-                addr_count = len(target_addresses)
+        # 3. Write Inode to log
+        self.write_inode(inode)
 
-                new_indirect_lvl1 = self.write_indirect(block_addresses, indirect_offsets, target_addresses)
+        # 4. Flush the least recently dirtied files if the buffer is full
+        while self._write_buffer.is_full():
+            self.flush_file(self._write_buffer.oldest_inode_number())
+
+    # migrate_inline - moves the inline data of a file which has outgrown its
+    # inode into the first block of the file
+    def migrate_inline(self, inode):
+        if len(inode.inline_data) > 0:
+            self._write_buffer.write(inode.inode_number, 0, inode.inline_data)
+        inode.inline_data = None
+
+    # truncate_inline - resizes the inline data of a file to the file's size,
+    # moving it to a block if it no longer fits in the inode
+    def truncate_inline(self, inode):
+        if inode.size <= INode.max_inline_size(self._log.get_block_size()):
+            data = inode.inline_data[:inode.size]
+            inode.inline_data = data + bytes(inode.size - len(data))
+        else:
+            self.migrate_inline(inode)
 
-            else:
+    # flush_file - writes the buffered blocks of a file to the log, each run
+    # of consecutive blocks is written with a single write_file_blocks call
+    def flush_file(self, inode_id):
 
-                # get address count to increase offset after we write indirects
-                addr_count = len(addresses)
+        blocks = self._write_buffer.pop_blocks(inode_id)
+        if len(blocks) == 0:
+            return
 
-                # calculate block_addresses and offsets
-                new_indirect_lvl1 = self.write_indirect(block_addresses, indirect_offsets, addresses)
+        block_size = self._log.get_block_size()
+        inode = self.load_inode(inode_id)
 
-            # increment offset
-            offset += addr_count
+        run_start = blocks[0][0]
+        run = bytearray()
+        for block_index, block in blocks:
+            if block_index != run_start + len(run) // block_size:
+                self.write_file_blocks(inode, run, run_start * block_size)
+                run_start = block_index
+                run = bytearray()
 
-            # set new indirect pointers
-            inode.indirect_lvl1 = new_indirect_lvl1.pop()
+            # every block but the last in a run must be padded to a full block
+            run.extend(block)
+            run.extend(b'\00' * (block_size - len(block)))
 
-        # check lvl2 offsets
-        lvl2_max = inode.get_max_indirect_offset(block_size,address_size,2)
-        if len(addresses) > 0 and offset < lvl2_max:
+        self.write_file_blocks(inode, run, run_start * block_size)
 
-            # get offsets
-            indirect_offsets = inode.get_indirect_offsets(offset, block_size)
+        self.write_inode(inode)
 
-            # identify block_addresses
-            block_addresses = deque()
-            block_addresses.append(inode.indirect_lvl2)
+        self._evict_indirect_blocks()
 
-            # get sublist of addreses for this level if its going to spill
-            # into next level, need to maintain orignal addresses list for next level
-            if (len(addresses) + offset) > lvl2_max:
-                target_addresses = deque()
-                for x in range( lvl2_max - offset ):
-                    target_addresses.appendleft(addresses.pop())
+    # flush_indirect - writes a file's modified indirect blocks to the log and
+    # points its inode at them, optionally dropping the file's cached blocks
+    def flush_indirect(self, inode_id, discard=False):
 
-                # get address count to increase offset after we write indirects
-                addr_count = len(target_addresses)
+        if self._indirect_blocks.has_dirty_blocks(inode_id):
+            inode = self.load_inode(inode_id)
+            self._indirect_blocks.flush(inode)
+            self.write_inode(inode)
 
-                new_indirect_lvl2 = self.write_indirect(block_addresses, indirect_offsets, target_addresses)
-            else:
+        if discard:
+            self._indirect_blocks.discard(inode_id)
 
-                # get address count to increase offset after we write indirects
-                addr_count = len(addresses)
+    # write_file_blocks - writes data to the log at a block aligned offset and
+    # updates the inode's addresses to point at it
+    def write_file_blocks(self, inode, buf, off):
 
-                # calculate block_addresses and offsets
-                new_indirect_lvl2 = self.write_indirect(block_addresses, indirect_offsets, addresses)
+        # get file_offset, off should be evenly divisible by block_size
+        initial_offset = off // self._log.get_block_size()
 
-            # increment offset
-            offset += addr_count
+        # write data to log, and get list of addresses for inode
+        addresses = self.write_data_blocks(buf, self.block_stream(inode))
 
-            # set new indirect pointers
-            inode.indirect_lvl2 = new_indirect_lvl2.pop()
+        self.set_file_addresses(inode, initial_offset, list(reversed(addresses)))
 
-        # check lvl1 offsets
-        lvl3_max = inode.get_max_indirect_offset(block_size,address_size,3)
-        if len(addresses) > 0 and offset < lvl3_max:
+    # set_file_addresses - points the blocks of a file from offset at the
+    # given list of addresses
+    def set_file_addresses(self, inode, offset, addresses):
 
-            # get offsets
-            indirect_offsets = inode.get_indirect_offsets(offset, block_size)
-            # identify block_addresses
-            block_addresses = deque()
-            block_addresses.append(inode.indirect_lvl3)
+        # files with an extent map have no direct or indirect addresses
+        if inode.extents is not None:
+            inode.extents.set_addresses(offset, addresses)
+            return
 
-            # get sublist of addreses for this level if its going to spill
-            # into next level, need to maintain orignal addresses list for next level
-            if (len(addresses) + offset) > lvl3_max:
-                target_addresses = deque()
-                for x in range( lvl3_max - offset ):
-                    target_addresses.appendleft(addresses.pop())
+        direct_count = inode.NUMBER_OF_DIRECT_BLOCKS
+        index = 0
 
-                # get address count to increase offset after we write indirects
-                addr_count = len(target_addresses)
+        # update inode direct addresses
+        while offset < direct_count and index < len(addresses):
+            inode.write_address(addresses[index], offset)
+            offset += 1
+            index += 1
+
+        # the remaining addresses go into the indirect blocks, which are only
+        # written to the log when the file is flushed (see flush_indirect)
+        if index < len(addresses):
+            self._indirect_blocks.set_addresses(inode, offset, addresses[index:])
+
+    # truncate_file - changes the size of a file which is not inline. Blocks
+    # past the new end become holes, and the rest of the last block is zeroed,
+    # so that growing the file again does not bring back the old data.
+    def truncate_file(self, inode, size):
+        block_size = self._log.get_block_size()
+        old_block_count = math.ceil(inode.size / block_size)
+        block_count = math.ceil(size / block_size)
 
-                new_indirect_lvl3 = self.write_indirect(block_addresses, indirect_offsets, target_addresses)
-            else:
+        if size < inode.size:
+            self._write_buffer.discard(inode.inode_number, block_count)
 
-                # get address count to increase offset after we write indirects
-                addr_count = len(addresses)
+            if block_count < old_block_count:
+                self.set_file_addresses(
+                    inode, block_count, [self.HOLE] * (old_block_count - block_count))
 
-                # calculate block_addresses and offsets
-                new_indirect_lvl3 = self.write_indirect(block_addresses, indirect_offsets, addresses)
+            tail = size % block_size
+            if tail > 0:
+                last_block = self.read_file_block(inode, block_count - 1, tail)
+                self._write_buffer.discard(inode.inode_number, block_count - 1)
+                self._write_buffer.write(inode.inode_number, block_count - 1, last_block)
 
-            # increment offset
-            offset += addr_count
+        inode.size = size
 
-            # set new indirect pointers
-            inode.indirect_lvl3 = new_indirect_lvl3.pop()
+    # marks an inode as modified, it is written to the log later by
+    # _flush_inodes (or _flush_inode) and until then load_inode returns it
+    def write_inode(self, inode):
 
-        # 3. Increase Size attribute if file grew
-        max_write_size = len(buf) + (initial_offset *
-                                     self._log.get_block_size())
-        if (max_write_size > inode.size):
-            inode.size = max_write_size
+        if len(self._dirty_inodes) == 0:
+            self._inodes_dirty_since = time()
 
-        # update modified attr
-        now = time()
-        inode.last_modified_at = now
-        inode.status_last_changed_at = now
+        self._dirty_inodes[inode.inode_number] = inode
+        self._lazy_inodes.pop(inode.inode_number, None)
+        self._inode_update_count += 1
 
-        # 3. Write Inode to log
-        self.write_inode(inode)
- 
-    def write_inode(self, inode):
+        # replace the cached copy, this also accounts for any size change
+        self._inode_cache.put(inode)
 
-        # write inode to log
-        inode_addr = self._log.write_inode(inode.to_bytes(), inode.inode_number)
+    # returns True if the inode has been written to the log or is waiting to be
+    def inode_exists(self, inode_id):
+        return inode_id in self._dirty_inodes or self._CR.inode_exists(inode_id)
 
-        # - update CR inode_map for inode
-        self._CR.inode_map[inode.inode_number] = inode_addr
+    # returns the log stream that the data blocks of an inode are written to,
+    # directory entries and symlink targets are rewritten far more often than
+    # file contents so they are kept with the inodes in the metadata stream
+    def block_stream(self, inode):
+        if inode.is_file():
+            return Log.DATA_STREAM
+        else:
+            return Log.METADATA_STREAM
 
     # method writes a single block to log, and updates inode address info
     def write_data_block(self, inode, data, x, file_offset=0):
         start = x * self._log.get_block_size()
         end = (x + 1) * self._log.get_block_size()
         block = data[start:end]
-        address = self._log.write_data_block(block)
+        address = self._log.write_data_block(block, self.block_stream(inode))
         inode.write_address(address, file_offset + x)
         return inode
 
-    # method will write a number of blocks of data, and return a 
+    # method will write a number of blocks of data to a log stream, and return a
     # list of addresses that will need to be updated in the 
     # corresponding inode
-    def write_data_blocks(self, buf):
+    def write_data_blocks(self, buf, stream=Log.DATA_STREAM):
 
         # addresses list, using deque for appendleft / pop O(1) performance
         addresses = deque()
@@ -1277,8 +1704,15 @@ class FuseApi(FUSELL):
             start = x * self._log.get_block_size()
             end = (x + 1 ) * self._log.get_block_size()
             block = buf[start:end]
+
+            # blocks of file data which are all zeros are recorded as holes
+            if stream == Log.DATA_STREAM and block == self._zero_block[:len(block)]:
+                addresses.appendleft(self.HOLE)
+                self._hole_write_count += 1
+                continue
+
             # write block and append address
-            addresses.appendleft(self._log.write_data_block(block))
+            addresses.appendleft(self._log.write_data_block(block, stream))
 
         # return addresses
         return addresses
@@ -1290,56 +1724,324 @@ class FuseApi(FUSELL):
         return data
 
     def load_inode(self, inode_id):
+        # inodes which have not been written yet are only held in memory
+        if inode_id in self._dirty_inodes:
+            return self._dirty_inodes[inode_id]
+        if inode_id in self._lazy_inodes:
+            return self._lazy_inodes[inode_id]
+
+        inode = self._inode_cache.get(inode_id)
+        if inode is not None:
+            return inode
+
         # obtain inode address from imap
         try:
             inode_address = self._CR.inode_map[inode_id]
 
             # read inode data from log
-            inode_data = self._log.read_block(inode_address)
+            inode_data = self._log.read_inode(inode_address)
         
             # load inode from log
-            return INode.from_bytes(inode_data)
+            inode = INode.from_bytes(inode_data)
+            if inode.extents is not None:
+                inode.extents.load(self._log)
+            self._inode_cache.put(inode)
+            return inode
 
         except KeyError:
 
             print("INode (", inode_id, ") not found in inode_map!")
 
+    # loads many inodes like load_inode, but reads the inodes which are not
+    # cached together (see Log.read_inodes). Returns a dict of inode number
+    # -> INode, which leaves out inode numbers not in the inode map.
+    def load_inodes(self, inode_ids):
+        inodes = {}
+        addresses = {}
+
+        for inode_id in inode_ids:
+            inode = self._dirty_inodes.get(inode_id) or \
+                self._lazy_inodes.get(inode_id) or self._inode_cache.get(inode_id)
+            if inode is not None:
+                inodes[inode_id] = inode
+            elif inode_id in self._CR.inode_map:
+                addresses[inode_id] = self._CR.inode_map[inode_id]
+
+        inode_data = self._log.read_inodes(list(addresses.values()))
+
+        for inode_id, data in zip(addresses, inode_data):
+            inode = INode.from_bytes(data)
+            if inode.extents is not None:
+                inode.extents.load(self._log)
+            self._inode_cache.put(inode)
+            inodes[inode_id] = inode
+
+        return inodes
+
+    # a hashed directory's only bucket is inline until it outgrows the inode,
+    # after that there is a bucket per block
+    def _bucket_count(self, directory):
+        if directory.inline_data is not None:
+            return 1
+        return directory.size // self._log.get_block_size()
+
+    def _read_bucket(self, directory, index):
+        block_size = self._log.get_block_size()
+
+        if directory.inline_data is not None:
+            data = directory.inline_data
+        else:
+            data = self.read_file_block(directory, index, block_size)
+
+        return DirectoryBlock.from_bytes(data, block_size)
+
+    # returns the index and contents of the bucket of a name hash, first
+    # splitting buckets until it fits in a block, which a bucket written
+    # without file types may not
+    def _find_bucket(self, directory, name_hash):
+        while True:
+            index = DirectoryBlock.bucket_index(name_hash, self._bucket_count(directory))
+            bucket = self._read_bucket(directory, index)
+            if bucket.used_bytes() <= self._log.get_block_size():
+                return index, bucket
+            self._split_bucket(directory)
+
+    # yields the readdir entries of a directory from off on as (name, attr,
+    # offset of the following entry)
+    def _readdir_entries(self, directory, off):
+        if off < 1:
+            yield '.', {'st_ino': directory.inode_number, 'st_mode': S_IFDIR}, 1
+        if off < 2:
+            yield '..', {'st_ino': directory.parent, 'st_mode': S_IFDIR}, 2
+
+        for name, inode_id, file_type, offset in \
+                self.directory_entries(directory, max(off - 2, 0)):
+            attr = {'st_ino': inode_id, 'st_mode': DirectoryBlock.type_mode(file_type)}
+            yield name, attr, offset + 2
+
+    # yields the readdirplus entries of a directory from off on as (name,
+    # entry, offset of the following entry). The inodes of the entries which
+    # could fit in size bytes are loaded in one batch, together with those of
+    # up to READDIRPLUS_READAHEAD following entries if any were not cached,
+    # so that the next calls for the directory find them in the cache.
+    def _readdirplus_entries(self, directory, size, off):
+        entries = self._readdir_entries(directory, off)
+        batch = list(islice(entries, size // self.MIN_DIRENTPLUS_SIZE + 1))
+        inode_ids = [attr['st_ino'] for name, attr, offset in batch
+                     if name not in ('.', '..')]
+
+        if not all(i in self._dirty_inodes or i in self._lazy_inodes or
+                   i in self._inode_cache for i in inode_ids):
+            inode_ids.extend(attr['st_ino'] for name, attr, offset in
+                             islice(entries, self.READDIRPLUS_READAHEAD))
+
+        inodes = self.load_inodes(inode_ids)
+
+        for name, attr, offset in batch:
+            inode = inodes.get(attr['st_ino'])
+
+            # the kernel only uses the names of '.' and '..', and an inode
+            # of 0 replies with an entry's name but not its attributes
+            if name in ('.', '..') or inode is None:
+                entry = dict(ino=0, attr=attr, attr_timeout=0.0, entry_timeout=0.0)
+            else:
+                entry = dict(ino=inode.inode_number, attr=inode.get_attr(),
+                             **self._timeouts(inode.mode))
+
+            yield name, entry, offset
+
+    def _write_bucket(self, directory, index, bucket):
+        block_size = self._log.get_block_size()
+        data = bucket.to_bytes()
+
+        if directory.inline_data is not None:
+            if len(data) <= INode.max_inline_size(block_size):
+                directory.inline_data = data
+                return
+
+            # the only bucket has outgrown the inode
+            directory.inline_data = None
+            directory.size = block_size
+
+        address = self._log.write_data_block(data, Log.METADATA_STREAM)
+        self.set_file_addresses(directory, index, [address])
+        self._evict_indirect_blocks()
+
+    # splits the next bucket in linear hashing order, adding a bucket to the
+    # end of the directory
+    def _split_bucket(self, directory):
+        block_size = self._log.get_block_size()
+        count = self._bucket_count(directory)
+        level = count.bit_length() - 1
+        index = count - (1 << level)
+
+        bucket = self._read_bucket(directory, index)
+        new_bucket = bucket.split((1 << (level + 1)) - 1, count)
+
+        if directory.inline_data is not None:
+            directory.inline_data = None
+            directory.size = block_size
+
+        self._write_bucket(directory, index, bucket)
+        directory.size += block_size
+        self._write_bucket(directory, count, new_bucket)
+
+    # converts a directory in the original pickled format into a hashed
+    # directory
+    def _convert_directory(self, directory):
+        children = self.legacy_children(directory)
+        directory.set_inline_data(b'')
+        directory.entry_count = 0
+        directory.size = self._log.get_block_size()
+
+        # children are stored without their file type, which the new entries
+        # have, so each child's inode is loaded once here
+        for name, inode_id in children.items():
+            child = self.load_inode(inode_id)
+            self.add_entry(directory, name, inode_id, child.mode if child else 0)
+
     def _checkpoint_if_necessary(self):
         current_time = int(time())
         last_checkpoint_time = self._CR.time()
 
         if (current_time - last_checkpoint_time) >= self._checkpoint_frequency:
+            self._flush_write_buffer()
+            self._flush_indirect_blocks()
+            self._write_lazy_inodes()
+            self._flush_inodes()
             self._log.flush()
             self._save_checkpoint()
 
+    # writes the buffered blocks of files which became dirty more than
+    # max_dirty_age seconds ago to the log, along with the indirect blocks and
+    # inodes which refer to them, and syncs the log. The segment sealer only
+    # bounds the age of data already in the log, and a sync of blocks which
+    # were only just written would wait for another max_dirty_age.
+    def _flush_old_writes(self):
+        if not self._max_dirty_age:
+            return
+
+        cutoff = time() - self._max_dirty_age
+        old_files = self._write_buffer.inode_numbers_dirty_before(cutoff)
+        if not old_files and \
+           (self._inodes_dirty_since is None or self._inodes_dirty_since >= cutoff):
+            return
+
+        for inode_id in old_files:
+            self.flush_file(inode_id)
+        self._flush_indirect_blocks()
+        self._flush_inodes()
+        self._log.sync()
+
+    def _flush_inodes_if_necessary(self):
+        if self._inodes_dirty_since is not None and \
+           time() - self._inodes_dirty_since >= self._inode_flush_interval:
+            self._flush_inodes()
+
+    # marks the inodes whose access time was only updated in memory, or those
+    # of inode_ids among them, dirty so that the next flush writes them
+    def _write_lazy_inodes(self, inode_ids=None):
+        for inode_id in list(self._lazy_inodes if inode_ids is None else inode_ids):
+            inode = self._lazy_inodes.get(inode_id)
+            if inode is not None:
+                self.write_inode(inode)
+
+    # writes every modified inode to the log and updates the inode_map, the
+    # inodes are packed together into as few blocks as possible
+    def _flush_inodes(self):
+        self._write_inodes(list(self._dirty_inodes.keys()))
+
+    def _flush_inode(self, inode_id):
+        if inode_id in self._dirty_inodes:
+            self._write_inodes([inode_id])
+
+    def _write_inodes(self, inode_ids):
+        inodes = [self._dirty_inodes[inode_id] for inode_id in inode_ids]
+
+        # large extent maps are stored in their own blocks, which must be
+        # written before the inodes that refer to them. The inodes stay dirty
+        # until they are written, so that a failure leaves them to be retried.
+        for inode in inodes:
+            if inode.extents is not None:
+                inode.extents.flush(self._log)
+
+        # write inodes to log
+        inode_addrs = self._log.write_inodes(
+            [(inode.inode_number, inode.to_bytes()) for inode in inodes])
+        self._inode_write_count += len(inodes)
+
+        for inode_id in inode_ids:
+            del self._dirty_inodes[inode_id]
+
+        # - update CR inode_map for each inode
+        for inode, inode_addr in zip(inodes, inode_addrs):
+            self._CR.set_inode_address(inode.inode_number, inode_addr)
+
+        if len(self._dirty_inodes) == 0:
+            self._inodes_dirty_since = None
+
+    def _flush_write_buffer(self):
+        for inode_id in self._write_buffer.inode_numbers():
+            self.flush_file(inode_id)
+
+    # writes out the indirect blocks of the least recently written files if
+    # too many are cached
+    def _evict_indirect_blocks(self):
+        while self._indirect_blocks.is_full():
+            self.flush_indirect(self._indirect_blocks.oldest_inode_number(), discard=True)
+
+    def _flush_indirect_blocks(self):
+        for inode_id in self._indirect_blocks.inode_numbers():
+            self.flush_indirect(inode_id)
+
+    def _checkpoint_in_background(self):
+        # if an operation is running it will check for a checkpoint itself, so
+        # there is no need to wait for it (destroy also stops the sealer while
+        # holding the lock)
+        if self._lock.acquire(blocking=False):
+            try:
+                self._flush_old_writes()
+                self._flush_inodes_if_necessary()
+                self._checkpoint_if_necessary()
+            finally:
+                self._lock.release()
+
     def _save_checkpoint(self):
         last_segment_id = self._log.get_current_segment_id() - 1
         self._CR.set_segment_id(last_segment_id)
         self._CR.set_time(int(time()))
-        serialized_checkpoint = self._CR.to_bytes()
-        self._bucket.put_checkpoint(serialized_checkpoint)
+        self._checkpoint_writer.submit(self._put_checkpoint, self._CR.snapshot())
+
+    def _put_checkpoint(self, checkpoint):
+        self._bucket.put_checkpoint(checkpoint.to_bytes())
 
     def _roll_forward(self):
         '''
         Checks for segments > the checkpoint's segment id and updates the imap
         with any inodes they contain.
+
+        The log has one open segment per stream, and a segment which was open
+        when the filesystem stopped may never have been written while segments
+        with higher ids were. So the search only stops after as many missing
+        ids in a row as there are streams.
         '''
         last_segment_id = self._CR.current_segment_id()
-        last_segment_exists = True
+        current_segment_id = last_segment_id
+        missing_count = 0
 
-        while last_segment_exists:
-            current_segment_id = last_segment_id + 1
+        while missing_count < len(Log.STREAMS):
+            current_segment_id += 1
 
             try:
                 segment_bytes = self._bucket.get_segment(current_segment_id)
                 self._update_imap_from_segment(
                     current_segment_id, segment_bytes)
+                last_segment_id = current_segment_id
+                missing_count = 0
             except BackendError:
-                last_segment_exists = False
+                missing_count += 1
 
-            last_segment_id = current_segment_id
-
-        self._CR.set_segment_id(last_segment_id - 1)
+        self._CR.set_segment_id(last_segment_id)
 
     def _update_imap_from_segment(self, segment_id, segment_bytes):
         segment = ReadOnlySegment(
@@ -1349,6 +2051,13 @@ class FuseApi(FUSELL):
             self._CR.segment_size
         )
 
-        for (inode_number, block_number) in segment.inode_block_numbers():
-            self._CR.inode_map[inode_number] = BlockAddress(
-                segment_id, block_number)
+        # entries of inodes packed with others also hold the inode's slot
+        for entry in segment.inode_block_numbers():
+            if len(entry) == 3:
+                inode_number, block_number, slot = entry
+                self._CR.set_inode_address(inode_number, INodeAddress(
+                    segment_id, block_number, slot))
+            else:
+                inode_number, block_number = entry
+                self._CR.set_inode_address(inode_number, BlockAddress(
+                    segment_id, block_number))
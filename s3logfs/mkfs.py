@@ -17,6 +17,9 @@ def main():
                         help='The size of each block, in bytes. (Default=4096)')
     parser.add_argument('-s', '--segmentsize', dest='blocks_per_segment', type=int, default=512,
                         help='The number of blocks per segment. (Deafult=512)')
+    parser.add_argument('-L', '--layout', default=CheckpointRegion.BLOCK_LAYOUT,
+                        choices=CheckpointRegion.LAYOUTS,
+                        help='How file blocks are mapped, by block addresses or by extents. (Default=blocks)')
     parser.add_argument('-r', '--region', default=None,
                         help='The region to create the bucket in (see S3 documentation for options).')
     parser.add_argument('-l', '--local', dest='local_directory', default=None,
@@ -35,7 +38,8 @@ def main():
         start_inode=0,
         block_size=args.block_size,
         blocks_per_segment=args.blocks_per_segment,
-        checkpoint_time=time()
+        checkpoint_time=time(),
+        layout=args.layout
     )
 
     create_root_directory(checkpoint, s3_bucket)
@@ -58,11 +62,13 @@ def create_root_directory(checkpoint, bucket):
     root_inode.block_size = checkpoint.block_size
     root_inode.mode = S_IFDIR | 0o777        # directory with 777 chmod
     root_inode.hard_links = 2     # "." and ".." make the first 2 hard links
+    root_inode.entry_count = 0    # an empty hashed directory, see DirectoryBlock
+    root_inode.inline_data = b''
 
     root_inode_addr = log.write_inode(
         root_inode.to_bytes(), root_inode.inode_number)
     log.flush()
-    checkpoint.inode_map[root_inode.inode_number] = root_inode_addr
+    checkpoint.set_inode_address(root_inode.inode_number, root_inode_addr)
     checkpoint.root_inode_id = root_inode.inode_number
 
 
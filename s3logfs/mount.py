@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 import argparse
 
+from stat import S_IFDIR, S_IFLNK, S_IFREG
 from sys import argv
 from datetime import datetime
 from .fuse_api import FuseApi
+from .fs import Tracer
 from .backends import S3Bucket, AsyncWriter, DiskCache, MemoryCache, LocalDirectory
 
 
@@ -24,6 +26,83 @@ def main():
                         help='The number of threads in the write request pool. (Default=4)')
     parser.add_argument('-c', '--checkpoint', dest='checkpoint_frequency', type=int, default=60,
                         help='The number of seconds between checkpoints. (Default=60)')
+    parser.add_argument('-f', '--commitdelay', dest='commit_delay', type=int, default=0,
+                        help='The number of milliseconds to wait for other fsyncs before '
+                        'syncing the log, so that they can share one upload. (Default=0)')
+    parser.add_argument('-i', '--idleseal', dest='idle_seal', type=int, default=5,
+                        help='The number of seconds without writes after which the current '
+                        'segment is sealed and written. 0 disables this. (Default=5)')
+    parser.add_argument('-a', '--maxdirtyage', dest='max_dirty_age', type=int, default=30,
+                        help='The maximum number of seconds written data may stay in memory '
+                        'before it is synced. 0 disables this. (Default=30)')
+    parser.add_argument('-z', '--maxdirtysize', dest='max_dirty_size', type=int, default=0,
+                        help='The maximum number of kilobytes of written data to hold in memory '
+                        'before it is synced. 0 disables this. (Default=0)')
+    parser.add_argument('-b', '--writebuffer', dest='write_buffer_size', type=int, default=16,
+                        help='The maximum number of megabytes of file data to buffer in memory '
+                        'before it is written to the log. (Default=16)')
+    parser.add_argument('-n', '--inodeflush', dest='inode_flush_interval', type=int, default=5,
+                        help='The maximum number of seconds a modified inode is held in memory '
+                        'before it is written to the log. (Default=5)')
+    parser.add_argument('-k', '--inodecache', dest='inode_cache_size', type=int, default=16,
+                        help='The maximum number of megabytes of memory to use for caching '
+                        'decoded inodes. (Default=16)')
+    parser.add_argument('-x', '--indirectcache', dest='indirect_cache_size', type=int, default=4,
+                        help='The maximum number of megabytes of indirect address blocks to hold '
+                        'in memory for files being written. (Default=4)')
+    parser.add_argument('-e', '--dentrycache', dest='dentry_cache_size', type=int, default=65536,
+                        help='The maximum number of directory entries, including names which do '
+                        'not exist, to cache for lookups. (Default=65536)')
+    parser.add_argument('-r', '--fetchthreads', dest='segment_fetch_threads', type=int, default=8,
+                        help='The number of threads fetching segments in parallel when many '
+                        'inodes are read at once, as by readdirplus. (Default=8)')
+    parser.add_argument('--multithreaded', action='store_true',
+                        help='Handle requests on several threads, so that operations which only '
+                        'read the filesystem do not wait for each other to fetch segments.')
+    parser.add_argument('--offloadthreads', dest='offload_threads', type=int, default=0,
+                        help='The number of threads finishing reads which must fetch segments '
+                        'from the bucket, while other requests are served. 0 disables this. '
+                        '(Default=0)')
+    parser.add_argument('--maxwrite', dest='max_write', type=int, default=128,
+                        help='The largest write, in kilobytes, the kernel is asked to send '
+                        'at once. libfuse may lower it. (Default=128)')
+    parser.add_argument('--writebackcache', dest='writeback_cache', action='store_true',
+                        help='Let the kernel cache written pages and write them back merged, '
+                        'rather than sending every write to the filesystem as it is made. '
+                        'Needs libfuse 3, with libfuse 2 a warning is logged and writes are '
+                        'sent as they are made.')
+    parser.add_argument('--attrtimeout', dest='attr_timeout', type=float, default=1.0,
+                        help='The number of seconds the kernel may cache attributes of files '
+                        'before asking for them again. (Default=1.0)')
+    parser.add_argument('--entrytimeout', dest='entry_timeout', type=float, default=1.0,
+                        help='The number of seconds the kernel may cache the inode a name '
+                        'refers to before looking it up again. (Default=1.0)')
+    parser.add_argument('--typetimeout', dest='type_timeouts', action='append', default=[],
+                        type=type_timeout, metavar='TYPE=ATTR[,ENTRY]',
+                        help='The attribute and entry timeouts of one type of file (file, '
+                        'dir or symlink), instead of --attrtimeout and --entrytimeout. '
+                        'May be given once for each type.')
+    parser.add_argument('--negativetimeout', dest='negative_timeout', type=float, default=0.0,
+                        help='The number of seconds the kernel may cache that a name does '
+                        'not exist. (Default=0)')
+    parser.add_argument('--atime', default='relatime', choices=FuseApi.ATIME_POLICIES,
+                        help='When opening a file updates its access time: always (strictatime), '
+                        'when it is older than the last change or a day old (relatime), in '
+                        'memory until the file next changes, is synced or the next checkpoint '
+                        '(lazytime), or never (noatime). '
+                        '(Default=relatime)')
+    parser.add_argument('--trace', dest='trace_level', default='off', choices=Tracer.LEVELS,
+                        help='Record operations and their latency (on), and also print each '
+                        'one (print). Can be changed while mounted with trace.s3logfs. '
+                        '(Default=off)')
+    parser.add_argument('--tracesample', dest='trace_sample', type=int, default=1,
+                        help='Record one in every this many operations. (Default=1)')
+    parser.add_argument('--tracebuffer', dest='trace_capacity', type=int, default=65536,
+                        help='The number of most recent operations to keep records of. '
+                        '(Default=65536)')
+    parser.add_argument('--tracefile', dest='trace_file', default='/tmp/s3logfs-trace.json',
+                        help='The file records are written to when they are dumped. '
+                        '(Default=/tmp/s3logfs-trace.json)')
     parser.add_argument('-l', '--local', dest='local_directory', default=None,
                         help='Mount a local "bucket" under this directory.')
     args = parser.parse_args()
@@ -38,7 +117,50 @@ def main():
     with AsyncWriter(s3_bucket, args.write_queue_size, args.thread_pool_size) as async_writer:
         with DiskCache(async_writer, args.disk_cache_size) as disk_cache:
             memory_cache = MemoryCache(disk_cache, args.memory_cache_size)
-            FuseApi(args.mount, memory_cache, args.checkpoint_frequency)
+            FuseApi(args.mount, memory_cache, args.checkpoint_frequency,
+                    commit_delay=args.commit_delay / 1000,
+                    idle_seal=args.idle_seal,
+                    max_dirty_age=args.max_dirty_age,
+                    max_dirty_bytes=args.max_dirty_size * 1024,
+                    write_buffer_size=args.write_buffer_size * 2**20,
+                    inode_flush_interval=args.inode_flush_interval,
+                    inode_cache_size=args.inode_cache_size * 2**20,
+                    indirect_cache_size=args.indirect_cache_size * 2**20,
+                    dentry_cache_size=args.dentry_cache_size,
+                    segment_fetch_threads=args.segment_fetch_threads,
+                    multithreaded=args.multithreaded,
+                    offload_threads=args.offload_threads,
+                    trace_level=Tracer.LEVELS[args.trace_level],
+                    trace_sample=args.trace_sample,
+                    trace_capacity=args.trace_capacity,
+                    trace_file=args.trace_file,
+                    max_write=args.max_write * 2**10,
+                    writeback_cache=args.writeback_cache,
+                    attr_timeout=args.attr_timeout,
+                    entry_timeout=args.entry_timeout,
+                    type_timeouts=dict(args.type_timeouts),
+                    negative_timeout=args.negative_timeout,
+                    atime=args.atime)
+
+
+FILE_TYPES = dict(file=S_IFREG, dir=S_IFDIR, symlink=S_IFLNK)
+
+
+def type_timeout(value):
+    '''
+    Parses a --typetimeout of TYPE=ATTR[,ENTRY] into (file type, (attribute
+    timeout, entry timeout)), the entry timeout defaults to the attribute one.
+    '''
+    try:
+        name, timeouts = value.split('=')
+        timeouts = [float(timeout) for timeout in timeouts.split(',')]
+        if len(timeouts) == 1:
+            timeouts *= 2
+        attr_timeout, entry_timeout = timeouts
+        return FILE_TYPES[name], (attr_timeout, entry_timeout)
+    except (KeyError, ValueError):
+        raise argparse.ArgumentTypeError('expected TYPE=ATTR[,ENTRY], where TYPE is one of '
+                                         + ', '.join(FILE_TYPES))
 
 
 if __name__ == '__main__':
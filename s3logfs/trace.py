@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+
+from .fs import Tracer
+from .fuse_api import TRACE_XATTR
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Controls the operation tracer of a mounted filesystem, and '
+        'summarizes the latency of the operations it recorded.')
+    parser.add_argument('mount',
+                        help='The directory the filesystem is mounted under, or with '
+                        '--file a trace file to summarize.')
+    parser.add_argument('command', nargs='*', default=['dump'],
+                        help='off, on or print to set the trace level, "sample N" to '
+                        'record one in every N operations, clear to empty the buffer or '
+                        'dump to summarize the recorded operations. (Default=dump)')
+    parser.add_argument('-f', '--file', action='store_true',
+                        help='Summarize a trace file written by an earlier dump.')
+    args = parser.parse_args()
+
+    if args.file:
+        print_summary(args.mount)
+        return
+
+    command = ' '.join(args.command)
+    os.setxattr(args.mount, TRACE_XATTR, command.encode('utf-8'))
+
+    status = json.loads(os.getxattr(args.mount, TRACE_XATTR).decode('utf-8'))
+    if command == 'dump':
+        print_summary(status['file'])
+    else:
+        print(json.dumps(status, sort_keys=True))
+
+
+def print_summary(trace_file):
+    with open(trace_file) as f:
+        records = json.load(f)['records']
+
+    summary = Tracer.summarize(records)
+    outcomes = (Tracer.HIT, Tracer.READ, Tracer.MISS)
+
+    print('%-12s %8s %9s %9s %9s %9s %10s %7s %7s %7s' % (
+        'operation', 'count', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'mean size', *outcomes))
+    for operation, s in sorted(summary.items(), key=lambda item: -item[1]['count']):
+        print('%-12s %8d %9.3f %9.3f %9.3f %9.3f %10d %7d %7d %7d' % (
+            operation, s['count'], s['p50'], s['p90'], s['p99'], s['max'], s['mean_size'],
+            *(s['outcomes'].get(outcome, 0) for outcome in outcomes)))
+
+
+if __name__ == '__main__':
+    main()
@@ -131,7 +131,8 @@ setup(
     entry_points={  # Optional
         'console_scripts': [
             'mount.s3logfs=s3logfs.mount:main',
-            'mkfs.s3logfs=s3logfs.mkfs:main'
+            'mkfs.s3logfs=s3logfs.mkfs:main',
+            'trace.s3logfs=s3logfs.trace:main'
         ],
     },
 )
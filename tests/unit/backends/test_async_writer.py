@@ -86,3 +86,17 @@ class TestAsyncWriter(TestCase):
                 cache.put_segment(i, segment_bytes)
             cache.flush()
             self.assertEqual(len(cache._segments_being_written), 0)
+
+    def test_put_segment_should_wait_for_earlier_write_of_same_segment(self):
+        segment_number = 123
+        backend = Mock()
+        backend.put_segment.side_effect = lambda _a, _b: sleep(0.01)
+
+        with AsyncWriter(backend, 4, 2) as cache:
+            cache.put_segment(segment_number, b'partial')
+            cache.put_segment(segment_number, b'complete')
+            self.assertEqual(backend.put_segment.call_count, 1)
+
+        backend.put_segment.assert_has_calls([
+            call(segment_number, b'partial'),
+            call(segment_number, b'complete')])
@@ -75,3 +75,14 @@ class TestMemoryCache(TestCase):
         cache.put_checkpoint(checkpoint_bytes)
 
         backend.put_checkpoint.assert_called_once_with(checkpoint_bytes)
+
+    def test_is_cached_should_check_the_cache_then_the_backend(self):
+        backend = Mock()
+        backend.is_cached.return_value = False
+        cache = MemoryCache(backend, 123)
+
+        cache.put_segment(1, b'abc')
+
+        self.assertTrue(cache.is_cached(1))
+        self.assertFalse(cache.is_cached(2))
+        backend.is_cached.assert_called_once_with(2)
@@ -0,0 +1,36 @@
+from unittest import TestCase
+from s3logfs.fs import AddressArray, BlockAddress
+
+
+class TestAddressArray(TestCase):
+    def test_new_array_should_hold_empty_addresses(self):
+        addresses = AddressArray(4)
+
+        self.assertEqual(len(addresses), 4)
+        self.assertEqual(list(addresses), 4 * [BlockAddress()])
+
+    def test_get_should_return_the_set_address(self):
+        addresses = AddressArray(4)
+
+        addresses[2] = BlockAddress(123, 456)
+
+        self.assertEqual(addresses[2], BlockAddress(123, 456))
+        self.assertEqual(addresses.used_length(), 3)
+
+    def test_get_and_set_bytes(self):
+        addresses = AddressArray(4)
+        addresses[1] = BlockAddress(123, 456)
+        addresses[2] = BlockAddress(789, 12)
+
+        data = addresses.get_bytes(1, 2)
+        copy = AddressArray(4)
+        copy.set_bytes(1, data)
+
+        self.assertEqual(data, BlockAddress(123, 456).to_bytes() + BlockAddress(789, 12).to_bytes())
+        self.assertEqual(copy, addresses)
+
+    def test_set_bytes_past_the_end_should_raise(self):
+        addresses = AddressArray(1)
+
+        with self.assertRaises(IndexError):
+            addresses.set_bytes(0, 2 * BlockAddress(1, 2).to_bytes())
@@ -0,0 +1,35 @@
+from unittest import TestCase
+from s3logfs.fs import AddressBlock, BlockAddress
+
+
+class TestAddressBlock(TestCase):
+    def test_get_address_should_decode_the_address_at_the_offset(self):
+        data = BlockAddress(1, 2).to_bytes() + BlockAddress(3, 4).to_bytes()
+
+        block = AddressBlock(data)
+
+        self.assertEqual(block.count(), 2)
+        self.assertEqual(block.get_address(1), BlockAddress(3, 4))
+
+    def test_set_address_should_update_the_bytes(self):
+        block = AddressBlock(bytes(4 * BlockAddress.get_address_size()))
+
+        block.set_address(BlockAddress(3, 4), 2)
+
+        self.assertEqual(block.get_address(2), BlockAddress(3, 4))
+        self.assertEqual(block.get_bytes()[16:24], BlockAddress(3, 4).to_bytes())
+
+    def test_set_addresses_should_replace_a_range(self):
+        block = AddressBlock(bytes(4 * BlockAddress.get_address_size()))
+        addresses = [BlockAddress(5, 6), BlockAddress(7, 8)]
+
+        block.set_addresses(addresses, 1)
+
+        self.assertEqual(block.get_addresses(0, 4),
+                         [BlockAddress()] + addresses + [BlockAddress()])
+
+    def test_set_addresses_past_the_end_should_raise(self):
+        block = AddressBlock(bytes(2 * BlockAddress.get_address_size()))
+
+        with self.assertRaises(IndexError):
+            block.set_addresses([BlockAddress(5, 6), BlockAddress(7, 8)], 1)
@@ -24,3 +24,19 @@ class TestBlockAddress(unittest.TestCase):
                             hash(BlockAddress(123, 999)))
         self.assertNotEqual(hash(BlockAddress(123, 456)),
                             hash(BlockAddress(999, 456)))
+
+    def test_to_and_from_packed(self):
+        address = BlockAddress(123, 456)
+
+        unpacked_address = BlockAddress.from_packed(address.to_packed())
+
+        self.assertEqual(unpacked_address, address)
+
+    def test_packed_array_should_match_the_encoded_bytes(self):
+        addresses = [BlockAddress(123, 456), BlockAddress(2**48 - 1, 2**16 - 1)]
+        data = b''.join(address.to_bytes() for address in addresses)
+
+        packed = BlockAddress.packed_array_from_bytes(data)
+
+        self.assertEqual(list(packed), [a.to_packed() for a in addresses])
+        self.assertEqual(BlockAddress.packed_array_to_bytes(packed), data)
@@ -1,3 +1,4 @@
+import pickle
 from unittest import TestCase
 from s3logfs.fs import CheckpointRegion, BlockAddress
 
@@ -15,3 +16,30 @@ class TestCheckpoint(TestCase):
 
         self.assertEqual(deserialized.current_segment_id(), segment_id)
         self.assertEqual(deserialized.inode_map[inode_id], inode_address)
+
+    def test_layout_should_default_to_blocks_for_old_checkpoints(self):
+        checkpoint = CheckpointRegion(layout=CheckpointRegion.EXTENT_LAYOUT)
+        self.assertEqual(CheckpointRegion.from_bytes(checkpoint.to_bytes()).layout,
+                         CheckpointRegion.EXTENT_LAYOUT)
+
+        # a checkpoint written before the layout was recorded
+        del checkpoint.layout
+        deserialized = CheckpointRegion.from_bytes(pickle.dumps(checkpoint))
+
+        self.assertEqual(deserialized.layout, CheckpointRegion.BLOCK_LAYOUT)
+
+    def test_snapshot_should_not_see_later_changes(self):
+        checkpoint = CheckpointRegion()
+        checkpoint.set_inode_address(1, BlockAddress(1, 1))
+        checkpoint.set_inode_address(2, BlockAddress(1, 2))
+
+        snapshot = checkpoint.snapshot()
+        checkpoint.set_inode_address(1, BlockAddress(2, 1))
+        checkpoint.remove_inode(2)
+        checkpoint.set_time(7)
+
+        self.assertEqual(dict(snapshot.inode_map), {1: BlockAddress(1, 1), 2: BlockAddress(1, 2)})
+        self.assertEqual(dict(checkpoint.inode_map), {1: BlockAddress(2, 1)})
+        self.assertEqual(snapshot.time(), 0)
+        deserialized = CheckpointRegion.from_bytes(snapshot.to_bytes())
+        self.assertEqual(deserialized.inode_map[2], BlockAddress(1, 2))
@@ -0,0 +1,81 @@
+from unittest import TestCase
+from s3logfs.fs import DentryCache
+
+
+class TestDentryCache(TestCase):
+    def test_get_should_return_the_put_inode_number(self):
+        cache = DentryCache(16)
+
+        cache.put(1, 'a', 7)
+
+        self.assertEqual(cache.get(1, 'a'), 7)
+        self.assertIsNone(cache.get(2, 'a'))
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_get_should_return_negative_for_names_cached_as_missing(self):
+        cache = DentryCache(16)
+
+        cache.put(1, 'a', DentryCache.NEGATIVE)
+
+        self.assertEqual(cache.get(1, 'a'), DentryCache.NEGATIVE)
+        stats = cache.stats()
+        self.assertEqual(stats['negative_entries'], 1)
+        self.assertEqual(stats['negative_hits'], 1)
+        self.assertEqual(stats['hit_rate'], 1.0)
+
+    def test_put_should_replace_a_negative_entry(self):
+        cache = DentryCache(16)
+        cache.put(1, 'a', DentryCache.NEGATIVE)
+
+        cache.put(1, 'a', 7)
+
+        self.assertEqual(cache.get(1, 'a'), 7)
+        self.assertEqual(cache.stats()['entries'], 1)
+        self.assertEqual(cache.stats()['negative_entries'], 0)
+
+    def test_invalidate_should_remove_the_entry(self):
+        cache = DentryCache(16)
+        cache.put(1, 'a', 7)
+        cache.put(1, 'b', DentryCache.NEGATIVE)
+
+        cache.invalidate(1, 'a')
+        cache.invalidate(1, 'b')
+        cache.invalidate(1, 'c')
+
+        self.assertIsNone(cache.get(1, 'a'))
+        self.assertIsNone(cache.get(1, 'b'))
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual(cache.stats()['negative_entries'], 0)
+
+    def test_put_should_evict_least_recently_used_entries(self):
+        cache = DentryCache(3)
+
+        for i in range(3):
+            cache.put(1, str(i), i + 1)
+        cache.get(1, '0')
+        cache.put(1, '3', 4)
+
+        self.assertEqual(cache.get(1, '0'), 1)
+        self.assertIsNone(cache.get(1, '1'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['entries'], 3)
+
+    def test_put_should_do_nothing_when_the_cache_is_disabled(self):
+        cache = DentryCache(0)
+
+        cache.put(1, 'a', 7)
+
+        self.assertIsNone(cache.get(1, 'a'))
+
+    def test_evicted_negative_entries_should_not_be_counted(self):
+        cache = DentryCache(2)
+
+        cache.put(1, 'a', DentryCache.NEGATIVE)
+        cache.put(1, 'b', 7)
+        cache.put(1, 'c', 8)
+
+        self.assertEqual(cache.stats()['negative_entries'], 0)
+        self.assertEqual(cache.stats()['evictions'], 1)
@@ -0,0 +1,119 @@
+from stat import S_IFDIR, S_IFLNK, S_IFREG
+from struct import Struct
+from unittest import TestCase
+from s3logfs.fs import DirectoryBlock
+
+BLOCK_SIZE = 128
+
+
+class TestDirectoryBlock(TestCase):
+    def test_to_and_from_bytes(self):
+        block = DirectoryBlock(BLOCK_SIZE)
+        block.add('a file', 12, DirectoryBlock.file_type(S_IFREG | 0o644))
+        block.add('ünïcode', 2**40, DirectoryBlock.file_type(S_IFDIR | 0o755))
+
+        new_block = DirectoryBlock.from_bytes(block.to_bytes(), BLOCK_SIZE)
+
+        self.assertEqual(new_block.entries, block.entries)
+        self.assertEqual(new_block.file_types, block.file_types)
+        self.assertEqual(new_block.used_bytes(), len(block.to_bytes()))
+
+    def test_from_version_1_bytes_should_have_unknown_file_types(self):
+        entry = Struct('<QB')
+        data = Struct('<HH').pack(1, 2) + entry.pack(12, 1) + b'a' + \
+            entry.pack(13, 2) + b'bc'
+
+        block = DirectoryBlock.from_bytes(data, BLOCK_SIZE)
+
+        self.assertEqual(block.entries, {'a': 12, 'bc': 13})
+        self.assertEqual(block.get_file_type('a'), DirectoryBlock.UNKNOWN_TYPE)
+        # re-encoding adds a file type to every entry
+        self.assertEqual(block.used_bytes(), len(data) + 2)
+        self.assertEqual(block.used_bytes(), len(block.to_bytes()))
+
+    def test_file_type_should_be_the_d_type_of_the_mode(self):
+        for mode in (S_IFREG, S_IFDIR, S_IFLNK):
+            file_type = DirectoryBlock.file_type(mode | 0o755)
+
+            self.assertLess(file_type, 16)
+            self.assertEqual(DirectoryBlock.type_mode(file_type), mode)
+
+    def test_from_empty_or_zero_bytes(self):
+        self.assertEqual(len(DirectoryBlock.from_bytes(b'', BLOCK_SIZE)), 0)
+        self.assertEqual(len(DirectoryBlock.from_bytes(bytes(BLOCK_SIZE), BLOCK_SIZE)), 0)
+
+    def test_add_should_refuse_entries_which_do_not_fit(self):
+        block = DirectoryBlock(BLOCK_SIZE)
+        count = 0
+        while block.add('name%03d' % count, count):
+            count += 1
+
+        self.assertLessEqual(len(block.to_bytes()), BLOCK_SIZE)
+        self.assertEqual(len(block), count)
+        # replacing an existing entry needs no more room
+        self.assertTrue(block.add('name000', 99))
+        self.assertEqual(block.get('name000'), 99)
+
+    def test_remove_should_return_the_inode_number(self):
+        block = DirectoryBlock(BLOCK_SIZE)
+        block.add('a', 1)
+        length = block.used_bytes()
+        block.add('b', 2)
+
+        self.assertEqual(block.remove('b'), 2)
+        self.assertEqual(block.used_bytes(), length)
+        with self.assertRaises(KeyError):
+            block.remove('b')
+
+    def test_split_should_move_the_entries_of_the_new_bucket(self):
+        block = DirectoryBlock(4096)
+        names = ['entry%d' % i for i in range(100)]
+        for i, name in enumerate(names):
+            block.add(name, i, i % 16)
+
+        # one bucket becoming two
+        new_block = block.split(1, 1)
+
+        self.assertEqual(len(block) + len(new_block), len(names))
+        for name in names:
+            index = DirectoryBlock.bucket_index(DirectoryBlock.hash_name(name), 2)
+            self.assertIn(name, (block, new_block)[index].entries)
+            self.assertEqual((block, new_block)[index].get_file_type(name),
+                             names.index(name) % 16)
+
+    def test_bucket_index_should_only_use_an_extra_bit_below_the_split(self):
+        name_hash = 0b1110
+
+        self.assertEqual(DirectoryBlock.bucket_index(name_hash, 1), 0)
+        self.assertEqual(DirectoryBlock.bucket_index(name_hash, 4), 0b10)
+        # bucket 2 has not been split yet with 5 or 6 buckets
+        self.assertEqual(DirectoryBlock.bucket_index(name_hash, 6), 0b10)
+        self.assertEqual(DirectoryBlock.bucket_index(name_hash, 7), 0b110)
+
+    def test_entry_positions_should_not_change_when_other_entries_are_removed(self):
+        names = ['entry%d' % i for i in range(20)]
+        positions = dict((name, position) for position, name in
+                         DirectoryBlock.entry_positions(names))
+
+        result = DirectoryBlock.entry_positions(names[::2])
+
+        self.assertEqual(result, sorted((positions[name], name) for name in names[::2]))
+
+    def test_bucket_ranges_should_cover_every_position_in_order(self):
+        names = ['entry%d' % i for i in range(200)]
+        positions = DirectoryBlock.entry_positions(names)
+
+        for bucket_count in range(1, 12):
+            listed = []
+            index = 0
+            while True:
+                end = DirectoryBlock.bucket_end(index, bucket_count)
+                listed.extend(
+                    (position, name) for position, name in positions
+                    if DirectoryBlock.bucket_index(DirectoryBlock.hash_name(name),
+                                                   bucket_count) == index)
+                if end is None:
+                    break
+                index = DirectoryBlock.position_bucket(end, bucket_count)
+
+            self.assertEqual(listed, positions)
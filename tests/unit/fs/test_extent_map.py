@@ -0,0 +1,143 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+from s3logfs.fs import Log, BlockAddress, ExtentMap
+
+BLOCK_SIZE = 256
+
+
+def make_addresses(count, segment_id=100, first_offset=0):
+    return [BlockAddress(segment_id, first_offset + i) for i in range(count)]
+
+
+class TestExtentMap(TestCase):
+    def setUp(self):
+        self.log = Log(1, Mock(), block_size=BLOCK_SIZE)
+
+    def test_consecutive_addresses_should_make_one_extent(self):
+        extents = ExtentMap()
+        addresses = make_addresses(10) + make_addresses(5, segment_id=101)
+
+        extents.set_addresses(3, addresses)
+
+        self.assertEqual(len(extents), 2)
+        self.assertEqual(extents.get_addresses(3, 15), addresses)
+        self.assertEqual(extents.get_addresses(0, 3), [BlockAddress()] * 3)
+        self.assertEqual(extents.get_addresses(17, 2), [addresses[-1], BlockAddress()])
+
+    def test_sequential_writes_should_extend_the_last_extent(self):
+        extents = ExtentMap()
+
+        extents.set_addresses(0, make_addresses(4))
+        extents.set_addresses(4, make_addresses(4, first_offset=4))
+
+        self.assertEqual(len(extents), 1)
+        self.assertEqual(extents.get_addresses(0, 8), make_addresses(8))
+
+    def test_overwriting_the_middle_should_split_the_extent(self):
+        extents = ExtentMap()
+        extents.set_addresses(0, make_addresses(10))
+        new_addresses = make_addresses(2, segment_id=200)
+
+        extents.set_addresses(4, new_addresses)
+
+        self.assertEqual(len(extents), 3)
+        self.assertEqual(extents.get_addresses(0, 10),
+                         make_addresses(4) + new_addresses + make_addresses(4, first_offset=6))
+
+    def test_overwriting_several_extents_should_replace_them(self):
+        extents = ExtentMap()
+        for i in range(5):
+            extents.set_addresses(i * 4, make_addresses(4, segment_id=i + 1))
+        new_addresses = make_addresses(10, segment_id=200)
+
+        extents.set_addresses(3, new_addresses)
+
+        self.assertEqual(len(extents), 4)
+        self.assertEqual(extents.get_addresses(0, 20),
+                         make_addresses(3, segment_id=1) + new_addresses +
+                         make_addresses(3, segment_id=4, first_offset=1) +
+                         make_addresses(4, segment_id=5))
+
+    def test_empty_addresses_should_make_holes(self):
+        extents = ExtentMap()
+        extents.set_addresses(0, make_addresses(6))
+
+        extents.set_addresses(2, [BlockAddress(), BlockAddress()])
+
+        self.assertEqual(len(extents), 2)
+        self.assertEqual(extents.get_addresses(0, 6),
+                         make_addresses(2) + [BlockAddress()] * 2 + make_addresses(2, first_offset=4))
+
+    def test_small_maps_should_be_stored_inline(self):
+        extents = ExtentMap()
+        extents.set_addresses(0, make_addresses(4))
+        extents.set_addresses(10, make_addresses(4, segment_id=101))
+
+        extents.flush(self.log)
+        new_extents = ExtentMap.from_bytes(extents.to_bytes())
+
+        self.assertTrue(new_extents.is_loaded())
+        self.assertEqual(new_extents, extents)
+        self.assertEqual(self.log.get_current_segment_id(), 1)
+
+    def test_large_maps_should_be_stored_in_leaf_blocks(self):
+        extents = ExtentMap()
+        extent_count = ExtentMap.leaf_capacity(BLOCK_SIZE) * 2 + 1
+        for i in range(extent_count):
+            extents.set_addresses(i, [BlockAddress(i + 1, 0)])
+
+        with self.assertRaises(ValueError):
+            extents.to_bytes()
+
+        extents.flush(self.log)
+        new_extents = ExtentMap.from_bytes(extents.to_bytes())
+
+        self.assertFalse(new_extents.is_loaded())
+        new_extents.load(self.log)
+        self.assertEqual(new_extents, extents)
+        self.assertEqual(new_extents.get_addresses(extent_count - 1, 1),
+                         [BlockAddress(extent_count, 0)])
+
+    def test_flush_should_only_write_changed_leaves(self):
+        extents = ExtentMap()
+        capacity = ExtentMap.leaf_capacity(BLOCK_SIZE)
+        for i in range(capacity * 3):
+            extents.set_addresses(i, [BlockAddress(i + 1, 0)])
+        extents.flush(self.log)
+
+        extents.set_addresses(capacity * 3 - 1, [BlockAddress(999, 0)])
+        with patch.object(self.log, 'write_data_block', wraps=self.log.write_data_block) as write:
+            extents.flush(self.log)
+
+        self.assertEqual(write.call_count, 1)
+
+    def test_maps_with_more_leaves_than_fit_in_an_inode_should_use_index_blocks(self):
+        extents = ExtentMap()
+        capacity = ExtentMap.leaf_capacity(BLOCK_SIZE)
+        # more leaves, and more index blocks of those, than an inode refers to
+        extent_count = capacity * capacity * (ExtentMap.max_leaves(BLOCK_SIZE) + 1)
+        for i in range(extent_count):
+            extents.set_addresses(i * 2, [BlockAddress(i + 1, 0)])
+
+        extents.flush(self.log)
+        new_extents = ExtentMap.from_bytes(extents.to_bytes())
+        new_extents.load(self.log)
+
+        self.assertEqual(new_extents, extents)
+        self.assertEqual(new_extents.get_addresses(extent_count * 2 - 2, 2),
+                         [BlockAddress(extent_count, 0), BlockAddress()])
+
+    def test_flush_should_only_write_a_changed_leaf_and_the_index_blocks_above_it(self):
+        extents = ExtentMap()
+        capacity = ExtentMap.leaf_capacity(BLOCK_SIZE)
+        extent_count = capacity * capacity * (ExtentMap.max_leaves(BLOCK_SIZE) + 1)
+        for i in range(extent_count):
+            extents.set_addresses(i * 2, [BlockAddress(i + 1, 0)])
+        extents.flush(self.log)
+
+        extents.set_addresses(0, [BlockAddress(999, 0)])
+        with patch.object(self.log, 'write_data_block', wraps=self.log.write_data_block) as write:
+            extents.flush(self.log)
+
+        # the leaf, its index block and the index block above that
+        self.assertEqual(write.call_count, 3)
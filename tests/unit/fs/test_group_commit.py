@@ -0,0 +1,68 @@
+from unittest import TestCase
+from unittest.mock import Mock
+from threading import Event
+from time import sleep
+from s3logfs.fs import GroupCommit
+
+
+class TestGroupCommit(TestCase):
+    def test_request_should_call_callback_after_sync(self):
+        log = Mock()
+        done = Event()
+        results = []
+
+        def callback(error):
+            results.append((error, log.sync.call_count))
+            done.set()
+
+        with GroupCommit(log) as group_commit:
+            group_commit.request(callback)
+            self.assertTrue(done.wait(1))
+
+        self.assertEqual(results, [(None, 1)])
+
+    def test_requests_during_a_sync_should_share_the_next_sync(self):
+        log = Mock()
+        log.sync.side_effect = lambda: sleep(0.05)
+        request_count = 10
+        errors = []
+
+        with GroupCommit(log) as group_commit:
+            for _ in range(request_count):
+                group_commit.request(errors.append)
+
+        self.assertEqual(errors, request_count * [None])
+        self.assertLessEqual(log.sync.call_count, 2)
+        self.assertEqual(group_commit.request_count(), request_count)
+        self.assertEqual(group_commit.commit_count(), log.sync.call_count)
+
+    def test_commit_delay_should_batch_closely_spaced_requests(self):
+        log = Mock()
+        errors = []
+
+        with GroupCommit(log, commit_delay=0.05) as group_commit:
+            group_commit.request(errors.append)
+            sleep(0.01)
+            group_commit.request(errors.append)
+
+        self.assertEqual(errors, [None, None])
+        log.sync.assert_called_once_with()
+
+    def test_sync_failure_should_be_passed_to_callbacks(self):
+        log = Mock()
+        failure = IOError()
+        log.sync.side_effect = failure
+        errors = []
+
+        with GroupCommit(log) as group_commit:
+            group_commit.request(errors.append)
+
+        self.assertEqual(errors, [failure])
+
+    def test_stop_without_requests_should_not_sync(self):
+        log = Mock()
+
+        with GroupCommit(log):
+            pass
+
+        log.sync.assert_not_called()
@@ -0,0 +1,86 @@
+from unittest import TestCase
+from unittest.mock import Mock
+from s3logfs.fs import Log, INode, BlockAddress, IndirectBlockCache
+
+BLOCK_SIZE = 64
+ADDRESSES_PER_BLOCK = BLOCK_SIZE // BlockAddress.get_address_size()
+LVL2_START = INode.NUMBER_OF_DIRECT_BLOCKS + ADDRESSES_PER_BLOCK
+
+
+def make_inode(inode_number=7):
+    inode = INode()
+    inode.inode_number = inode_number
+    return inode
+
+
+def make_addresses(count, segment_id=100):
+    return [BlockAddress(segment_id, i) for i in range(count)]
+
+
+class TestIndirectBlockCache(TestCase):
+    def setUp(self):
+        self.log = Log(1, Mock(), block_size=BLOCK_SIZE)
+
+    def test_get_addresses_should_return_the_set_addresses(self):
+        cache = IndirectBlockCache(self.log, 100)
+        inode = make_inode()
+        addresses = make_addresses(20)
+
+        cache.set_addresses(inode, LVL2_START - 4, addresses)
+
+        self.assertEqual(cache.get_addresses(inode, LVL2_START - 4, 20), addresses)
+        self.assertEqual(cache.get_addresses(inode, LVL2_START + 16, 1), [BlockAddress()])
+        self.assertTrue(cache.has_dirty_blocks(inode.inode_number))
+        self.assertEqual(inode.indirect_lvl1, BlockAddress())
+
+    def test_flush_should_write_the_blocks_and_set_the_inode_roots(self):
+        cache = IndirectBlockCache(self.log, 100)
+        inode = make_inode()
+        addresses = make_addresses(20)
+        cache.set_addresses(inode, LVL2_START - 4, addresses)
+
+        cache.flush(inode)
+        cache.discard(inode.inode_number)
+
+        # lvl1 root, lvl2 root and its first two children
+        self.assertEqual(cache.stats()['written_blocks'], 4)
+        self.assertNotEqual(inode.indirect_lvl1, BlockAddress())
+        self.assertNotEqual(inode.indirect_lvl2, BlockAddress())
+        self.assertFalse(cache.has_dirty_blocks(inode.inode_number))
+        self.assertEqual(cache.get_addresses(inode, LVL2_START - 4, 20), addresses)
+
+    def test_repeated_updates_of_a_block_should_write_it_once(self):
+        cache = IndirectBlockCache(self.log, 100)
+        inode = make_inode()
+
+        for i in range(ADDRESSES_PER_BLOCK):
+            cache.set_addresses(inode, INode.NUMBER_OF_DIRECT_BLOCKS + i, make_addresses(1))
+        cache.flush(inode)
+
+        self.assertEqual(cache.stats()['updates'], ADDRESSES_PER_BLOCK)
+        self.assertEqual(cache.stats()['written_blocks'], 1)
+
+    def test_flush_of_clean_blocks_should_write_nothing(self):
+        cache = IndirectBlockCache(self.log, 100)
+        inode = make_inode()
+        cache.set_addresses(inode, INode.NUMBER_OF_DIRECT_BLOCKS, make_addresses(1))
+        cache.flush(inode)
+
+        cache.flush(inode)
+
+        self.assertEqual(cache.stats()['written_blocks'], 1)
+
+    def test_is_full_when_over_max_blocks(self):
+        cache = IndirectBlockCache(self.log, 2)
+        cache.set_addresses(make_inode(7), INode.NUMBER_OF_DIRECT_BLOCKS, make_addresses(1))
+        cache.set_addresses(make_inode(8), INode.NUMBER_OF_DIRECT_BLOCKS, make_addresses(1))
+        self.assertFalse(cache.is_full())
+
+        cache.set_addresses(make_inode(9), INode.NUMBER_OF_DIRECT_BLOCKS, make_addresses(1))
+
+        self.assertTrue(cache.is_full())
+        self.assertEqual(cache.oldest_inode_number(), 7)
+
+        cache.discard(7)
+        self.assertFalse(cache.is_full())
+        self.assertEqual(cache.inode_numbers(), [8, 9])
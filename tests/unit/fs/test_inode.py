@@ -3,13 +3,15 @@ import unittest
 import math
 
 from time import time
-from s3logfs.fs import INode, BlockAddress
+from s3logfs.fs import INode, BlockAddress, ExtentMap
 from stat import S_IFDIR
 
 
 class TestINode(unittest.TestCase):
     def test_number_of_direct_blocks(self):
-        self.assertEqual(INode.NUMBER_OF_DIRECT_BLOCKS, 16)
+        # version 0 inodes store exactly this many direct addresses, so it
+        # cannot change without breaking existing file systems
+        self.assertEqual(INode.NUMBER_OF_DIRECT_BLOCKS, 375)
 
     def test_struct_format(self):
         self.assertEqual(INode.STRUCT_FORMAT, 'QQQIIIIIIIddd')
@@ -64,3 +66,106 @@ class TestINode(unittest.TestCase):
         new_inode = INode.from_bytes(out_bytes + padding)
 
         self.assertEqual(new_inode.block_addresses, inode.block_addresses)
+
+    def test_memory_size_should_not_depend_on_the_addresses_used(self):
+        inode = INode()
+        larger_inode = INode()
+        for i in range(10):
+            larger_inode.block_addresses[i] = BlockAddress(1, i)
+
+        self.assertGreater(inode.memory_size(), 0)
+        self.assertEqual(larger_inode.memory_size(), inode.memory_size())
+
+    def test_to_bytes_should_only_store_used_direct_addresses(self):
+        inode = INode()
+        empty_bytes = inode.to_bytes()
+        inode.block_addresses[1] = BlockAddress(456, 45)
+
+        out_bytes = inode.to_bytes()
+
+        address_size = BlockAddress.get_address_size()
+        self.assertEqual(len(empty_bytes), INode.HEADER_STRUCT.size + INode.STRUCT.size)
+        self.assertEqual(len(out_bytes), len(empty_bytes) + 2 * address_size)
+
+    def test_to_and_from_bytes_with_indirect_addresses(self):
+        inode = INode()
+        inode.indirect_lvl2 = BlockAddress(789, 99)
+
+        new_inode = INode.from_bytes(inode.to_bytes())
+
+        self.assertEqual(new_inode.indirect_lvl1, BlockAddress())
+        self.assertEqual(new_inode.indirect_lvl2, inode.indirect_lvl2)
+        self.assertEqual(new_inode.indirect_lvl3, BlockAddress())
+        self.assertEqual(new_inode.block_addresses, inode.block_addresses)
+
+    def test_to_and_from_bytes_with_extents(self):
+        inode = INode()
+        inode.indirect_lvl1 = BlockAddress(789, 99)
+        inode.extents = ExtentMap()
+        inode.extents.set_addresses(10, [BlockAddress(5, 1), BlockAddress(5, 2)])
+
+        new_inode = INode.from_bytes(inode.to_bytes())
+
+        self.assertEqual(new_inode.indirect_lvl1, inode.indirect_lvl1)
+        self.assertEqual(new_inode.extents, inode.extents)
+        self.assertIsNone(INode.from_bytes(INode().to_bytes()).extents)
+
+    def test_to_and_from_bytes_with_inline_data(self):
+        inode = INode()
+        inode.extents = ExtentMap()
+        inode.block_addresses[0] = BlockAddress(789, 99)
+        inode.set_inline_data(b'inline contents')
+
+        new_inode = INode.from_bytes(inode.to_bytes())
+
+        self.assertEqual(new_inode.inline_data, b'inline contents')
+        self.assertEqual(new_inode.extents, inode.extents)
+        self.assertEqual(new_inode.block_addresses[0], BlockAddress())
+        self.assertEqual(INode.from_bytes(INode().to_bytes()).inline_data, None)
+
+    def test_empty_inline_data_should_be_kept(self):
+        inode = INode()
+        inode.inline_data = b''
+
+        self.assertEqual(INode.from_bytes(inode.to_bytes()).inline_data, b'')
+
+    def test_to_and_from_bytes_with_entry_count(self):
+        inode = INode()
+        inode.mode = S_IFDIR | 0o755
+        inode.entry_count = 1234
+        inode.inline_data = b'entries'
+
+        new_inode = INode.from_bytes(inode.to_bytes())
+
+        self.assertTrue(new_inode.is_hashed_directory())
+        self.assertEqual(new_inode.entry_count, 1234)
+        self.assertEqual(new_inode.inline_data, b'entries')
+        self.assertFalse(INode.from_bytes(INode().to_bytes()).is_hashed_directory())
+
+    def test_from_version_0_bytes(self):
+        inode = INode()
+        inode.inode_number = 123
+        inode.size = 456
+        inode.block_addresses[2] = BlockAddress(123, 12)
+        inode.indirect_lvl1 = BlockAddress(789, 99)
+
+        # the original encoding has no header and stores every address
+        data = bytearray(inode._pack_fields())
+        for address in inode.block_addresses:
+            data.extend(address.to_bytes())
+        for address in (inode.indirect_lvl1, inode.indirect_lvl2, inode.indirect_lvl3):
+            data.extend(address.to_bytes())
+
+        new_inode = INode.from_bytes(bytes(data))
+
+        self.assertEqual(new_inode.inode_number, inode.inode_number)
+        self.assertEqual(new_inode.size, inode.size)
+        self.assertEqual(new_inode.block_addresses, inode.block_addresses)
+        self.assertEqual(new_inode.indirect_lvl1, inode.indirect_lvl1)
+
+    def test_from_bytes_should_reject_unknown_versions(self):
+        data = bytearray(INode().to_bytes())
+        data[:INode.HEADER_STRUCT.size] = INode.HEADER_STRUCT.pack((INode.VERSION + 1) << 56)
+
+        with self.assertRaises(ValueError):
+            INode.from_bytes(bytes(data))
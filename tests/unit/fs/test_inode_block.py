@@ -0,0 +1,30 @@
+from unittest import TestCase
+from s3logfs.fs import INodeBlock
+
+
+class TestINodeBlock(TestCase):
+    def test_read_slot_should_return_each_added_inode(self):
+        block = INodeBlock(64)
+        inodes = [b'abc', b'', b'defgh']
+
+        slots = [block.add(inode_bytes) for inode_bytes in inodes]
+        block_bytes = block.to_bytes() + b'\0' * 16  # padded like a log block
+
+        self.assertEqual(slots, [0, 1, 2])
+        for slot, inode_bytes in zip(slots, inodes):
+            self.assertEqual(INodeBlock.read_slot(block_bytes, slot), inode_bytes)
+
+    def test_add_should_return_none_when_the_block_is_full(self):
+        block = INodeBlock(16)
+
+        self.assertEqual(block.add(10 * b'a'), 0)
+        self.assertIsNone(block.add(b'a'))
+        self.assertEqual(len(block), 1)
+        self.assertEqual(len(block.to_bytes()), 14)
+
+    def test_read_slot_past_the_last_inode_should_raise(self):
+        block = INodeBlock(64)
+        block.add(b'abc')
+
+        with self.assertRaises(IndexError):
+            INodeBlock.read_slot(block.to_bytes(), 1)
@@ -0,0 +1,65 @@
+from unittest import TestCase
+from s3logfs.fs import INode, INodeCache
+
+
+def make_inode(inode_number):
+    inode = INode()
+    inode.inode_number = inode_number
+    return inode
+
+
+class TestINodeCache(TestCase):
+    def test_get_should_return_the_put_inode(self):
+        cache = INodeCache(2**20)
+        inode = make_inode(7)
+
+        cache.put(inode)
+
+        self.assertIs(cache.get(7), inode)
+        self.assertIsNone(cache.get(8))
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_put_should_replace_the_cached_inode(self):
+        cache = INodeCache(2**20)
+        cache.put(make_inode(7))
+        inode = make_inode(7)
+
+        cache.put(inode)
+
+        self.assertIs(cache.get(7), inode)
+        self.assertEqual(cache.stats()['entries'], 1)
+        self.assertEqual(cache.stats()['bytes'], inode.memory_size())
+
+    def test_invalidate_should_remove_the_inode(self):
+        cache = INodeCache(2**20)
+        cache.put(make_inode(7))
+
+        cache.invalidate(7)
+        cache.invalidate(8)
+
+        self.assertIsNone(cache.get(7))
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_put_should_evict_least_recently_used_inodes_over_max_bytes(self):
+        inode_size = make_inode(0).memory_size()
+        cache = INodeCache(3 * inode_size)
+
+        for i in range(3):
+            cache.put(make_inode(i))
+        cache.get(0)
+        cache.put(make_inode(3))
+
+        self.assertIsNotNone(cache.get(0))
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertLessEqual(cache.stats()['bytes'], 3 * inode_size)
+
+    def test_put_should_ignore_inode_larger_than_the_cache(self):
+        cache = INodeCache(1)
+
+        cache.put(make_inode(7))
+
+        self.assertIsNone(cache.get(7))
+        self.assertEqual(cache.stats()['entries'], 0)
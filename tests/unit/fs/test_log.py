@@ -1,6 +1,6 @@
 from unittest import TestCase
-from unittest.mock import Mock, ANY
-from s3logfs.fs import Log, ReadOnlySegment, ReadWriteSegment, BlockAddress
+from unittest.mock import Mock, ANY, call
+from s3logfs.fs import Log, ReadOnlySegment, ReadWriteSegment, BlockAddress, INodeAddress, CacheMiss
 
 
 class TestLog(TestCase):
@@ -122,3 +122,226 @@ class TestLog(TestCase):
         self.assertEqual(log.get_current_segment_id(), current_segment_id)
         backend.put_segment.assert_not_called()
         backend.flush.assert_called_once_with()
+
+    def test_sync_should_put_a_partial_segment_without_advancing(self):
+        current_segment_id = 123
+        block_size = 128
+        backend = Mock()
+        log = Log(current_segment_id, backend, block_size=block_size)
+        block = block_size * b'a'
+        log.write_data_block(block)
+
+        log.sync()
+
+        self.assertEqual(log.get_current_segment_id(), current_segment_id)
+        backend.put_segment.assert_called_once_with(current_segment_id, ANY)
+        backend.flush.assert_called_once_with()
+
+        partial = ReadOnlySegment(backend.put_segment.call_args[0][1],
+                                  current_segment_id, block_size=block_size)
+        self.assertEqual(bytes(partial.read_block(0)), block)
+
+    def test_sync_when_nothing_written_since_last_sync_does_not_put(self):
+        current_segment_id = 123
+        backend = Mock()
+        log = Log(current_segment_id, backend)
+        log.write_data_block(b'abc')
+        log.sync()
+
+        log.sync()
+
+        backend.put_segment.assert_called_once_with(current_segment_id, ANY)
+        self.assertEqual(backend.flush.call_count, 2)
+
+    def test_sync_then_write_should_put_the_same_segment_again(self):
+        current_segment_id = 123
+        block_size = 128
+        backend = Mock()
+        log = Log(current_segment_id, backend, block_size=block_size)
+        log.write_data_block(block_size * b'a')
+        log.sync()
+        address = log.write_data_block(block_size * b'b')
+
+        log.flush()
+
+        self.assertEqual(address, BlockAddress(current_segment_id, 1))
+        self.assertEqual(backend.put_segment.call_count, 2)
+        backend.put_segment.assert_called_with(current_segment_id, ANY)
+        self.assertEqual(log.get_current_segment_id(), current_segment_id + 1)
+
+    def test_seal_should_put_the_segment_without_waiting(self):
+        current_segment_id = 123
+        backend = Mock()
+        log = Log(current_segment_id, backend)
+        log.write_data_block(b'abc')
+
+        log.seal()
+
+        self.assertEqual(log.get_current_segment_id(), current_segment_id + 1)
+        backend.put_segment.assert_called_once_with(current_segment_id, ANY)
+        backend.flush.assert_not_called()
+
+    def test_unsynced_length_should_count_bytes_not_yet_put(self):
+        block_size = 64
+        backend = Mock()
+        log = Log(123, backend, block_size=block_size)
+
+        log.write_data_block(b'abc')
+        self.assertEqual(log.unsynced_length(), block_size)
+        self.assertIsNotNone(log.unsynced_since())
+
+        log.sync()
+        self.assertEqual(log.unsynced_length(), 0)
+        self.assertIsNone(log.unsynced_since())
+
+    def test_data_and_inodes_should_be_written_to_separate_segments(self):
+        current_segment_id = 123
+        block_size = 64
+        backend = Mock()
+        log = Log(current_segment_id, backend, block_size=block_size)
+
+        data_address = log.write_data_block(block_size * b'd')
+        inode_address = log.write_inode(block_size * b'i', 7)
+        metadata_address = log.write_data_block(block_size * b'm', Log.METADATA_STREAM)
+
+        self.assertEqual(data_address, BlockAddress(current_segment_id, 0))
+        self.assertEqual(inode_address, BlockAddress(current_segment_id + 1, 0))
+        self.assertEqual(metadata_address, BlockAddress(current_segment_id + 1, 1))
+        self.assertEqual(bytes(log.read_block(data_address)), block_size * b'd')
+        self.assertEqual(bytes(log.read_block(inode_address)), block_size * b'i')
+        self.assertEqual(log.get_current_segment_id(), current_segment_id)
+        backend.get_segment.assert_not_called()
+
+    def test_full_data_segment_should_not_seal_the_metadata_segment(self):
+        current_segment_id = 123
+        block_size = 64
+        blocks_per_segment = 4
+        backend = Mock()
+        log = Log(current_segment_id, backend, block_size=block_size,
+                  blocks_per_segment=blocks_per_segment)
+        log.write_inode(b'abc', 7)
+
+        for _ in range(blocks_per_segment):
+            log.write_data_block(b'abc')
+        address = log.write_data_block(b'abc')
+
+        backend.put_segment.assert_called_once_with(current_segment_id + 1, ANY)
+        self.assertEqual(address, BlockAddress(current_segment_id + 2, 0))
+        # the open metadata segment has not been written yet
+        self.assertEqual(log.get_current_segment_id(), current_segment_id)
+
+    def test_putting_a_metadata_segment_should_sync_the_open_data_segment(self):
+        current_segment_id = 123
+        backend = Mock()
+        log = Log(current_segment_id, backend, blocks_per_segment=2)
+        log.write_data_block(b'abc')
+
+        log.write_inode(b'abc', 7)
+        log.write_inode(b'abc', 8)
+
+        backend.put_segment.assert_has_calls([
+            call(current_segment_id, ANY),
+            call(current_segment_id + 1, ANY)])
+        self.assertEqual(log.unsynced_length(), 0)
+
+    def test_seal_after_sync_should_not_put_the_segment_again(self):
+        current_segment_id = 123
+        backend = Mock()
+        log = Log(current_segment_id, backend)
+        log.write_data_block(b'abc')
+        log.sync()
+
+        log.seal()
+
+        backend.put_segment.assert_called_once_with(current_segment_id, ANY)
+        self.assertEqual(log.get_current_segment_id(), current_segment_id + 1)
+
+    def test_write_inodes_should_pack_inodes_into_blocks(self):
+        block_size = 64
+        backend = Mock()
+        log = Log(123, backend, block_size=block_size)
+        inodes = [(i, 20 * bytes([i])) for i in range(4)]
+
+        addresses = log.write_inodes(inodes)
+
+        # Only two 20 byte inodes and their offsets fit in a 64 byte block
+        self.assertEqual(addresses, [
+            INodeAddress(123, 0, 0),
+            INodeAddress(123, 0, 1),
+            INodeAddress(123, 1, 0),
+            INodeAddress(123, 1, 1),
+        ])
+        for (inode_number, inode_bytes), address in zip(inodes, addresses):
+            self.assertEqual(bytes(log.read_inode(address)), inode_bytes)
+
+    def test_read_inode_of_a_whole_block_should_return_the_block(self):
+        block_size = 64
+        backend = Mock()
+        log = Log(123, backend, block_size=block_size)
+
+        address = log.write_inode(b'abc', 7)
+
+        self.assertEqual(bytes(log.read_inode(address)[:3]), b'abc')
+
+    def test_read_inodes_should_fetch_each_segment_once(self):
+        block_size = 64
+        segments = {}
+        addresses = []
+        for segment_id in (5, 6):
+            writer_backend = Mock()
+            writer = Log(segment_id, writer_backend, block_size=block_size)
+            addresses.extend(writer.write_inodes([(i, 20 * bytes([segment_id + i])) for i in range(3)]))
+            writer.flush()
+            segments[segment_id] = writer_backend.put_segment.call_args[0][1]
+        backend = Mock()
+        backend.get_segment.side_effect = segments.get
+        log = Log(999, backend, block_size=block_size)
+        current = log.write_inode(b'abc', 7)
+
+        result = log.read_inodes(addresses + [current])
+
+        self.assertEqual([bytes(inode) for inode in result[:-1]],
+                         [20 * bytes([a.segmentid + i]) for a, i in zip(addresses, [0, 1, 2] * 2)])
+        self.assertEqual(bytes(result[-1][:3]), b'abc')
+        self.assertEqual(sorted(backend.get_segment.call_args_list), [call(5), call(6)])
+        self.assertEqual(log.fetched_segment_count(), 2)
+
+    def test_read_block_when_cached_only_should_not_fetch_uncached_segments(self):
+        block_size = 64
+        segment = ReadWriteSegment(123, block_size=block_size)
+        segment.write_data(block_size * b'x')
+        backend = Mock()
+        backend.get_segment.return_value = segment.to_bytes()
+        backend.is_cached.side_effect = lambda segment_id: segment_id == 123
+        log = Log(999, backend, block_size=block_size)
+        current = log.write_data_block(block_size * b'a')
+
+        with log.cached_only():
+            cached = log.read_block(BlockAddress(123, 0))
+            with self.assertRaises(CacheMiss) as context:
+                log.read_block(BlockAddress(124, 0))
+            with self.assertRaises(CacheMiss):
+                log.read_inodes([BlockAddress(123, 0), BlockAddress(124, 0)])
+            log.read_block(current)
+
+        self.assertEqual(bytes(cached), block_size * b'x')
+        self.assertEqual(context.exception.segment_id, 124)
+        backend.get_segment.assert_called_once_with(123)
+        log.read_block(BlockAddress(124, 0))
+        self.assertEqual(backend.get_segment.call_count, 2)
+
+    def test_read_blocks_should_fetch_each_segment_once(self):
+        block_size = 64
+        segment = ReadWriteSegment(123, block_size=block_size)
+        for i in range(3):
+            segment.write_data(block_size * bytes([i]))
+        backend = Mock()
+        backend.get_segment.return_value = segment.to_bytes()
+        log = Log(999, backend, block_size=block_size)
+        current = log.write_data_block(block_size * b'a')
+
+        result = log.read_blocks([BlockAddress(123, 2), current, BlockAddress(123, 0)])
+
+        self.assertEqual([bytes(block) for block in result],
+                         [block_size * b'\x02', block_size * b'a', block_size * b'\x00'])
+        backend.get_segment.assert_called_once_with(123)
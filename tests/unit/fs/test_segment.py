@@ -1,4 +1,5 @@
 from unittest import TestCase
+from pickle import dumps
 from s3logfs.fs import ReadOnlySegment, ReadWriteSegment
 
 
@@ -158,3 +159,39 @@ class TestReadWriteSegment(TestCase):
         segment.write_inode(b'abcd', inum1)
 
         self.assertEqual(segment.inode_block_numbers(), [(inum0, 0), (inum1, 1)])
+
+    def test_write_inodes_should_add_an_entry_per_slot_to_the_summary(self):
+        block_size = 64
+        segment = ReadWriteSegment(123, block_size=block_size)
+        segment.write_data(b'x')
+
+        block_number = segment.write_inodes(b'abc', [7, 8])
+        deserialized = ReadOnlySegment(segment.to_bytes(), 123, block_size=block_size)
+
+        self.assertEqual(block_number, 1)
+        self.assertEqual(deserialized.inode_block_numbers(), [(7, 1, 0), (8, 1, 1)])
+        self.assertEqual(bytes(deserialized.read_block(1)[:3]), b'abc')
+
+    def test_summary_larger_than_a_block_should_round_trip(self):
+        block_size = 64
+        segment = ReadWriteSegment(123, block_size=block_size)
+        segment.write_inodes(b'abc', list(range(100)))
+        segment.write_data(b'def')
+
+        serialized = segment.to_bytes()
+        deserialized = ReadOnlySegment(serialized, 123, block_size=block_size)
+
+        self.assertEqual(len(serialized) % block_size, 0)
+        self.assertEqual(len(deserialized.inode_block_numbers()), 100)
+        self.assertEqual(bytes(deserialized.read_block(1)[:3]), b'def')
+
+    def test_summary_of_block_inodes_should_still_be_readable(self):
+        block_size = 64
+        summary_bytes = dumps([(7, 0)])
+        serialized = summary_bytes + (block_size - len(summary_bytes)) * b'\0' + \
+            block_size * b'a'
+
+        segment = ReadOnlySegment(serialized, 123, block_size=block_size)
+
+        self.assertEqual(segment.inode_block_numbers(), [(7, 0)])
+        self.assertEqual(bytes(segment.read_block(0)), block_size * b'a')
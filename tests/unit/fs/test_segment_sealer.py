@@ -0,0 +1,87 @@
+from unittest import TestCase
+from unittest.mock import Mock, ANY
+from time import sleep
+from s3logfs.fs import SegmentSealer, Log
+
+
+class TestSegmentSealer(TestCase):
+    def test_check_when_idle_should_seal_the_segment(self):
+        backend = Mock()
+        log = Log(123, backend)
+        log.write_data_block(b'abc')
+
+        with SegmentSealer(log, idle_timeout=5, interval=60) as sealer:
+            sealer.check(now=log.last_write_time() + 5)
+
+        backend.put_segment.assert_called_once_with(123, ANY)
+        self.assertEqual(log.get_current_segment_id(), 124)
+        self.assertEqual(sealer.seal_count(), 1)
+
+    def test_check_when_not_idle_should_not_seal(self):
+        backend = Mock()
+        log = Log(123, backend)
+        log.write_data_block(b'abc')
+
+        with SegmentSealer(log, idle_timeout=5, interval=60) as sealer:
+            sealer.check(now=log.last_write_time() + 1)
+
+        backend.put_segment.assert_not_called()
+
+    def test_check_when_data_is_too_old_should_sync_without_sealing(self):
+        backend = Mock()
+        log = Log(123, backend)
+        log.write_data_block(b'abc')
+
+        with SegmentSealer(log, idle_timeout=60, max_age=10, interval=60) as sealer:
+            sealer.check(now=log.unsynced_since() + 10)
+
+        backend.put_segment.assert_called_once_with(123, ANY)
+        self.assertEqual(log.get_current_segment_id(), 123)
+        self.assertEqual(log.unsynced_length(), 0)
+        self.assertEqual(sealer.sync_count(), 1)
+
+    def test_check_when_too_much_unsynced_data_should_sync(self):
+        block_size = 64
+        backend = Mock()
+        log = Log(123, backend, block_size=block_size)
+
+        with SegmentSealer(log, max_unsynced_bytes=2 * block_size, interval=60) as sealer:
+            log.write_data_block(b'abc')
+            sealer.check()
+            backend.put_segment.assert_not_called()
+
+            log.write_data_block(b'abc')
+            sealer.check()
+
+        backend.put_segment.assert_called_once_with(123, ANY)
+
+    def test_check_without_unsynced_data_should_do_nothing(self):
+        backend = Mock()
+        log = Log(123, backend)
+
+        with SegmentSealer(log, idle_timeout=1, max_age=1, interval=60) as sealer:
+            sealer.check(now=10**10)
+
+        backend.put_segment.assert_not_called()
+        backend.flush.assert_not_called()
+
+    def test_check_should_call_checkpoint(self):
+        checkpoint = Mock()
+
+        with SegmentSealer(Mock(), checkpoint=checkpoint, interval=60) as sealer:
+            sealer.check()
+
+        checkpoint.assert_called_once_with()
+
+    def test_background_thread_should_seal_idle_segment(self):
+        backend = Mock()
+        log = Log(123, backend)
+        log.write_data_block(b'abc')
+
+        with SegmentSealer(log, idle_timeout=0.01, interval=0.01):
+            for _ in range(100):
+                if backend.put_segment.called:
+                    break
+                sleep(0.01)
+
+        backend.put_segment.assert_called_once_with(123, ANY)
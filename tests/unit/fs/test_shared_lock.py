@@ -0,0 +1,104 @@
+from unittest import TestCase
+from threading import Event, Thread
+from time import sleep
+from s3logfs.fs import SharedLock
+
+
+def run_in_thread(target):
+    thread = Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+class TestSharedLock(TestCase):
+    def test_shared_holders_should_not_block_each_other(self):
+        lock = SharedLock()
+        acquired = Event()
+
+        with lock.shared():
+            def other():
+                with lock.shared():
+                    acquired.set()
+
+            run_in_thread(other)
+            self.assertTrue(acquired.wait(1))
+
+    def test_exclusive_holder_should_block_shared_holders(self):
+        lock = SharedLock()
+        acquired = Event()
+
+        def other():
+            with lock.shared():
+                acquired.set()
+
+        with lock:
+            run_in_thread(other)
+            self.assertFalse(acquired.wait(0.05))
+
+        self.assertTrue(acquired.wait(1))
+
+    def test_acquire_should_wait_for_shared_holders(self):
+        lock = SharedLock()
+        acquired = Event()
+
+        def other():
+            with lock:
+                acquired.set()
+
+        with lock.shared():
+            run_in_thread(other)
+            self.assertFalse(acquired.wait(0.05))
+
+        self.assertTrue(acquired.wait(1))
+
+    def test_acquire_without_blocking_should_fail_when_shared(self):
+        lock = SharedLock()
+        result = []
+
+        with lock.shared():
+            thread = run_in_thread(lambda: result.append(lock.acquire(blocking=False)))
+            thread.join(1)
+
+        self.assertEqual(result, [False])
+
+    def test_waiting_exclusive_holder_should_block_new_shared_holders(self):
+        lock = SharedLock()
+        exclusive = Event()
+        shared = Event()
+
+        def writer():
+            with lock:
+                exclusive.set()
+
+        def reader():
+            with lock.shared():
+                shared.set()
+
+        with lock.shared():
+            run_in_thread(writer)
+            while lock._waiting_count == 0:
+                sleep(0.001)
+            run_in_thread(reader)
+            self.assertFalse(shared.wait(0.05))
+
+        self.assertTrue(exclusive.wait(1))
+        self.assertTrue(shared.wait(1))
+
+    def test_holds_should_be_reentrant(self):
+        lock = SharedLock()
+
+        with lock:
+            with lock:
+                with lock.shared():
+                    pass
+            self.assertTrue(lock.acquire(blocking=False))
+            lock.release()
+
+        with lock.shared():
+            with lock.shared():
+                pass
+            with self.assertRaises(RuntimeError):
+                lock.acquire()
+
+        self.assertTrue(lock.acquire(blocking=False))
+        lock.release()
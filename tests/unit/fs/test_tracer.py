@@ -0,0 +1,48 @@
+from unittest import TestCase
+from s3logfs.fs import Tracer
+
+
+class TestTracer(TestCase):
+    def test_sampled_should_be_false_when_off(self):
+        tracer = Tracer(16)
+
+        self.assertFalse(tracer.sampled())
+
+    def test_sampled_should_pick_one_in_every_sample_operations(self):
+        tracer = Tracer(16, Tracer.ON, sample=3)
+
+        result = [tracer.sampled() for _ in range(7)]
+
+        self.assertEqual(result, [True, False, False, True, False, False, True])
+
+    def test_records_should_keep_the_most_recent_records_in_order(self):
+        tracer = Tracer(3, Tracer.ON)
+
+        for i in range(5):
+            tracer.record(i, 'read', 7, 4096, 0.001, Tracer.HIT)
+
+        self.assertEqual([record[0] for record in tracer.records()], [2, 3, 4])
+        self.assertEqual(tracer.status()['records'], 3)
+
+    def test_clear_should_remove_the_records(self):
+        tracer = Tracer(3, Tracer.ON)
+        tracer.record(0, 'read', 7, 4096, 0.001, Tracer.HIT)
+
+        tracer.clear()
+
+        self.assertEqual(tracer.records(), [])
+
+    def test_summarize_should_group_records_by_operation(self):
+        records = [(i, 'read', 7, 4096, (i + 1) / 1000, Tracer.READ if i < 2 else Tracer.HIT)
+                   for i in range(10)]
+        records.append((10, 'lookup', 1, 0, 0.5, Tracer.MISS))
+
+        summary = Tracer.summarize(records)
+
+        self.assertEqual(summary['read']['count'], 10)
+        self.assertEqual(summary['read']['p50'], 6)
+        self.assertEqual(summary['read']['p99'], 10)
+        self.assertEqual(summary['read']['max'], 10)
+        self.assertEqual(summary['read']['mean_size'], 4096)
+        self.assertEqual(summary['read']['outcomes'], {Tracer.READ: 2, Tracer.HIT: 8})
+        self.assertEqual(summary['lookup']['outcomes'], {Tracer.MISS: 1})
@@ -0,0 +1,107 @@
+from unittest import TestCase
+from unittest.mock import patch
+from s3logfs.fs import WriteBuffer
+
+
+class TestWriteBuffer(TestCase):
+    def test_read_should_return_the_written_block(self):
+        buffer = WriteBuffer(1024)
+        buffer.write(7, 3, b'abc')
+
+        self.assertEqual(buffer.read(7, 3), b'abc')
+        self.assertIsNone(buffer.read(7, 4))
+        self.assertIsNone(buffer.read(8, 3))
+
+    def test_rewriting_a_block_should_be_absorbed(self):
+        buffer = WriteBuffer(1024)
+
+        for i in range(10):
+            buffer.write(7, 0, bytes([i]) * 64)
+
+        self.assertEqual(buffer.read(7, 0), bytes([9]) * 64)
+        self.assertEqual(buffer.dirty_bytes(), 64)
+        stats = buffer.stats()
+        self.assertEqual(stats['writes'], 10)
+        self.assertEqual(stats['absorbed_writes'], 9)
+
+    def test_shorter_rewrite_should_replace_the_start_of_the_block(self):
+        buffer = WriteBuffer(1024)
+        buffer.write(7, 0, b'abcdef')
+
+        buffer.write(7, 0, b'xy')
+
+        self.assertEqual(buffer.read(7, 0), b'xycdef')
+        self.assertEqual(buffer.dirty_bytes(), 6)
+
+    def test_write_at_an_offset_should_only_replace_those_bytes(self):
+        buffer = WriteBuffer(1024)
+        buffer.write(7, 0, b'abcdef')
+
+        buffer.write(7, 0, b'xy', 2)
+        buffer.write(7, 1, b'z', 3)
+
+        self.assertEqual(buffer.read(7, 0), b'abxyef')
+        self.assertEqual(buffer.read(7, 1), b'\x00\x00\x00z')
+        self.assertEqual(buffer.dirty_bytes(), 10)
+
+    def test_pop_blocks_should_return_blocks_in_order_and_remove_them(self):
+        buffer = WriteBuffer(1024)
+        buffer.write(7, 2, b'c')
+        buffer.write(7, 0, b'a')
+        buffer.write(8, 0, b'z')
+
+        blocks = buffer.pop_blocks(7)
+
+        self.assertEqual(blocks, [(0, b'a'), (2, b'c')])
+        self.assertFalse(buffer.has_blocks(7))
+        self.assertEqual(buffer.inode_numbers(), [8])
+        self.assertEqual(buffer.dirty_bytes(), 1)
+        self.assertEqual(buffer.stats()['flushed_blocks'], 2)
+
+    def test_pop_blocks_of_clean_inode_should_return_nothing(self):
+        self.assertEqual(WriteBuffer(1024).pop_blocks(7), [])
+
+    def test_discard_should_drop_blocks_from_the_given_index(self):
+        buffer = WriteBuffer(1024)
+        for i in range(4):
+            buffer.write(7, i, b'ab')
+
+        buffer.discard(7, 2)
+
+        self.assertEqual(buffer.read(7, 1), b'ab')
+        self.assertIsNone(buffer.read(7, 2))
+        self.assertEqual(buffer.dirty_bytes(), 4)
+
+        buffer.discard(7)
+        self.assertFalse(buffer.has_blocks(7))
+        self.assertEqual(buffer.dirty_bytes(), 0)
+
+    def test_is_full_when_over_max_dirty_bytes(self):
+        buffer = WriteBuffer(128)
+        buffer.write(7, 0, 64 * b'a')
+        buffer.write(7, 1, 64 * b'a')
+        self.assertFalse(buffer.is_full())
+
+        buffer.write(8, 0, b'a')
+        self.assertTrue(buffer.is_full())
+
+    def test_oldest_inode_number_should_be_first_dirtied(self):
+        buffer = WriteBuffer(1024)
+        buffer.write(8, 0, b'a')
+        buffer.write(7, 0, b'a')
+        buffer.write(8, 1, b'a')
+
+        self.assertEqual(buffer.oldest_inode_number(), 8)
+
+    def test_inode_numbers_dirty_before_should_return_those_dirtied_earlier(self):
+        buffer = WriteBuffer(1024)
+        with patch('s3logfs.fs.write_buffer.time', side_effect=[10, 20, 30]):
+            buffer.write(8, 0, b'a')
+            buffer.write(7, 0, b'a')
+            buffer.write(8, 1, b'a')     # 8 is already dirty
+            buffer.write(9, 0, b'a')
+
+        self.assertEqual(buffer.inode_numbers_dirty_before(25), [8, 7])
+
+        buffer.pop_blocks(8)
+        self.assertEqual(buffer.inode_numbers_dirty_before(25), [7])
@@ -0,0 +1,507 @@
+import errno
+from stat import S_IFDIR, S_IFREG
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from time import time
+from unittest import TestCase
+from unittest.mock import patch
+from fusell import FUSELL, FUSE_CAP_ASYNC_READ, FUSE_CAP_BIG_WRITES, FUSE_CAP_READDIRPLUS, \
+    FUSE_CAP_WRITEBACK_CACHE
+from s3logfs.backends import LocalDirectory
+from s3logfs.fs import CheckpointRegion, ExtentMap
+from s3logfs.fuse_api import FuseApi
+from s3logfs.mkfs import create_root_directory
+
+
+class RecordingFuseApi(FuseApi):
+    '''
+    A FuseApi which is not mounted, and records the replies to the operations
+    it is called with rather than sending them to the kernel.
+    '''
+
+    # the size of the header of each entry of readdir and readdirplus replies
+    DIRENT_SIZE = 24
+    DIRENTPLUS_SIZE = 152
+
+    def __init__(self, bucket, **kwargs):
+        self.replies = []
+        self.notified = []
+        with patch.object(FUSELL, '__init__', return_value=None):
+            super().__init__('/mnt', bucket, 3600, **kwargs)
+
+    def req_ctx(self, req):
+        return dict(uid=0, gid=0, pid=0)
+
+    def reply_err(self, req, err):
+        self.replies.append(('err', err))
+
+    def reply_none(self, req):
+        self.replies.append(('none',))
+
+    def reply_entry(self, req, entry):
+        self.replies.append(('entry', entry))
+
+    def reply_create(self, req, *args):
+        self.replies.append(('create',) + args)
+
+    def reply_attr(self, req, attr, attr_timeout):
+        self.replies.append(('attr', attr, attr_timeout))
+
+    def reply_readlink(self, req, link):
+        self.replies.append(('readlink', link))
+
+    def reply_open(self, req, d):
+        self.replies.append(('open', d))
+
+    def reply_write(self, req, count):
+        self.replies.append(('write', count))
+
+    def reply_buf(self, req, buf):
+        self.replies.append(('buf', buf))
+
+    def reply_xattr(self, req, count):
+        self.replies.append(('xattr', count))
+
+    def reply_readdir_entries(self, req, size, entries):
+        self.replies.append(('readdir', self._fitting(entries, size, self.DIRENT_SIZE)))
+
+    def reply_readdirplus_entries(self, req, size, entries):
+        self.replies.append(('readdirplus', self._fitting(entries, size, self.DIRENTPLUS_SIZE)))
+
+    def notify_inval_inode(self, ino, off=0, length=0):
+        self.notified.append(('inode', ino))
+        return 0
+
+    def notify_inval_entry(self, parent, name):
+        self.notified.append(('entry', parent, name))
+        return 0
+
+    def last_reply(self):
+        return self.replies[-1]
+
+    # returns the entries which fit in size bytes, each taking a header and
+    # its name padded to 8 bytes as in the kernel's buffer
+    @staticmethod
+    def _fitting(entries, size, header_size):
+        fitting = []
+        used = 0
+
+        for entry in entries:
+            used += (header_size + len(entry[0].encode('utf-8')) + 7) & ~7
+            if used > size:
+                break
+            fitting.append(entry)
+
+        return fitting
+
+
+class TestFuseApi(TestCase):
+    '''
+    Runs operations against a filesystem in a local directory, and checks
+    their results after it is mounted again.
+    '''
+
+    LAYOUT = CheckpointRegion.BLOCK_LAYOUT
+    BLOCK_SIZE = 4096
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.bucket = LocalDirectory('bucket', parent_directory=directory.name)
+        self.bucket.create()
+
+        checkpoint = CheckpointRegion(
+            bucket='bucket', block_size=self.BLOCK_SIZE, blocks_per_segment=64,
+            checkpoint_time=time(), layout=self.LAYOUT)
+        create_root_directory(checkpoint, self.bucket)
+        self.bucket.put_checkpoint(checkpoint.to_bytes())
+        self.root = checkpoint.root_inode_id
+
+    def mount(self, **kwargs):
+        api = RecordingFuseApi(self.bucket, **kwargs)
+        self.addCleanup(self.unmount, api)
+        return api
+
+    def unmount(self, api):
+        if not api.replies or api.last_reply() != ('destroyed',):
+            api.destroy(None)
+            api.replies.append(('destroyed',))
+
+    def remount(self, api, **kwargs):
+        self.unmount(api)
+        return self.mount(**kwargs)
+
+    def create_file(self, api, name, parent=None):
+        api.mknod(1, parent or self.root, name, S_IFREG | 0o644, 0)
+        return api.last_reply()[1]['ino']
+
+    def read(self, api, ino, size, off):
+        api.read(1, ino, size, off, {})
+        return api.last_reply()[1]
+
+    def readdir(self, api, ino, size, off):
+        api.readdir(1, ino, size, off, {})
+        return api.last_reply()[1]
+
+    # a block of data which differs for each n, and is never all zeros
+    def block(self, n):
+        return (n + 1).to_bytes(4, 'little') * (self.BLOCK_SIZE // 4)
+
+
+class RoundTripTests:
+    '''
+    Tests run with each file block layout.
+    '''
+
+    def test_small_files_and_symlinks_should_be_stored_in_the_inode(self):
+        api = self.mount()
+        ino = self.create_file(api, 'small')
+        api.write(1, ino, b'hello', 0, {})
+        api.symlink(1, '/target', self.root, 'link')
+        link = api.last_reply()[1]['ino']
+        self.assertEqual(api.load_inode(ino).inline_data, b'hello')
+
+        api = self.remount(api)
+
+        self.assertEqual(self.read(api, ino, 100, 0), b'hello')
+        api.readlink(1, link)
+        self.assertEqual(api.last_reply(), ('readlink', '/target'))
+
+    def test_a_file_outgrowing_the_inode_should_keep_its_inline_data(self):
+        api = self.mount()
+        ino = self.create_file(api, 'growing')
+        api.write(1, ino, b'start', 0, {})
+        api.write(1, ino, self.block(1), self.BLOCK_SIZE, {})
+        self.assertIsNone(api.load_inode(ino).inline_data)
+
+        api = self.remount(api)
+
+        self.assertEqual(self.read(api, ino, 2 * self.BLOCK_SIZE, 0),
+                         b'start' + bytes(self.BLOCK_SIZE - 5) + self.block(1))
+
+    def test_unwritten_and_zero_blocks_should_be_holes(self):
+        api = self.mount()
+        ino = self.create_file(api, 'sparse')
+        api.write(1, ino, self.block(0), 0, {})
+        api.write(1, ino, bytes(self.BLOCK_SIZE), 2 * self.BLOCK_SIZE, {})
+        api.write(1, ino, self.block(4), 4 * self.BLOCK_SIZE, {})
+        api.release(1, ino, {})
+        self.assertEqual(api.stats()['holes']['written_blocks'], 1)
+
+        api = self.remount(api)
+
+        self.assertEqual(self.read(api, ino, 5 * self.BLOCK_SIZE, 0),
+                         self.block(0) + bytes(3 * self.BLOCK_SIZE) + self.block(4))
+        self.assertEqual(api.stats()['holes']['read_blocks'], 3)
+
+    def test_unaligned_writes_should_keep_the_rest_of_their_blocks(self):
+        api = self.mount()
+        ino = self.create_file(api, 'file')
+        data = bytearray(b''.join(self.block(i) for i in range(3)))
+        api.write(1, ino, bytes(data), 0, {})
+        api.release(1, ino, {})
+        api = self.remount(api)
+
+        # across a block boundary, and from the last byte past the end
+        api.write(1, ino, b'x' * 10, self.BLOCK_SIZE - 5, {})
+        api.write(1, ino, b'end', len(data) - 1, {})
+        api.release(1, ino, {})
+        data[self.BLOCK_SIZE - 5:self.BLOCK_SIZE + 5] = b'x' * 10
+        data[-1:] = b'end'
+
+        api = self.remount(api)
+
+        self.assertEqual(self.read(api, ino, 4 * self.BLOCK_SIZE, 0), bytes(data))
+
+    def test_listing_a_directory_should_continue_after_unlinking_listed_entries(self):
+        api = self.mount()
+        api.mkdir(1, self.root, 'directory', 0o755)
+        directory = api.last_reply()[1]['ino']
+        names = ['file%03d' % i for i in range(200)]
+        for name in names:
+            self.create_file(api, name, directory)
+        api = self.remount(api)
+
+        listed = []
+        entries = self.readdir(api, directory, 512, 0)
+        while entries:
+            for name, attr, off in entries:
+                if name not in ('.', '..'):
+                    listed.append(name)
+                    api.unlink(1, directory, name)
+            entries = self.readdir(api, directory, 512, off)
+
+        self.assertEqual(sorted(listed), names)
+        self.assertEqual([name for name, attr, off in self.readdir(api, directory, 512, 0)],
+                         ['.', '..'])
+
+
+class TestFuseApiOffload(TestFuseApi):
+    def test_reads_which_miss_the_caches_should_be_offloaded_in_order(self):
+        api = self.mount()
+        ino = self.create_file(api, 'file')
+        api.write(1, ino, self.block(0) + self.block(1), 0, {})
+        api.release(1, ino, {})
+        api = self.remount(api, offload_threads=1)
+        read = api.wrap_operation('read', api.read)
+        getattr = api.wrap_operation('getattr', api.getattr)
+
+        # LocalDirectory caches no segments, so the read needs the bucket and
+        # is offloaded, and the getattr of its inode is queued behind it
+        read(1, ino, self.BLOCK_SIZE, 0, {})
+        getattr(1, ino, {})
+        api._offload_executor.shutdown()
+
+        self.assertEqual(api.replies[0], ('buf', self.block(0)))
+        self.assertEqual(api.replies[1][0], 'attr')
+        self.assertEqual(api.stats()['offload']['cache_misses'], 1)
+
+
+class TestFuseApiCacheTimeouts(TestFuseApi):
+    def mount(self, **kwargs):
+        return super().mount(attr_timeout=5.0, entry_timeout=7.0,
+                             type_timeouts={S_IFDIR: (60.0, 60.0)}, **kwargs)
+
+    def test_replies_should_carry_the_timeouts_of_the_file_type(self):
+        api = self.mount()
+        ino = self.create_file(api, 'file')
+        api.mkdir(1, self.root, 'directory', 0o755)
+        entry = api.last_reply()[1]
+        self.assertEqual((entry['attr_timeout'], entry['entry_timeout']), (60.0, 60.0))
+
+        api.lookup(1, self.root, 'file')
+        entry = api.last_reply()[1]
+        self.assertEqual(entry['ino'], ino)
+        self.assertEqual((entry['attr_timeout'], entry['entry_timeout']), (5.0, 7.0))
+
+        api.getattr(1, ino, {})
+        self.assertEqual(api.last_reply()[2], 5.0)
+        api.getattr(1, self.root, {})
+        self.assertEqual(api.last_reply()[2], 60.0)
+
+    def test_missing_names_should_be_cached_for_the_negative_timeout(self):
+        api = self.mount(negative_timeout=3.0)
+
+        api.lookup(1, self.root, 'missing')
+
+        entry = api.last_reply()[1]
+        self.assertEqual((entry['ino'], entry['entry_timeout']), (0, 3.0))
+
+    def test_missing_names_should_not_be_cached_without_a_negative_timeout(self):
+        api = self.mount()
+
+        api.lookup(1, self.root, 'missing')
+
+        self.assertEqual(api.last_reply(), ('err', errno.ENOENT))
+
+    def test_open_should_keep_the_page_cache_only_of_unchanged_files(self):
+        api = self.mount()
+        ino = self.create_file(api, 'file')
+
+        api.open(1, ino, {})
+        self.assertEqual(api.last_reply()[1]['keep_cache'], 0)
+        api.open(1, ino, {})
+        self.assertEqual(api.last_reply()[1]['keep_cache'], 1)
+
+        api.write(1, ino, b'changed', 0, {})
+        api.open(1, ino, {})
+        self.assertEqual(api.last_reply()[1]['keep_cache'], 0)
+
+    def test_invalidation_should_notify_the_kernel_and_drop_the_page_cache(self):
+        api = self.mount()
+        ino = self.create_file(api, 'file')
+        api.open(1, ino, {})
+
+        api.invalidate_inode(ino)
+        api.invalidate_entry(self.root, 'file')
+        api._notifier.submit(lambda: None).result()
+
+        self.assertEqual(api.notified, [('inode', ino), ('entry', self.root, 'file')])
+        api.open(1, ino, {})
+        self.assertEqual(api.last_reply()[1]['keep_cache'], 0)
+
+
+class TestFuseApiAtime(TestFuseApi):
+    def open_later(self, api, ino, seconds):
+        with patch('s3logfs.fuse_api.time', return_value=time() + seconds):
+            api.open(1, ino, {})
+
+    def accessed_at(self, api, ino):
+        api.getattr(1, ino, {})
+        return api.last_reply()[1]['st_atime']
+
+    def test_strictatime_should_write_every_access_time(self):
+        api = self.mount(atime='strictatime')
+        ino = self.create_file(api, 'file')
+
+        self.open_later(api, ino, 10)
+        self.open_later(api, ino, 20)
+        self.assertEqual(api.stats()['atime']['written'], 2)
+        accessed_at = self.accessed_at(api, ino)
+
+        api = self.remount(api)
+
+        self.assertEqual(self.accessed_at(api, ino), accessed_at)
+
+    def test_relatime_should_only_update_an_access_time_older_than_a_change(self):
+        api = self.mount(atime='relatime')
+        ino = self.create_file(api, 'file')
+
+        self.open_later(api, ino, 10)
+        accessed_at = self.accessed_at(api, ino)
+        self.open_later(api, ino, 20)
+
+        self.assertEqual(self.accessed_at(api, ino), accessed_at)
+        self.assertEqual(api.stats()['atime']['written'], 1)
+
+        self.open_later(api, ino, FuseApi.RELATIME_INTERVAL + 20)
+        self.assertGreater(self.accessed_at(api, ino), accessed_at)
+
+    def test_noatime_should_not_change_access_times(self):
+        api = self.mount(atime='noatime')
+        ino = self.create_file(api, 'file')
+        accessed_at = self.accessed_at(api, ino)
+
+        self.open_later(api, ino, 10)
+
+        self.assertEqual(self.accessed_at(api, ino), accessed_at)
+        self.assertEqual(api.stats()['atime']['written'], 0)
+
+    def test_lazytime_should_keep_access_times_in_memory_until_unmounted(self):
+        # an inode cache too small to hold any inode
+        api = self.mount(atime='lazytime', inode_cache_size=1)
+        ino = self.create_file(api, 'file')
+        api.fsync(1, ino, 0, {})
+
+        self.open_later(api, ino, 10)
+        accessed_at = self.accessed_at(api, ino)
+        self.assertEqual(api.stats()['atime']['unwritten_inodes'], 1)
+
+        api = self.remount(api)
+
+        self.assertEqual(self.accessed_at(api, ino), accessed_at)
+
+    def test_lazytime_access_times_should_be_written_by_fsync_and_forget(self):
+        api = self.mount(atime='lazytime')
+        first = self.create_file(api, 'first')
+        second = self.create_file(api, 'second')
+        api.fsync(1, first, 0, {})
+        self.open_later(api, first, 10)
+        self.open_later(api, second, 10)
+        self.assertEqual(api.stats()['atime']['unwritten_inodes'], 2)
+
+        api.fsync(1, first, 0, {})
+        self.assertEqual(api.stats()['atime']['unwritten_inodes'], 1)
+        api.forget(1, second, 1)
+        self.assertEqual(api.stats()['atime']['unwritten_inodes'], 0)
+
+    def test_an_unknown_atime_policy_should_raise_value_error(self):
+        with self.assertRaises(ValueError):
+            RecordingFuseApi(self.bucket, atime='atime')
+
+
+class TestFuseApiInit(TestFuseApi):
+    def connection(self, capable):
+        return SimpleNamespace(capable=capable, want=0, async_read=0,
+                               max_write=0, max_readahead=131072)
+
+    def test_init_should_want_readdirplus_when_libfuse_offers_it(self):
+        api = self.mount()
+        conn = self.connection(FUSE_CAP_ASYNC_READ | FUSE_CAP_READDIRPLUS)
+
+        api.init(None, conn)
+
+        self.assertEqual(conn.want, FUSE_CAP_ASYNC_READ | FUSE_CAP_READDIRPLUS)
+        self.assertTrue(api.stats()['connection']['readdirplus'])
+
+    def test_init_should_warn_that_libfuse_2_does_not_offer_readdirplus(self):
+        api = self.mount()
+        conn = self.connection(FUSE_CAP_ASYNC_READ | FUSE_CAP_BIG_WRITES)
+
+        with self.assertLogs(level='WARNING') as logs:
+            api.init(None, conn)
+
+        self.assertIn('readdirplus', logs.output[0])
+        self.assertFalse(api.stats()['connection']['readdirplus'])
+
+    def test_init_should_want_the_writeback_cache_when_enabled_and_offered(self):
+        api = self.mount(writeback_cache=True)
+        conn = self.connection(FUSE_CAP_READDIRPLUS | FUSE_CAP_WRITEBACK_CACHE)
+
+        with self.assertLogs(level='WARNING'):
+            api.init(None, conn)
+
+        self.assertTrue(conn.want & FUSE_CAP_WRITEBACK_CACHE)
+        self.assertTrue(api.stats()['connection']['writeback_cache'])
+
+    def test_init_should_warn_when_the_writeback_cache_is_not_offered(self):
+        api = self.mount(writeback_cache=True)
+        conn = self.connection(FUSE_CAP_ASYNC_READ | FUSE_CAP_BIG_WRITES | FUSE_CAP_READDIRPLUS)
+
+        with self.assertLogs(level='WARNING') as logs:
+            api.init(None, conn)
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('writeback_cache', logs.output[0])
+        self.assertFalse(conn.want & FUSE_CAP_WRITEBACK_CACHE)
+        self.assertFalse(api.stats()['connection']['writeback_cache'])
+
+
+class TestFuseApiBlockLayout(RoundTripTests, TestFuseApi):
+    def test_the_sealer_should_sync_buffered_data_older_than_max_dirty_age(self):
+        api = self.mount(max_dirty_age=30)
+        ino = self.create_file(api, 'file')
+        data = b''.join(self.block(i) for i in range(3))
+        api.write(1, ino, data, 0, {})
+
+        api._checkpoint_in_background()
+        self.assertEqual(api.stats()['write_buffer']['dirty_bytes'], len(data))
+
+        with patch('s3logfs.fuse_api.time', return_value=time() + 31):
+            api._checkpoint_in_background()
+
+        # mounted alongside, so it only sees what has been synced
+        other = self.mount()
+        other.lookup(1, self.root, 'file')
+        self.assertEqual(other.last_reply()[1]['ino'], ino)
+        self.assertEqual(self.read(other, ino, len(data), 0), data)
+
+
+class TestFuseApiExtentLayout(RoundTripTests, TestFuseApi):
+    LAYOUT = CheckpointRegion.EXTENT_LAYOUT
+    BLOCK_SIZE = 1024
+
+    def test_a_map_with_more_leaves_than_fit_in_the_inode_should_be_kept(self):
+        api = self.mount()
+        ino = self.create_file(api, 'scattered')
+        # every other block, so that each is an extent of its own
+        extent_count = ExtentMap.leaf_capacity(self.BLOCK_SIZE) * \
+            (ExtentMap.max_leaves(self.BLOCK_SIZE) + 1)
+        for i in range(extent_count):
+            api.write(1, ino, self.block(i), i * 2 * self.BLOCK_SIZE, {})
+        api.release(1, ino, {})
+        self.assertEqual(api.last_reply(), ('err', 0))
+
+        api = self.remount(api)
+
+        for i in (0, extent_count // 2, extent_count - 1):
+            self.assertEqual(self.read(api, ino, self.BLOCK_SIZE, i * 2 * self.BLOCK_SIZE),
+                             self.block(i))
+        self.assertEqual(self.read(api, ino, self.BLOCK_SIZE, self.BLOCK_SIZE),
+                         bytes(self.BLOCK_SIZE))
+
+    def test_an_inode_whose_map_fails_to_flush_should_stay_dirty(self):
+        api = self.mount()
+        ino = self.create_file(api, 'file')
+        for i in range(ExtentMap.INLINE_EXTENTS + 1):
+            api.write(1, ino, self.block(i), i * 2 * self.BLOCK_SIZE, {})
+        api.flush_file(ino)
+
+        with patch.object(ExtentMap, 'flush', side_effect=OSError):
+            with self.assertRaises(OSError):
+                api._flush_inodes()
+        self.assertIn(ino, api._dirty_inodes)
+
+        api = self.remount(api)
+
+        self.assertEqual(self.read(api, ino, self.BLOCK_SIZE, 0), self.block(0))